@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Book, Review, Cart, UserProfile, UserCredit, Order
+from .models import Book, Review, Cart, UserProfile, UserCredit, Order, Pincode, Job, FacetCount
 
 # Register your models here.
 admin.site.register(Book)
@@ -7,4 +7,17 @@ admin.site.register(Review)
 admin.site.register(Cart)
 admin.site.register(UserProfile)
 admin.site.register(UserCredit)
-admin.site.register(Order)
\ No newline at end of file
+admin.site.register(Order)
+admin.site.register(Pincode)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_at', 'created_at')
+    list_filter = ('status', 'name')
+
+
+@admin.register(FacetCount)
+class FacetCountAdmin(admin.ModelAdmin):
+    list_display = ('genre', 'status', 'transaction_type', 'price_band', 'count')
+    list_filter = ('status', 'transaction_type', 'price_band')
@@ -0,0 +1,316 @@
+"""
+JSON API, version 1 (mounted at /api/v1/).
+
+Read-only endpoints for the mobile client:
+
+    books/                        ?genre= ?status= ?transaction_type= ?sort=newest|rating
+    books/<id>/
+    profiles/<username>/          login required
+    cart/                         login required
+    orders/                       ?role=buyer|seller, login required
+    chat/rooms/                   login required
+    chat/rooms/<id>/messages/     newest first, login required
+
+Every endpoint takes ?fields=a,b to return only those fields. Lists are
+paged with ?cursor= (keyset pagination, bookbeeapp/pagination.py) and
+?limit=.
+
+Responses carry an ETag built from the versions of the rows they show
+(Book.updated_at, message read flags, ...), plus Last-Modified for a
+single book. A client that sends them back in If-None-Match or
+If-Modified-Since gets an empty 304 when nothing changed, and the
+server skips serializing the response.
+"""
+import hashlib
+from functools import wraps
+
+from django.contrib.auth.models import User
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from bookbeeproject.db_router import replica_reads
+from chat.models import ChatRoom
+from chat.views import HISTORY_PAGE_SIZE, MESSAGE_ORDERING
+from . import facets
+from .models import Book, Cart, Order, UserProfile
+from .pagination import InvalidCursor, keyset_paginate
+from .views import FEED_ORDERINGS
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def api_view(login_required=False):
+    """GET-only JSON endpoint: errors come back as {"error": ...} instead of HTML pages."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return JsonResponse({'error': 'Method not allowed'}, status=405, headers={'Allow': 'GET, HEAD'})
+            if login_required and not request.user.is_authenticated:
+                return JsonResponse({'error': 'Authentication required'}, status=401)
+            try:
+                return view(request, *args, **kwargs)
+            except ApiError as e:
+                return JsonResponse({'error': str(e)}, status=e.status)
+            except InvalidCursor:
+                return JsonResponse({'error': 'Invalid cursor'}, status=400)
+            except Http404:
+                return JsonResponse({'error': 'Not found'}, status=404)
+        return wrapper
+    return decorator
+
+
+# --- SERIALIZERS ---
+# {field: getter}; ?fields= picks from these, otherwise the compact default set is returned
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+BOOK_FIELDS = {
+    'id': lambda book: book.pk,
+    'title': lambda book: book.title,
+    'author': lambda book: book.author,
+    'description': lambda book: book.description,
+    'genre': lambda book: book.genre,
+    'transaction_type': lambda book: book.transaction_type,
+    'status': lambda book: book.status,
+    'price': lambda book: str(book.price),
+    'security_amount': lambda book: str(book.security_amount) if book.security_amount is not None else None,
+    'location': lambda book: book.location,
+    'pincode': lambda book: book.pincode,
+    'owner': lambda book: book.owner.username,
+    'avg_rating': lambda book: round(book.avg_rating, 1),
+    'review_count': lambda book: book.review_count,
+    'image': lambda book: book.image.url if book.image else None,
+    'created_at': lambda book: _iso(book.created_at),
+    'updated_at': lambda book: _iso(book.updated_at),
+}
+BOOK_DEFAULT = ['id', 'title', 'author', 'genre', 'transaction_type', 'status', 'price', 'owner', 'avg_rating', 'image']
+ORDER_BOOK = ['id', 'title', 'transaction_type', 'price', 'image']
+
+ORDER_FIELDS = {
+    'id': lambda order: order.pk,
+    'book': lambda order: _dump(order.book, BOOK_FIELDS, ORDER_BOOK),
+    'buyer': lambda order: order.buyer.username,
+    'seller': lambda order: order.seller.username,
+    'created_at': lambda order: _iso(order.created_at),
+}
+
+PROFILE_FIELDS = {
+    'username': lambda user: user.username,
+    'first_name': lambda user: user.first_name,
+    'avatar': lambda user: _avatar(user),
+    'trust_score': lambda user: getattr(_profile(user), 'trust_score', 0),
+    'date_joined': lambda user: _iso(user.date_joined),
+    'listings': lambda user: user.listings,
+}
+
+ROOM_FIELDS = {
+    'id': lambda room: room.pk,
+    'other_user': lambda room: room.other.username,
+    'other_avatar': lambda room: _avatar(room.other),
+    'unread_count': lambda room: room.unread_count,
+    'last_message': lambda room: room.last_message,
+    'last_message_at': lambda room: _iso(room.last_message_at),
+}
+
+MESSAGE_FIELDS = {
+    'id': lambda message: message.pk,
+    'sender': lambda message: message.sender.username,
+    'text': lambda message: message.text,
+    'is_read': lambda message: message.is_read,
+    'created_at': lambda message: _iso(message.created_at),
+}
+
+
+def _profile(user):
+    try:
+        return user.userprofile
+    except UserProfile.DoesNotExist:
+        return None
+
+
+def _avatar(user):
+    profile = _profile(user)
+    return profile.avatar if profile else None
+
+
+def _fields(request, getters, default=None):
+    """The field names asked for with ?fields=, checked against `getters`."""
+    requested = [name.strip() for name in request.GET.get('fields', '').split(',') if name.strip()]
+    unknown = [name for name in requested if name not in getters]
+    if unknown:
+        raise ApiError(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(getters)}")
+    return requested or default or list(getters)
+
+
+def _dump(obj, getters, names):
+    return {name: getters[name](obj) for name in names}
+
+
+def _page_size(request, default=DEFAULT_PAGE_SIZE):
+    try:
+        return min(max(int(request.GET.get('limit') or default), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        raise ApiError("limit must be a number")
+
+
+# --- CONDITIONAL RESPONSES ---
+def _conditional(request, versions, build, last_modified=None):
+    """
+    JsonResponse(build()) unless the client already has this version.
+
+    `versions` identifies the state of the rows behind the response; the
+    ETag hashes it with the full URL (fields, cursor) and the user, so two
+    different representations never share a tag.
+    """
+    digest = hashlib.md5(repr((request.get_full_path(), request.user.pk, versions)).encode()).hexdigest()
+    etag = quote_etag(digest)
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = JsonResponse(build())
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    # Always revalidate, and never share one user's copy with another
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def _page_versions(page, version):
+    return [version(item) for item in page] + [page.next_cursor]
+
+
+def _page_json(page, getters, names):
+    return {'results': [_dump(item, getters, names) for item in page], 'next_cursor': page.next_cursor}
+
+
+# --- BOOKS ---
+@api_view()
+@replica_reads
+def books(request):
+    names = _fields(request, BOOK_FIELDS, BOOK_DEFAULT)
+    filters = {}
+    for facet in ('genre', 'status', 'transaction_type'):
+        value = request.GET.get(facet)
+        if value:
+            if value not in dict(facets.CHOICES[facet]):
+                raise ApiError(f"Unknown {facet}: {value}")
+            filters[facet] = value
+
+    ordering = FEED_ORDERINGS.get(request.GET.get('sort'), FEED_ORDERINGS['newest'])
+    page = keyset_paginate(
+        Book.objects.filter(**filters).select_related('owner'),
+        request.GET.get('cursor'),
+        _page_size(request),
+        ordering,
+    )
+    return _conditional(
+        request,
+        _page_versions(page, lambda book: (book.pk, book.updated_at)),
+        lambda: _page_json(page, BOOK_FIELDS, names),
+    )
+
+
+@api_view()
+@replica_reads
+def book_detail(request, pk):
+    names = _fields(request, BOOK_FIELDS)
+    book = get_object_or_404(Book.objects.select_related('owner'), pk=pk)
+    return _conditional(request, book.updated_at, lambda: _dump(book, BOOK_FIELDS, names), book.updated_at)
+
+
+# --- PROFILES ---
+@api_view(login_required=True)
+@replica_reads
+def profile_detail(request, username):
+    names = _fields(request, PROFILE_FIELDS)
+    user = get_object_or_404(User.objects.select_related('userprofile'), username=username)
+    user.listings = Book.objects.filter(owner=user).exclude(status='SOLD').count()
+    data = _dump(user, PROFILE_FIELDS, names)
+    # A profile is a handful of values; they are their own version
+    return _conditional(request, sorted(data.items()), lambda: data)
+
+
+# --- CART & ORDERS ---
+@api_view(login_required=True)
+def cart_detail(request):
+    names = _fields(request, BOOK_FIELDS, BOOK_DEFAULT)
+    cart = Cart.objects.filter(user=request.user).first()
+    items = list(cart.items.select_related('owner').order_by('id')) if cart else []
+    return _conditional(
+        request,
+        [(book.pk, book.updated_at) for book in items],
+        lambda: {
+            'items': [_dump(book, BOOK_FIELDS, names) for book in items],
+            'total_price': str(sum(book.price for book in items)),
+        },
+    )
+
+
+@api_view(login_required=True)
+def orders(request):
+    names = _fields(request, ORDER_FIELDS)
+    role = request.GET.get('role', 'buyer')
+    if role not in ('buyer', 'seller'):
+        raise ApiError("role must be buyer or seller")
+
+    page = keyset_paginate(
+        Order.objects.filter(**{role: request.user}).select_related('book', 'buyer', 'seller'),
+        request.GET.get('cursor'),
+        _page_size(request),
+        ('-created_at', '-id'),
+    )
+    # Orders never change, but the book they show does
+    return _conditional(
+        request,
+        _page_versions(page, lambda order: (order.pk, order.book.updated_at)),
+        lambda: _page_json(page, ORDER_FIELDS, names),
+    )
+
+
+# --- CHAT ---
+@api_view(login_required=True)
+def chat_rooms(request):
+    names = _fields(request, ROOM_FIELDS)
+    rooms = list(ChatRoom.objects.inbox(request.user))
+    for room in rooms:
+        room.other = room.user2 if room.user1_id == request.user.id else room.user1
+    return _conditional(
+        request,
+        [(room.pk, room.last_message_at, room.unread_count, room.other.username, _avatar(room.other)) for room in rooms],
+        lambda: {'results': [_dump(room, ROOM_FIELDS, names) for room in rooms]},
+    )
+
+
+@api_view(login_required=True)
+def chat_messages(request, room_id):
+    """Unlike opening the room in the browser, reading messages here doesn't mark them read."""
+    names = _fields(request, MESSAGE_FIELDS)
+    room = get_object_or_404(ChatRoom, id=room_id)
+    if request.user.id not in (room.user1_id, room.user2_id):
+        raise ApiError("Not a participant", status=403)
+
+    page = keyset_paginate(
+        room.message_set.select_related('sender'),
+        request.GET.get('cursor'),
+        _page_size(request, HISTORY_PAGE_SIZE),
+        MESSAGE_ORDERING,
+    )
+    return _conditional(
+        request,
+        _page_versions(page, lambda message: (message.pk, message.is_read)),
+        lambda: _page_json(page, MESSAGE_FIELDS, names),
+    )
@@ -0,0 +1,14 @@
+from django.urls import path
+
+from . import api
+
+# Mounted at /api/v1/ (bookbeeproject/urls.py)
+urlpatterns = [
+    path('books/', api.books, name='api_books'),
+    path('books/<int:pk>/', api.book_detail, name='api_book_detail'),
+    path('profiles/<str:username>/', api.profile_detail, name='api_profile_detail'),
+    path('cart/', api.cart_detail, name='api_cart'),
+    path('orders/', api.orders, name='api_orders'),
+    path('chat/rooms/', api.chat_rooms, name='api_chat_rooms'),
+    path('chat/rooms/<int:room_id>/messages/', api.chat_messages, name='api_chat_messages'),
+]
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class BookbeeappConfig(AppConfig):
     name = "bookbeeapp"
+
+    def ready(self):
+        from . import signals  # noqa: F401
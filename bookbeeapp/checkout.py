@@ -0,0 +1,76 @@
+"""
+Checkout: turn a user's cart into orders in one transaction.
+
+Whatever the cart size this is a fixed number of statements: lock the
+books, one bulk INSERT for the orders and one guarded UPDATE per
+transaction type (plus one per facet-count cell the books move between,
+see bookbeeapp/facets.py). The guarded UPDATEs only touch books that are still AVAILABLE,
+so if a concurrent buyer got there first the row counts don't match and
+everything is rolled back. That holds even on SQLite, where
+select_for_update() is a no-op.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import facets, pagecache
+from .models import Book, Cart, Order
+
+
+class CheckoutError(Exception):
+    def __init__(self, message, books=()):
+        super().__init__(message)
+        self.books = list(books)
+
+
+def checkout_cart(user):
+    """Place orders for everything in `user`'s cart. Returns the new orders, raises CheckoutError."""
+    with transaction.atomic():
+        cart = Cart.objects.select_for_update().filter(user=user).first()
+        book_ids = list(cart.items.values_list('id', flat=True)) if cart else []
+        if not book_ids:
+            raise CheckoutError("Your cart is empty!")
+
+        books = list(Book.objects.select_for_update().filter(id__in=book_ids).order_by('id'))
+        unavailable = [
+            book for book in books
+            if book.status != 'AVAILABLE' or not book.is_available or book.owner_id == user.id
+        ]
+        if unavailable:
+            raise CheckoutError("Some books in your cart are no longer available.", unavailable)
+
+        # Seller is the owner *before* a sale hands the book over
+        orders = Order.objects.bulk_create([
+            Order(buyer=user, seller_id=book.owner_id, book=book) for book in books
+        ])
+
+        rented = [book.id for book in books if book.transaction_type == 'rent']
+        bought = [book.id for book in books if book.transaction_type != 'rent']
+        still_available = Book.objects.filter(status='AVAILABLE', is_available=True)
+        now = timezone.now()
+        updated = 0
+        if rented:
+            updated += still_available.filter(id__in=rented).update(
+                status='LENDED', is_available=False, updated_at=now,
+            )
+        if bought:
+            updated += still_available.filter(id__in=bought).update(
+                status='SOLD', is_available=False, owner=user, updated_at=now,
+            )
+
+        if updated != len(books):
+            # Someone else checked out one of these books in the meantime
+            raise CheckoutError("Some books in your cart were just taken by another reader.")
+
+        # The bulk updates skip the Book signals, so move the facet counts here
+        moved = Counter()
+        for book in books:
+            moved[facets.cell_for(book)] -= 1
+            moved[facets.cell_for(book, status='LENDED' if book.transaction_type == 'rent' else 'SOLD')] += 1
+        facets.apply(moved)
+
+        cart.items.clear()
+        pagecache.invalidate()
+
+    return orders
@@ -0,0 +1,147 @@
+"""
+Streaming CSV / JSON Lines exports of orders and listings.
+
+    /exports/orders.csv?role=seller&from=2026-01-01&to=2026-03-31
+    /exports/listings.jsonl
+
+Rows are read with iterator(chunk_size=CHUNK_SIZE), so only one chunk of
+model instances exists at a time, and select_related()/only() fetch each
+row's buyer, seller and book in the same query. Encoded rows are grouped
+into blocks of about BLOCK_BYTES and handed to StreamingHttpResponse as
+they are produced: the first bytes leave straight away and memory stays
+flat however many rows the range covers.
+"""
+import csv
+import io
+import json
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Book, Order
+
+FORMATS = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson'}
+CHUNK_SIZE = 2000
+BLOCK_BYTES = 64 * 1024
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _money(value):
+    return str(value) if value is not None else None
+
+
+# {column: getter}, in export order
+ORDER_COLUMNS = {
+    'order_id': lambda order: order.pk,
+    'created_at': lambda order: _iso(order.created_at),
+    'book_id': lambda order: order.book_id,
+    'title': lambda order: order.book.title,
+    'author': lambda order: order.book.author,
+    'transaction_type': lambda order: order.book.transaction_type,
+    'price': lambda order: _money(order.book.price),
+    'security_amount': lambda order: _money(order.book.security_amount),
+    'buyer': lambda order: order.buyer.username,
+    'seller': lambda order: order.seller.username,
+}
+ORDER_ONLY = (
+    'created_at', 'book__title', 'book__author', 'book__transaction_type', 'book__price',
+    'book__security_amount', 'buyer__username', 'seller__username',
+)
+
+LISTING_COLUMNS = {
+    'book_id': lambda book: book.pk,
+    'created_at': lambda book: _iso(book.created_at),
+    'updated_at': lambda book: _iso(book.updated_at),
+    'title': lambda book: book.title,
+    'author': lambda book: book.author,
+    'genre': lambda book: book.genre,
+    'transaction_type': lambda book: book.transaction_type,
+    'status': lambda book: book.status,
+    'price': lambda book: _money(book.price),
+    'security_amount': lambda book: _money(book.security_amount),
+    'location': lambda book: book.location,
+    'pincode': lambda book: book.pincode,
+    'review_count': lambda book: book.review_count,
+    'owner': lambda book: book.owner.username,
+}
+LISTING_ONLY = (
+    'created_at', 'updated_at', 'title', 'author', 'genre', 'transaction_type', 'status', 'price',
+    'security_amount', 'location', 'pincode', 'review_count', 'owner__username',
+)
+
+
+def date_range(start, end):
+    """
+    created_at filter kwargs for the days `start` to `end` (YYYY-MM-DD, both
+    inclusive, either may be empty). Raises ValueError for anything else.
+
+    Compares against the start of the next day rather than using __date, so
+    the filter can use an index on created_at.
+    """
+    bounds = {}
+    for name, value, lookup, shift in (('from', start, 'created_at__gte', 0), ('to', end, 'created_at__lt', 1)):
+        if not value:
+            continue
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"{name} must be a date (YYYY-MM-DD)")
+        bounds[lookup] = timezone.make_aware(datetime.combine(day + timedelta(days=shift), time.min))
+    return bounds
+
+
+def orders(**filters):
+    return (
+        Order.objects.filter(**filters)
+        .select_related('book', 'buyer', 'seller')
+        .only(*ORDER_ONLY)
+        .order_by('created_at', 'id')
+    )
+
+
+def listings(**filters):
+    return Book.objects.filter(**filters).select_related('owner').only(*LISTING_ONLY).order_by('created_at', 'id')
+
+
+def csv_lines(rows, columns):
+    """A header line, then one encoded line per row."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([getter(row) for getter in columns.values()])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # The header of an empty export
+        yield buffer.getvalue()
+
+
+def jsonl_lines(rows, columns):
+    for row in rows:
+        yield json.dumps({name: getter(row) for name, getter in columns.items()}, ensure_ascii=False) + '\n'
+
+
+LINE_WRITERS = {'csv': csv_lines, 'jsonl': jsonl_lines}
+
+
+def blocks(lines, size=BLOCK_BYTES):
+    """Join lines into encoded blocks of about `size` bytes, so the server isn't handed one tiny write per row."""
+    pending, length = [], 0
+    for line in lines:
+        pending.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(pending).encode()
+            pending, length = [], 0
+    if pending:
+        yield ''.join(pending).encode()
+
+
+def stream(queryset, columns, fmt, chunk_size=CHUNK_SIZE):
+    """Encoded blocks of `queryset` exported as `fmt`, read `chunk_size` rows at a time."""
+    return blocks(LINE_WRITERS[fmt](queryset.iterator(chunk_size=chunk_size), columns))
@@ -0,0 +1,138 @@
+"""
+Facet counts for the browse API.
+
+FacetCount holds the number of books in every (genre, status,
+transaction_type, price_band) cell, a few hundred rows at most. Any
+combination of filters can be counted by summing those rows in Python, so
+a browse page costs one small SELECT instead of a GROUP BY per facet.
+
+The table is kept current incrementally: the Book signals in
+bookbeeapp/signals.py move a book's +1 from the cell it was loaded in to
+the cell it was saved in, and bulk updates that skip the signals
+(checkout) call apply() with their own deltas. Deltas are applied in the
+caller's transaction, so a rollback undoes them too. rebuild() (or
+`manage.py rebuild_facets`) recounts everything from scratch.
+"""
+from collections import Counter
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import Book, FacetCount
+
+FACETS = ('genre', 'status', 'transaction_type', 'price_band')
+
+# (value, label, lowest price, price it goes up to); None means unbounded
+PRICE_BANDS = [
+    ('under-100', 'Under ₹100', None, 100),
+    ('100-250', '₹100 – ₹250', 100, 250),
+    ('250-500', '₹250 – ₹500', 250, 500),
+    ('500-plus', '₹500 and up', 500, None),
+]
+
+CHOICES = {
+    'genre': Book.GENRE_CHOICES,
+    'status': Book.STATUS_CHOICES,
+    'transaction_type': Book.TRANSACTION_CHOICES,
+    'price_band': [(value, label) for value, label, _, _ in PRICE_BANDS],
+}
+
+
+def price_band(price):
+    # An unsaved book holds whatever was assigned, e.g. the string '150.00'
+    price = Decimal(str(price))
+    for value, _, low, high in PRICE_BANDS:
+        if (low is None or price >= low) and (high is None or price < high):
+            return value
+    return PRICE_BANDS[-1][0]
+
+
+def price_filter(band):
+    """Book filter kwargs for a price band value."""
+    for value, _, low, high in PRICE_BANDS:
+        if value == band:
+            bounds = {}
+            if low is not None:
+                bounds['price__gte'] = low
+            if high is not None:
+                bounds['price__lt'] = high
+            return bounds
+    raise ValueError(band)
+
+
+def cell(genre, status, transaction_type, price):
+    return (genre, status, transaction_type, price_band(price))
+
+
+def cell_for(book, **changes):
+    """The cell `book` counts in, or would after setting the fields in `changes`."""
+    values = dict(zip(Book.FACET_FIELDS, book.facet_values()), **changes)
+    return cell(*(values[field] for field in Book.FACET_FIELDS))
+
+
+def apply(deltas, using=None):
+    """Add {cell: delta} to the counts."""
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        counts = FacetCount.objects.using(using)
+        fields = dict(zip(FACETS, key))
+        if not counts.filter(**fields).update(count=F('count') + delta):
+            _, created = counts.get_or_create(**fields, defaults={'count': delta})
+            if not created:
+                # Another writer created the cell in between
+                counts.filter(**fields).update(count=F('count') + delta)
+
+
+def move(old, new, using=None):
+    if old != new:
+        apply(Counter({old: -1, new: 1}) if old else Counter({new: 1}), using=using)
+
+
+def loaded_cell(book, using=None):
+    """The cell `book` is counted in right now, before a pending save."""
+    if book.pk is None:
+        return None
+    values = getattr(book, '_loaded_facets', None)
+    if values is None:
+        # Not loaded from the database (e.g. built with an explicit pk), so ask it
+        values = Book.objects.using(using).filter(pk=book.pk).values_list(*Book.FACET_FIELDS).first()
+    return cell(*values) if values else None
+
+
+def counts(filters, using=None):
+    """
+    Facet counts for the books matching `filters` ({facet: value}).
+
+    Returns (total, {facet: Counter}). Each facet is counted with every
+    *other* filter applied, so choosing a genre still shows how many books
+    the other genres have.
+    """
+    total = 0
+    per_facet = {facet: Counter() for facet in FACETS}
+    rows = FacetCount.objects.using(using).filter(count__gt=0).values_list(*FACETS, 'count')
+    for *key, n in rows:
+        row = dict(zip(FACETS, key))
+        misses = [facet for facet, value in filters.items() if row[facet] != value]
+        if not misses:
+            total += n
+        for facet in FACETS:
+            if not misses or misses == [facet]:
+                per_facet[facet][row[facet]] += n
+    return total, per_facet
+
+
+def rebuild(using=None):
+    """Recount every cell from the Book table."""
+    grouped = Book.objects.using(using).values_list(*Book.FACET_FIELDS).annotate(n=Count('id')).order_by()
+    totals = Counter()
+    for *values, n in grouped:
+        totals[cell(*values)] += n
+
+    with transaction.atomic(using=using):
+        FacetCount.objects.using(using).all().delete()
+        FacetCount.objects.using(using).bulk_create(
+            FacetCount(count=n, **dict(zip(FACETS, key))) for key, n in totals.items()
+        )
+    return totals
@@ -1,4 +1,9 @@
+import zipfile
+
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+from django.core.validators import FileExtensionValidator
+from .images import strip_metadata
 from .models import Book
 from django.contrib.auth.models import User
 
@@ -7,6 +12,30 @@ class BookForm(forms.ModelForm):
         model = Book
         fields = ['title','author', 'image', 'price', 'location', 'description', 'transaction_type', 'security_amount', 'genre']
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        # New uploads only; an unchanged cover is already stored (and stripped)
+        if isinstance(image, UploadedFile):
+            return strip_metadata(image) or image
+        return image
+
+class BookImportForm(forms.Form):
+    listings = forms.FileField(
+        validators=[FileExtensionValidator(['csv', 'jsonl', 'ndjson'])],
+        help_text="CSV with a header row, or JSON Lines: one book per row with the add-book fields.",
+    )
+    covers = forms.FileField(
+        validators=[FileExtensionValidator(['zip'])],
+        help_text="Zip of the cover images named in the image column.",
+    )
+
+    def clean_covers(self):
+        covers = self.cleaned_data['covers']
+        if not zipfile.is_zipfile(covers):
+            raise forms.ValidationError("This is not a zip archive.")
+        covers.seek(0)
+        return covers
+
 class EditProfileForm(forms.ModelForm):
     class Meta:
         model = User
@@ -0,0 +1,120 @@
+"""
+Geohash helpers for "books near my pincode".
+
+Every book stores the geohash of its pincode. A radius query is turned into
+the handful of geohash cells that cover the circle's bounding box; each cell
+is a plain index range scan (geohash >= cell AND geohash < cell + '~'), so
+only books in nearby cells are ever looked at.
+"""
+import math
+
+from django.db.models import ExpressionWrapper, F, FloatField, Q
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Precision stored on Book (~1.2 km x 0.6 km cells)
+GEOHASH_PRECISION = 6
+
+# Upper bound on the number of cells (index range scans) per radius query
+MAX_COVER_CELLS = 16
+
+KM_PER_DEGREE = 111.32
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits, bit_count, even = 0, 0, True
+
+    while len(geohash) < precision:
+        # Bits alternate between longitude (even) and latitude (odd)
+        rng, value = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(BASE32[bits])
+            bits, bit_count = 0, 0
+
+    return ''.join(geohash)
+
+
+def cell_size(precision):
+    """(height, width) of a geohash cell in degrees."""
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits)
+
+
+def bounding_box(latitude, longitude, radius_km):
+    dlat = radius_km / KM_PER_DEGREE
+    dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    return (
+        max(latitude - dlat, -90.0), min(latitude + dlat, 90.0),
+        max(longitude - dlon, -180.0), min(longitude + dlon, 180.0),
+    )
+
+
+def _steps(low, high, step):
+    value = low
+    while value < high:
+        yield value
+        value += step
+    yield high
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """
+    Geohash prefixes that together cover every point within `radius_km`.
+    Uses the finest precision that needs at most MAX_COVER_CELLS cells.
+    """
+    south, north, west, east = bounding_box(latitude, longitude, radius_km)
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = math.ceil((north - south) / height) + 1
+        cols = math.ceil((east - west) / width) + 1
+        if rows * cols <= MAX_COVER_CELLS or precision == 1:
+            break
+
+    return sorted({
+        encode(lat, lon, precision)
+        for lat in _steps(south, north, height)
+        for lon in _steps(west, east, width)
+    })
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+def within_radius(queryset, latitude, longitude, radius_km):
+    """
+    Narrow a Book queryset to books within `radius_km` of a point.
+
+    The geohash ranges pick the candidate rows through the index; the exact
+    check is an equirectangular distance (plain arithmetic, so it runs in
+    SQL) which is accurate to well under 1% at city scale.
+    """
+    in_cells = Q()
+    for cell in covering_cells(latitude, longitude, radius_km):
+        in_cells |= Q(geohash__gte=cell, geohash__lt=cell + '~')
+
+    lon_scale = math.cos(math.radians(latitude))
+    dlat = F('latitude') - latitude
+    dlon = (F('longitude') - longitude) * lon_scale
+    distance_sq = ExpressionWrapper(dlat * dlat + dlon * dlon, output_field=FloatField())
+
+    return queryset.filter(in_cells).alias(geo_distance_sq=distance_sq).filter(
+        geo_distance_sq__lte=(radius_km / KM_PER_DEGREE) ** 2
+    )
@@ -0,0 +1,143 @@
+"""
+Cover thumbnails.
+
+Uploaded covers are phone photos of several megabytes. After an upload we
+generate fixed-size 3:4 thumbnails in WebP and JPEG next to the original
+(book_covers/thumbs/<name>_<width>.<ext>) and templates serve them with
+srcset. EXIF data (GPS position, camera details) is stripped when the
+cover is uploaded (BookForm.clean_image), and thumbnails are re-encoded
+from pixels only, so it never reaches the media folder.
+
+Generation runs on a small thread pool after the upload's transaction
+commits, so add_book returns without waiting for Pillow.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, JpegImagePlugin
+
+from . import pagecache
+from .models import Book
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_WIDTHS = (240, 480, 960)
+THUMBNAIL_ASPECT = 4 / 3  # height / width, matches the feed card
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Re-encoding settings for an uploaded original; other formats are stored as PNG
+ORIGINAL_FORMATS = {
+    'JPEG': ('jpg', {'quality': 90, 'optimize': True}),
+    'PNG': ('png', {'optimize': True}),
+    'WEBP': ('webp', {'quality': 90}),
+}
+# Metadata blocks Pillow exposes in Image.info besides EXIF
+METADATA_KEYS = ('xmp', 'XML:com.adobe.xmp', 'photoshop', 'comment')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def thumbnail_name(image_name, width, ext):
+    folder, filename = os.path.split(image_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(folder, 'thumbs', f'{stem}_{width}.{ext}')
+
+
+def strip_metadata(file):
+    """
+    The image in `file` re-encoded from pixels only, turned upright first,
+    as an upload named like `file`. None if it carries no metadata, in
+    which case it is stored untouched.
+    """
+    file.seek(0)
+    image = Image.open(file)
+    if not image.getexif() and not any(key in image.info for key in METADATA_KEYS):
+        file.seek(0)
+        return None
+
+    if isinstance(image, JpegImagePlugin.JpegImageFile):
+        # Includes MPO (phones that shoot several frames), which is JPEG underneath
+        pil_format = 'JPEG'
+    else:
+        pil_format = image.format if image.format in ORIGINAL_FORMATS else 'PNG'
+    ext, options = ORIGINAL_FORMATS[pil_format]
+    icc_profile = image.info.get('icc_profile')
+    # Phones store rotation in EXIF; apply it before the metadata is dropped
+    clean = ImageOps.exif_transpose(image)
+    clean.info = {}
+    if icc_profile:
+        # Colour profile only, so wide-gamut photos keep their colours
+        options = {**options, 'icc_profile': icc_profile}
+
+    buffer = BytesIO()
+    clean.save(buffer, pil_format, **options)
+    stem = os.path.splitext(os.path.basename(file.name))[0]
+    return SimpleUploadedFile(f'{stem}.{ext}', buffer.getvalue(), content_type=Image.MIME[pil_format])
+
+
+def generate_thumbnails(book):
+    storage = book.image.storage
+    with storage.open(book.image.name, 'rb') as f:
+        clean = strip_metadata(f)
+    if clean is not None:
+        # Uploaded before covers were stripped on upload
+        old_name = book.image.name
+        storage.delete(old_name)
+        book.image.name = storage.save(os.path.join(os.path.dirname(old_name), clean.name), clean)
+
+    with storage.open(book.image.name, 'rb') as f:
+        image = Image.open(f)
+        image = ImageOps.exif_transpose(image).convert('RGB')
+
+    for width in THUMBNAIL_WIDTHS:
+        thumb = ImageOps.fit(image, (width, round(width * THUMBNAIL_ASPECT)), Image.LANCZOS)
+        for ext, (pil_format, options) in THUMBNAIL_FORMATS.items():
+            buffer = BytesIO()
+            thumb.save(buffer, pil_format, **options)
+            name = thumbnail_name(book.image.name, width, ext)
+            if storage.exists(name):
+                storage.delete(name)
+            storage.save(name, ContentFile(buffer.getvalue()))
+
+    Book.objects.filter(pk=book.pk).update(image=book.image.name, thumbnails_ready=True, updated_at=timezone.now())
+    pagecache.invalidate()
+
+
+def _generate_in_worker(book_id):
+    close_old_connections()
+    try:
+        book = Book.objects.filter(pk=book_id).first()
+        if book is not None and book.image:
+            generate_thumbnails(book)
+    except Exception:
+        # The original cover is still served, so a bad upload only costs bandwidth
+        logger.exception("Could not generate thumbnails for book %s", book_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_thumbnails(book):
+    """Generate thumbnails for `book` in the background once the current transaction commits."""
+    global _executor
+    if not settings.THUMBNAIL_ASYNC:
+        transaction.on_commit(lambda: _generate_in_worker(book.pk))
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+    transaction.on_commit(lambda: _executor.submit(_generate_in_worker, book.pk))
@@ -0,0 +1,207 @@
+"""
+Bulk listing import for libraries and bookstores.
+
+    manage.py import_books listings.csv --owner citylibrary --covers covers.zip
+
+or upload the same files at /import-books/, which queues the import as a
+job. Listings are CSV (with a header row) or JSON Lines with the BookForm
+fields: title, author, image, price, location, description,
+transaction_type, security_amount and genre. `image` names a cover inside
+the zip.
+
+Rows are read one at a time and validated with BookForm, covers are
+unpacked one at a time, and valid books are inserted with bulk_create in
+batches, so memory stays flat however long the file is. Book.save() and
+the Book signals are skipped, so each batch does their work in bulk
+instead: pincode extraction and geocoding (one Pincode query), the search
+index, facet counts, cover thumbnails and the anonymous page cache.
+"""
+import csv
+import io
+import json
+import os
+import zipfile
+from collections import Counter
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+
+from . import facets, pagecache
+from .forms import BookForm
+from .images import schedule_thumbnails
+from .models import Book, Pincode
+from .search import get_backend
+
+BATCH_SIZE = 500
+FORMATS = ('csv', 'jsonl')
+MAX_COVER_BYTES = 10 * 1024 * 1024
+# Errors kept for the summary; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportFileError(ValueError):
+    pass
+
+
+def detect_format(name):
+    ext = os.path.splitext(name)[1].lower().lstrip('.')
+    if ext in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if ext == 'csv':
+        return 'csv'
+    raise ImportFileError(f"Can't tell the format of {name!r}; use a .csv or .jsonl file.")
+
+
+def read_rows(file, fmt):
+    """Yield (line number, row dict) from a binary file, or (line number, error message) for unreadable lines."""
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, f"Not valid JSON: {e}"
+            continue
+        yield number, row if isinstance(row, dict) else "Each line must be a JSON object"
+
+
+class Covers:
+    """Cover images inside a zip, looked up by file name and read one at a time."""
+
+    def __init__(self, file):
+        try:
+            self.zip = zipfile.ZipFile(file)
+        except zipfile.BadZipFile:
+            raise ImportFileError("The covers file is not a zip archive.")
+        self.members = {
+            os.path.basename(info.filename): info
+            for info in self.zip.infolist() if not info.is_dir() and os.path.basename(info.filename)
+        }
+
+    def get(self, name):
+        info = self.members.get(os.path.basename(name or ''))
+        if info is None:
+            return None, f"Cover {name!r} is not in the zip."
+        if info.file_size > MAX_COVER_BYTES:
+            return None, f"Cover {name!r} is larger than {MAX_COVER_BYTES // (1024 * 1024)} MB."
+        return SimpleUploadedFile(os.path.basename(info.filename), self.zip.read(info)), None
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def summary(self):
+        lines = [f"{self.created} books listed, {self.failed} rows skipped."]
+        lines += [f"Line {line}: {message}" for line, message in self.errors]
+        if self.failed > len(self.errors):
+            lines.append(f"...and {self.failed - len(self.errors)} more.")
+        return '\n'.join(lines)
+
+
+def _form_errors(form):
+    return '; '.join(
+        f"{name if name != '__all__' else 'row'}: {' '.join(errors)}" for name, errors in form.errors.items()
+    )
+
+
+class BookImporter:
+    def __init__(self, owner, covers=None, batch_size=BATCH_SIZE, dry_run=False, on_error=None):
+        self.owner = owner
+        self.covers = covers
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.on_error = on_error
+        self.result = ImportResult()
+
+    def error(self, line, message):
+        self.result.add_error(line, message)
+        if self.on_error:
+            self.on_error(line, message)
+
+    def run(self, rows):
+        batch = []
+        for line, row in rows:
+            book = self.build(line, row)
+            if book is None:
+                continue
+            batch.append(book)
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+        self.flush(batch)
+        return self.result
+
+    def build(self, line, row):
+        """A validated, unsaved Book for one row, or None after reporting why not."""
+        if isinstance(row, str):
+            self.error(line, row)
+            return None
+
+        if self.covers is None:
+            self.error(line, "No covers zip was given, and every book needs a cover.")
+            return None
+        cover, problem = self.covers.get(row.get('image'))
+        if problem:
+            self.error(line, problem)
+            return None
+
+        data = {name: '' if row.get(name) is None else row[name] for name in BookForm.Meta.fields if name != 'image'}
+        form = BookForm(data, {'image': cover})
+        if not form.is_valid():
+            self.error(line, _form_errors(form))
+            return None
+
+        book = form.save(commit=False)
+        book.owner = self.owner
+        if not self.dry_run:
+            # Store the cover (stripped of metadata by the form) now and keep only its name,
+            # so a batch never holds image data
+            upload = form.cleaned_data['image']
+            book.image.save(upload.name, upload, save=False)
+            book.image = book.image.name
+        return book
+
+    def flush(self, books):
+        if not books:
+            return
+        if self.dry_run:
+            self.result.created += len(books)
+            return
+
+        # What Book.save() would do row by row, with one geocoding query per batch
+        for book in books:
+            book.pincode = Book.pincode_in(book.location) or ''
+        places = Pincode.locate_many(book.pincode for book in books if book.pincode)
+        for book in books:
+            book.latitude, book.longitude, book.geohash = places.get(book.pincode, (None, None, ''))
+
+        with transaction.atomic():
+            created = Book.objects.bulk_create(books)
+            # ...and what the post_save signals would have done
+            get_backend().index_many(created)
+            facets.apply(Counter(facets.cell_for(book) for book in created))
+            for book in created:
+                schedule_thumbnails(book)
+            pagecache.invalidate()
+        self.result.created += len(created)
+
+
+def import_books(owner, listings, fmt, covers=None, **options):
+    """Import a listings file (binary file object) for `owner`. Returns an ImportResult."""
+    importer = BookImporter(owner, Covers(covers) if covers is not None else None, **options)
+    return importer.run(read_rows(listings, fmt))
@@ -0,0 +1,213 @@
+"""
+Per-view latency and SQL instrumentation.
+
+InstrumentationMiddleware times a sample of requests (settings.INSTRUMENTATION_SAMPLE_RATE)
+and, through connection.execute_wrapper(), counts and times every query they
+run. Results are kept per URL name in fixed-bucket histograms, so recording
+is O(1) and memory stays flat however long the process runs. Queries are
+fingerprinted (parameters and IN lists stripped) and any fingerprint that
+runs more than once in a request is reported as a duplicate: the usual
+sign of an N+1 loop.
+
+Stats live in process memory, so each worker reports its own traffic. Staff
+can read them at /stats/views/ (bookbeeapp.views.view_stats).
+"""
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+# Histogram bucket upper bounds
+MS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233)
+
+# Distinct duplicate fingerprints remembered per view
+MAX_DUPLICATES = 20
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r'\bIN \(\?(?:, \?)*\)')
+
+
+def fingerprint(sql):
+    """The shape of a query, e.g. `... WHERE "id" IN (...)`, with parameters and literals removed."""
+    sql = _LITERALS.sub('?', sql.replace('%s', '?'))
+    return _IN_LISTS.sub('IN (...)', sql)
+
+
+class Histogram:
+    """Counts per fixed bucket; percentiles are read off the bucket upper bounds."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.sum = 0
+        self.max = 0
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p):
+        if not self.total:
+            return None
+        rank = p / 100 * self.total
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'mean': round(self.sum / self.total, 2) if self.total else None,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': round(self.max, 2),
+            'buckets': {
+                **{f'<={bound}': count for bound, count in zip(self.bounds, self.counts)},
+                f'>{self.bounds[-1]}': self.counts[-1],
+            },
+        }
+
+
+class QueryRecorder:
+    """execute_wrapper() hook counting and timing the queries of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        return {
+            sql: repeats for sql, repeats in self.fingerprints.items()
+            if repeats > 1 and not sql.startswith(('SAVEPOINT', 'RELEASE'))
+        }
+
+
+class ViewStats:
+    def __init__(self):
+        self.wall_ms = Histogram(MS_BUCKETS)
+        self.sql_ms = Histogram(MS_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        # fingerprint -> [requests it repeated in, most repeats in one request]
+        self.duplicates = {}
+
+    def add(self, wall_ms, recorder):
+        self.wall_ms.add(wall_ms)
+        self.sql_ms.add(recorder.seconds * 1000)
+        self.queries.add(recorder.count)
+        for sql, repeats in recorder.duplicates().items():
+            if sql not in self.duplicates and len(self.duplicates) >= MAX_DUPLICATES:
+                continue
+            entry = self.duplicates.setdefault(sql, [0, 0])
+            entry[0] += 1
+            entry[1] = max(entry[1], repeats)
+
+    def as_dict(self):
+        duplicates = sorted(self.duplicates.items(), key=lambda item: -item[1][0])
+        return {
+            'requests': self.wall_ms.total,
+            'wall_ms': self.wall_ms.as_dict(),
+            'sql_ms': self.sql_ms.as_dict(),
+            'queries': self.queries.as_dict(),
+            'duplicate_queries': [
+                {'sql': sql, 'requests': seen, 'max_repeats': repeats}
+                for sql, (seen, repeats) in duplicates
+            ],
+        }
+
+
+_lock = threading.Lock()
+_views = {}
+
+
+def record(view_name, wall_ms, recorder):
+    with _lock:
+        _views.setdefault(view_name, ViewStats()).add(wall_ms, recorder)
+
+
+def snapshot():
+    """Stats per URL name, the views with the most total wall time first."""
+    with _lock:
+        views = sorted(_views.items(), key=lambda item: -item[1].wall_ms.sum)
+        return {name: stats.as_dict() for name, stats in views}
+
+
+def reset():
+    with _lock:
+        _views.clear()
+
+
+def _wrap_connections(stack, recorder):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(recorder))
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= settings.INSTRUMENTATION_SAMPLE_RATE:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            _wrap_connections(stack, recorder)
+            response = self.get_response(request)
+        self._record(request, start, recorder)
+        return response
+
+    async def __acall__(self, request):
+        if random.random() >= settings.INSTRUMENTATION_SAMPLE_RATE:
+            return await self.get_response(request)
+
+        # Database connections belong to the thread sync views run in, so the
+        # wrappers are installed (and removed) from that thread
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        stack = ExitStack()
+        await sync_to_async(_wrap_connections)(stack, recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self._record(request, start, recorder)
+        return response
+
+    def _record(self, request, start, recorder):
+        wall_ms = (time.perf_counter() - start) * 1000
+        # Unresolved URLs (404s) are left out
+        match = request.resolver_match
+        if match is not None:
+            record(match.view_name, wall_ms, recorder)
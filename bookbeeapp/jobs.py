@@ -0,0 +1,144 @@
+"""
+A small persistent job queue backed by the Job table.
+
+    from bookbeeapp.jobs import enqueue
+    enqueue('send_email', subject=..., body=..., to=[...])
+
+`manage.py run_jobs` claims due jobs and runs their handlers on a thread
+pool. A failed job is retried with exponential backoff until max_attempts,
+then left as 'failed' with its last error for a look in the admin. Jobs
+whose worker died mid-run are re-queued once their lock goes stale, or
+failed if that run was their last attempt, so a max_attempts=1 job never
+runs twice.
+"""
+import logging
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import importer
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Retry delays: 30s, 1m, 2m, 4m ... capped at 1 hour
+BACKOFF_BASE = timedelta(seconds=30)
+BACKOFF_MAX = timedelta(hours=1)
+
+# A running job locked longer than this is assumed to belong to a dead worker
+STALE_LOCK = timedelta(minutes=10)
+
+_handlers = {}
+
+
+def job(name):
+    """Register a function as the handler for jobs called `name`."""
+    def register(func):
+        _handlers[name] = func
+        return func
+    return register
+
+
+def enqueue(name, run_at=None, max_attempts=5, **payload):
+    """
+    Queue a job. It becomes visible to workers when the surrounding
+    transaction commits, like any other row.
+    """
+    queued = Job.objects.create(
+        name=name,
+        payload=payload,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts,
+    )
+    if settings.JOBS_EAGER:
+        transaction.on_commit(lambda: run_now(queued.pk))
+    return queued
+
+
+def backoff(attempts):
+    return min(BACKOFF_BASE * (2 ** max(attempts - 1, 0)), BACKOFF_MAX)
+
+
+def requeue_stale():
+    """Re-queue jobs whose lock went stale, or fail them if they have no attempts left."""
+    stale = Job.objects.filter(status='running', locked_at__lt=timezone.now() - STALE_LOCK)
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', locked_at=None, last_error=f"Still running after {STALE_LOCK}; not retried"
+    )
+    return stale.update(status='queued', locked_at=None)
+
+
+def claim(limit):
+    """Atomically take up to `limit` due jobs; safe with several workers polling at once."""
+    now = timezone.now()
+    due = Job.objects.filter(status='queued', run_at__lte=now).order_by('run_at', 'id')
+    return [job_id for job_id in due.values_list('id', flat=True)[:limit] if _take(job_id, now)]
+
+
+def _take(job_id, now):
+    # Only one runner can flip a given row from queued to running
+    return Job.objects.filter(id=job_id, status='queued').update(
+        status='running', locked_at=now, attempts=F('attempts') + 1
+    )
+
+
+def run_now(job_id):
+    """Claim and run a freshly queued job in this process (JOBS_EAGER), unless a worker got to it first."""
+    if not _take(job_id, timezone.now()):
+        return False
+    return run(job_id)
+
+
+def run(job_id):
+    """Run one claimed job and record the outcome."""
+    current = Job.objects.get(pk=job_id)
+    handler = _handlers.get(current.name)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job {current.name!r}")
+        handler(**current.payload)
+    except Exception as e:
+        logger.warning("Job %s failed (attempt %s/%s): %s", current, current.attempts, current.max_attempts, e)
+        if current.attempts >= current.max_attempts:
+            Job.objects.filter(pk=job_id).update(status='failed', locked_at=None, last_error=repr(e))
+        else:
+            Job.objects.filter(pk=job_id).update(
+                status='queued',
+                locked_at=None,
+                last_error=repr(e),
+                run_at=timezone.now() + backoff(current.attempts),
+            )
+        return False
+
+    Job.objects.filter(pk=job_id).update(status='done', locked_at=None, last_error='')
+    return True
+
+
+# --- HANDLERS ---
+@job('send_email')
+def send_email(subject, body, to, from_email=None):
+    EmailMessage(subject, body, from_email=from_email, to=to).send()
+
+
+@job('import_books')
+def import_books(owner_id, listings, covers=None):
+    """Run an import uploaded at /import-books/, email the owner a summary and delete the uploads."""
+    owner = User.objects.get(pk=owner_id)
+    try:
+        with ExitStack() as stack:
+            listings_file = stack.enter_context(default_storage.open(listings, 'rb'))
+            covers_file = stack.enter_context(default_storage.open(covers, 'rb')) if covers else None
+            result = importer.import_books(owner, listings_file, importer.detect_format(listings), covers_file)
+    finally:
+        for name in filter(None, [listings, covers]):
+            default_storage.delete(name)
+
+    if owner.email:
+        enqueue('send_email', subject="Your BookBee import is done 🐝", body=result.summary(), to=[owner.email])
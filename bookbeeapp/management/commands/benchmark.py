@@ -0,0 +1,169 @@
+import json
+import random
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Count, Q
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from bookbeeapp.instrumentation import QueryRecorder
+from bookbeeapp.models import Book, Cart
+from chat.models import ChatRoom
+
+SCENARIOS = ['home', 'search', 'book_detail', 'cart_view', 'payment_success', 'chat_list', 'chat_room']
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the busiest views through the test client against the current database and "
+        "report p50/p95 latency and query counts. Everything runs in one transaction that is "
+        "rolled back, so checkouts and chat reads leave no trace. Pair with generate_synthetic_data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help="Timed requests per scenario.")
+        parser.add_argument('--warmup', type=int, default=3, help="Untimed requests per scenario first.")
+        parser.add_argument('--user', help="Username to browse as (default: the user with the most chat rooms).")
+        parser.add_argument('--cart-size', type=int, default=3)
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                            help="Only run this scenario (can be repeated).")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--save', help="Write the results to this JSON file (e.g. as a new baseline).")
+        parser.add_argument('--baseline', help="Compare with a saved JSON file and fail on regressions.")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Allowed p95 slowdown against the baseline (default 0.25 = 25%%).")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.cart_size = options['cart_size']
+        if not Book.objects.exists():
+            raise CommandError("No books to benchmark with; run `manage.py generate_synthetic_data` first.")
+
+        with override_settings(ALLOWED_HOSTS=['testserver']), transaction.atomic():
+            self.user = self.pick_user(options['user'])
+            self.client = Client()
+            self.client.force_login(self.user)
+            results = {}
+            for name in options['scenario'] or SCENARIOS:
+                results[name] = self.run_scenario(name, options['warmup'], options['iterations'])
+                self.report(name, results[name])
+            transaction.set_rollback(True)
+
+        if options['save']:
+            Path(options['save']).write_text(json.dumps(results, indent=2))
+            self.stdout.write(f"Saved results to {options['save']}.")
+        if options['baseline']:
+            self.compare(results, json.loads(Path(options['baseline']).read_text()), options['tolerance'])
+
+    def pick_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f"No user called {username!r}.")
+            return user
+        busiest = ChatRoom.objects.values('user1').annotate(rooms=Count('id')).order_by('-rooms').first()
+        return User.objects.get(pk=busiest['user1']) if busiest else User.objects.order_by('id').first()
+
+    def random_book(self, **filters):
+        books = Book.objects.filter(**filters)
+        last = books.order_by('-id').values_list('id', flat=True).first()
+        if last is None:
+            raise CommandError(f"No books match {filters}.")
+        return books.filter(id__gte=self.random.randint(1, last)).order_by('id').first() or books.first()
+
+    def fill_cart(self):
+        cart, _ = Cart.objects.get_or_create(user=self.user)
+        books = {self.random_book(status='AVAILABLE', is_available=True) for _ in range(self.cart_size)}
+        cart.items.set([book for book in books if book.owner_id != self.user.id])
+
+    def request_for(self, name):
+        """(url, setup) for one request; setup runs untimed right before it."""
+        if name == 'home':
+            return reverse('home'), None
+        if name == 'search':
+            word = self.random_book().title.split()[-1]
+            return reverse('home') + f'?q={word}', None
+        if name == 'book_detail':
+            return reverse('book_detail', args=[self.random_book().pk]), None
+        if name == 'cart_view':
+            return reverse('cart_view'), None
+        if name == 'payment_success':
+            return reverse('payment_success'), self.fill_cart
+        if name == 'chat_list':
+            return reverse('chat_list'), None
+        if name == 'chat_room':
+            room = ChatRoom.objects.filter(Q(user1=self.user) | Q(user2=self.user)).order_by('?').first()
+            if room is None:
+                room = ChatRoom.objects.room_for(self.user.id, self.random_book().owner_id)
+            return reverse('chat_room', args=[room.id]), None
+
+    def run_scenario(self, name, warmup, iterations):
+        if name == 'cart_view':
+            self.fill_cart()
+
+        latencies, query_counts, sql_times = [], [], []
+        for i in range(warmup + iterations):
+            url, setup = self.request_for(name)
+            if setup:
+                setup()
+
+            recorder = QueryRecorder()
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                start = time.perf_counter()
+                response = self.client.get(url)
+                elapsed = time.perf_counter() - start
+
+            if response.status_code >= 400:
+                raise CommandError(f"{name}: GET {url} returned {response.status_code}.")
+            if name == 'payment_success' and response.url != reverse('home'):
+                # Bounced back to the cart: the checkout itself failed
+                raise CommandError(f"{name}: checkout did not go through.")
+            if i >= warmup:
+                latencies.append(elapsed * 1000)
+                query_counts.append(recorder.count)
+                sql_times.append(recorder.seconds * 1000)
+
+        return {
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'max_ms': round(max(latencies), 2),
+            'queries': max(query_counts),
+            'sql_p50_ms': round(percentile(sql_times, 50), 2),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<16} p50 {result['p50_ms']:>8.2f} ms   p95 {result['p95_ms']:>8.2f} ms   "
+            f"max {result['max_ms']:>8.2f} ms   queries {result['queries']:>3}   "
+            f"sql p50 {result['sql_p50_ms']:>7.2f} ms"
+        )
+
+    def compare(self, results, baseline, tolerance):
+        regressions = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            if result['queries'] > before['queries']:
+                regressions.append(f"{name}: {before['queries']} -> {result['queries']} queries")
+            if result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{name}: p95 {before['p95_ms']} -> {result['p95_ms']} ms")
+
+        if regressions:
+            for line in regressions:
+                self.stderr.write(line)
+            raise CommandError(f"{len(regressions)} regression(s) against the baseline.")
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline. 🐝"))
@@ -0,0 +1,255 @@
+import random
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from bookbeeapp import facets, pagecache
+from bookbeeapp.geo import encode
+from bookbeeapp.models import Book, Order, Pincode, Review, UserCredit, UserProfile
+from bookbeeapp.search import get_backend
+from chat.models import ChatRoom, Message, UnreadCounter
+
+USERNAME_PREFIX = 'synth_'
+
+# Row counts at --scale 1
+DEFAULT_COUNTS = {
+    'users': 20_000,
+    'books': 100_000,
+    'orders': 30_000,
+    'reviews': 20_000,
+    'credits': 10_000,
+    'rooms': 50_000,
+    'messages': 1_000_000,
+}
+
+ADJECTIVES = [
+    'Silent', 'Hidden', 'Last', 'Broken', 'Golden', 'Midnight', 'Forgotten', 'Crimson', 'Quiet',
+    'Wild', 'Burning', 'Lost', 'Secret', 'Endless', 'Paper', 'Monsoon', 'Winter', 'Electric',
+]
+NOUNS = [
+    'River', 'Garden', 'Kingdom', 'Algorithm', 'Letters', 'Island', 'Orchard', 'Empire', 'Mirror',
+    'Station', 'Archive', 'Compass', 'Harbour', 'Library', 'Mountain', 'Theorem', 'Voyage', 'City',
+]
+FIRST_NAMES = ['Aarav', 'Diya', 'Kabir', 'Meera', 'Rohan', 'Ananya', 'Vikram', 'Isha', 'Arjun', 'Sara']
+LAST_NAMES = ['Sharma', 'Iyer', 'Khan', 'Das', 'Menon', 'Gupta', 'Singh', 'Rao', 'Joshi', 'Bose']
+CHAT_LINES = [
+    'Hi! Is this still available?', 'Can we meet near the metro?', 'Would you take a little less?',
+    'Sure, see you on Saturday.', 'Thanks, the book is in great shape!', 'Sharing my location now.',
+]
+AVATARS = ['av1.png', 'av2.png', 'av3.png', 'av4.png', 'av5.png']
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the created_at values we set instead of stamping them all with "now"."""
+    fields = [model._meta.get_field('created_at') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with synthetic users, books, orders, reviews, credits and chats "
+        "for benchmarking. Rows are bulk-inserted in batches; signals don't fire, so the "
+        "search index, facet counts, trust scores and unread counters are rebuilt at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help="Multiply every default row count, e.g. 0.01 for a quick dataset.")
+        for name, count in DEFAULT_COUNTS.items():
+            parser.add_argument(f'--{name}', type=int, help=f"Number of {name} (default {count:,} x scale).")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--clear', action='store_true', help="Delete previously generated data first.")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        counts = {
+            name: options[name] if options[name] is not None else int(default * options['scale'])
+            for name, default in DEFAULT_COUNTS.items()
+        }
+        if counts['users'] < 2:
+            raise CommandError("Need at least 2 users.")
+
+        self.places = [(p.pincode, p.city, p.latitude, p.longitude) for p in Pincode.objects.all()]
+        if not self.places:
+            raise CommandError("The Pincode table is empty; run `manage.py load_pincodes` first.")
+
+        if options['clear']:
+            deleted, _ = User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+            self.stdout.write(f"Deleted {deleted:,} rows of old synthetic data.")
+
+        self.now = timezone.now()
+        with transaction.atomic(), explicit_timestamps(Book, Order, UserCredit, Message):
+            user_ids = self.create_users(counts['users'])
+            trades = self.create_books(user_ids, counts['books'], counts['orders'], counts['reviews'])
+            self.create_credits(trades, counts['credits'])
+            self.create_chats(user_ids, trades, counts['rooms'], counts['messages'])
+
+        self.stdout.write("Rebuilding the search index, facet counts and trust scores...")
+        get_backend().rebuild()
+        facets.rebuild()
+        pagecache.invalidate()
+        call_command('recompute_trust_scores', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS("Synthetic data ready. 🐝"))
+
+    def in_batches(self, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def past(self, days=365):
+        return self.now - timedelta(seconds=self.random.randrange(days * 86400))
+
+    def create_users(self, count):
+        start = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+        password = make_password(None)  # unusable; synthetic users can't log in
+        users = (
+            User(
+                username=f'{USERNAME_PREFIX}{i}',
+                email=f'{USERNAME_PREFIX}{i}@example.com',
+                password=password,
+                first_name=self.random.choice(FIRST_NAMES),
+                date_joined=self.past(),
+            )
+            for i in range(start, start + count)
+        )
+        user_ids = []
+        for batch in self.in_batches(users):
+            created = User.objects.bulk_create(batch)
+            UserProfile.objects.bulk_create(
+                UserProfile(user=user, avatar=self.random.choice(AVATARS)) for user in created
+            )
+            user_ids.extend(user.pk for user in created)
+        self.stdout.write(f"Created {len(user_ids):,} users.")
+        return user_ids
+
+    def create_books(self, user_ids, count, orders, reviews):
+        """Books, plus one order per book that is lent out or sold. Returns (buyer, seller) pairs."""
+        order_chance = min(orders / count, 1) if count else 0
+        review_chance = min(reviews / orders, 1) if orders else 0
+        step = timedelta(days=365) / max(count, 1)
+        start = self.now - timedelta(days=365)
+        trades = []
+        totals = Counter()
+
+        for batch_start in range(0, count, self.batch_size):
+            books, sales = [], []
+            for i in range(batch_start, min(batch_start + self.batch_size, count)):
+                pincode, city, latitude, longitude = self.random.choice(self.places)
+                seller = self.random.choice(user_ids)
+                book = Book(
+                    owner_id=seller,
+                    title=f'The {self.random.choice(ADJECTIVES)} {self.random.choice(NOUNS)}',
+                    author=f'{self.random.choice(FIRST_NAMES)} {self.random.choice(LAST_NAMES)}',
+                    image='book_covers/synthetic.jpg',
+                    price=self.random.choice([49, 99, 149, 199, 299, 499]),
+                    location=f'{city} {pincode}',
+                    pincode=pincode,
+                    latitude=latitude,
+                    longitude=longitude,
+                    geohash=encode(latitude, longitude),
+                    genre=self.random.choice(Book.GENRE_CHOICES)[0],
+                    transaction_type=self.random.choice(['rent', 'rent', 'buy']),
+                    created_at=start + step * i,
+                )
+                sale = None
+                if self.random.random() < order_chance:
+                    buyer = self.random.choice(user_ids)
+                    if buyer != seller:
+                        # Same end state as checkout_cart(): rented books are lent, sold ones change hands
+                        book.is_available = False
+                        book.status = 'LENDED' if book.transaction_type == 'rent' else 'SOLD'
+                        if book.status == 'SOLD':
+                            book.owner_id = buyer
+                        rating = self.random.choice([3, 4, 4, 5, 5]) if self.random.random() < review_chance else None
+                        if rating:
+                            book.review_count, book.rating_sum, book.avg_rating = 1, rating, float(rating)
+                        sale = (buyer, seller, rating)
+                books.append(book)
+                sales.append(sale)
+
+            Book.objects.bulk_create(books)
+            Order.objects.bulk_create(
+                Order(buyer_id=buyer, seller_id=seller, book=book, created_at=book.created_at + timedelta(days=1))
+                for book, (buyer, seller, _) in self.with_sales(books, sales)
+            )
+            Review.objects.bulk_create(
+                Review(author_id=buyer, book=book, rating=rating, comment='Lovely read, would borrow again.')
+                for book, (buyer, _, rating) in self.with_sales(books, sales) if rating
+            )
+            for _, (buyer, seller, rating) in self.with_sales(books, sales):
+                trades.append((buyer, seller))
+                totals['orders'] += 1
+                totals['reviews'] += bool(rating)
+
+        self.stdout.write(f"Created {count:,} books, {totals['orders']:,} orders and {totals['reviews']:,} reviews.")
+        return trades
+
+    def with_sales(self, books, sales):
+        return ((book, sale) for book, sale in zip(books, sales) if sale)
+
+    def create_credits(self, trades, count):
+        pairs = list(dict.fromkeys(trades))
+        self.random.shuffle(pairs)
+        credits = (
+            UserCredit(giver_id=buyer, receiver_id=seller, message='Smooth and friendly trade.', created_at=self.past())
+            for buyer, seller in pairs[:count]
+        )
+        for batch in self.in_batches(credits):
+            UserCredit.objects.bulk_create(batch)
+        self.stdout.write(f"Created {min(count, len(pairs)):,} trust credits.")
+
+    def create_chats(self, user_ids, trades, room_count, message_count):
+        # Most conversations are between people who traded, the rest are enquiries
+        pairs = {tuple(sorted(pair)) for pair in trades[:room_count]}
+        while len(pairs) < room_count and len(pairs) < len(user_ids) * (len(user_ids) - 1) // 2:
+            pair = tuple(sorted(self.random.sample(user_ids, 2)))
+            pairs.add(pair)
+
+        rooms = []
+        for batch in self.in_batches(ChatRoom(user1_id=a, user2_id=b) for a, b in pairs):
+            rooms.extend((room.pk, room.user1_id, room.user2_id) for room in ChatRoom.objects.bulk_create(batch))
+        if not rooms:
+            return
+
+        unread = Counter()
+
+        def messages():
+            for _ in range(message_count):
+                room_id, user1, user2 = self.random.choice(rooms)
+                sender, recipient = (user1, user2) if self.random.random() < 0.5 else (user2, user1)
+                is_read = self.random.random() > 0.05
+                if not is_read:
+                    unread[recipient] += 1
+                yield Message(
+                    room_id=room_id, sender_id=sender, text=self.random.choice(CHAT_LINES),
+                    is_read=is_read, created_at=self.past(90),
+                )
+
+        for batch in self.in_batches(messages()):
+            Message.objects.bulk_create(batch)
+
+        # bulk_create skips the Message signals, so the counters are written here
+        for batch in self.in_batches(UnreadCounter(user_id=user_id, count=n) for user_id, n in unread.items()):
+            UnreadCounter.objects.bulk_create(batch)
+        self.stdout.write(f"Created {len(rooms):,} chat rooms and {message_count:,} messages.")
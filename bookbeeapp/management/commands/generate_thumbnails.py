@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from bookbeeapp.images import generate_thumbnails
+from bookbeeapp.models import Book
+
+
+class Command(BaseCommand):
+    help = "Generate cover thumbnails for books that don't have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Regenerate thumbnails for every book.")
+
+    def handle(self, *args, **options):
+        books = Book.objects.exclude(image='').only('id', 'image')
+        if not options['all']:
+            books = books.filter(thumbnails_ready=False)
+
+        done = failed = 0
+        for book in books.iterator(chunk_size=200):
+            try:
+                generate_thumbnails(book)
+                done += 1
+            except (OSError, ValueError) as e:
+                failed += 1
+                self.stderr.write(f"Book {book.pk}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(f"Generated thumbnails for {done} books ({failed} failed). 🖼️"))
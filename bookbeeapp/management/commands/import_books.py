@@ -0,0 +1,44 @@
+from contextlib import ExitStack
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from bookbeeapp.importer import BATCH_SIZE, FORMATS, ImportFileError, detect_format, import_books
+
+
+class Command(BaseCommand):
+    help = (
+        "List many books at once for one seller from a CSV or JSON Lines file (BookForm fields, "
+        "`image` naming a cover in --covers). Rows are validated like the add-book form; bad rows "
+        "are reported and skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('listings', help="CSV (with a header row) or .jsonl file.")
+        parser.add_argument('--owner', required=True, help="Username the books are listed under.")
+        parser.add_argument('--covers', help="Zip of cover images.")
+        parser.add_argument('--format', choices=FORMATS, help="Listings format (default: from the file extension).")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Only validate; nothing is saved.")
+
+    def handle(self, *args, **options):
+        owner = User.objects.filter(username=options['owner']).first()
+        if owner is None:
+            raise CommandError(f"No user called {options['owner']!r}.")
+
+        try:
+            fmt = options['format'] or detect_format(options['listings'])
+            with ExitStack() as stack:
+                listings = stack.enter_context(open(options['listings'], 'rb'))
+                covers = stack.enter_context(open(options['covers'], 'rb')) if options['covers'] else None
+                result = import_books(
+                    owner, listings, fmt, covers,
+                    batch_size=options['batch_size'],
+                    dry_run=options['dry_run'],
+                    on_error=lambda line, message: self.stderr.write(f"Line {line}: {message}"),
+                )
+        except (OSError, ImportFileError) as e:
+            raise CommandError(str(e))
+
+        verb = "would be listed" if options['dry_run'] else "listed"
+        self.stdout.write(self.style.SUCCESS(f"{result.created} books {verb}, {result.failed} rows skipped. 📚"))
@@ -0,0 +1,57 @@
+import csv
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from bookbeeapp.geo import encode
+from bookbeeapp import pagecache
+from bookbeeapp.models import Book, Pincode
+
+DEFAULT_CSV = Path(__file__).resolve().parents[2] / 'data' / 'pincodes.csv'
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "Load a pincode,city,latitude,longitude CSV into the Pincode table and re-geocode books."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=str(DEFAULT_CSV), help="CSV file to load (default: the bundled one).")
+
+    def handle(self, *args, **options):
+        loaded = 0
+        with open(options['file'], newline='') as f:
+            batch = []
+            for row in csv.DictReader(f):
+                batch.append(Pincode(
+                    pincode=row['pincode'].strip(),
+                    city=row.get('city', '').strip(),
+                    latitude=float(row['latitude']),
+                    longitude=float(row['longitude']),
+                ))
+                if len(batch) >= BATCH_SIZE:
+                    loaded += self._upsert(batch)
+                    batch = []
+            loaded += self._upsert(batch)
+
+        # Only pincodes that books actually use need re-geocoding
+        places = Pincode.objects.filter(pincode__in=Book.objects.values('pincode'))
+        for place in places:
+            Book.objects.filter(pincode=place.pincode).update(
+                latitude=place.latitude,
+                longitude=place.longitude,
+                geohash=encode(place.latitude, place.longitude),
+                updated_at=timezone.now(),
+            )
+        pagecache.invalidate()
+
+        self.stdout.write(self.style.SUCCESS(f"Loaded {loaded} pincodes. 📍"))
+
+    def _upsert(self, batch):
+        Pincode.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=['pincode'],
+            update_fields=['city', 'latitude', 'longitude'],
+        )
+        return len(batch)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from bookbeeapp import facets
+
+
+class Command(BaseCommand):
+    help = "Recount the browse facet counts (FacetCount) from the Book table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=None, help="Database alias to rebuild (default: the write database).")
+
+    def handle(self, *args, **options):
+        totals = facets.rebuild(using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f"Counted {sum(totals.values())} books in {len(totals)} facet cells. 🐝"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from bookbeeapp.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the book search index from the Book table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=None, help="Database alias to rebuild (default: the write database).")
+
+    def handle(self, *args, **options):
+        get_backend().rebuild(using=options['database'])
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt. 🐝"))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from bookbeeapp.models import UserCredit, UserProfile
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "Recompute every UserProfile.trust_score from UserCredit and fix any that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report profiles that are out of sync.")
+
+    def handle(self, *args, **options):
+        totals = (
+            UserCredit.objects.filter(receiver=OuterRef('user'))
+            .values('receiver')
+            .annotate(total=Sum('score'))
+            .values('total')
+        )
+        drifted = (
+            UserProfile.objects.annotate(actual=Coalesce(Subquery(totals), 0))
+            .exclude(trust_score=F('actual'))
+            .only('pk', 'trust_score')
+        )
+
+        fixed = 0
+        batch = []
+        for profile in drifted.iterator(chunk_size=BATCH_SIZE):
+            profile.trust_score = profile.actual
+            batch.append(profile)
+            if len(batch) >= BATCH_SIZE:
+                fixed += self._save(batch, options['dry_run'])
+                batch = []
+        fixed += self._save(batch, options['dry_run'])
+
+        verb = "would be fixed" if options['dry_run'] else "fixed"
+        self.stdout.write(self.style.SUCCESS(f"{fixed} trust scores {verb}. 🛡️"))
+
+    def _save(self, batch, dry_run):
+        if batch and not dry_run:
+            UserProfile.objects.bulk_update(batch, ['trust_score'])
+        return len(batch)
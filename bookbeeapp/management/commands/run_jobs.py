@@ -0,0 +1,55 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from bookbeeapp import jobs
+
+
+def _run_in_thread(job_id):
+    close_old_connections()
+    try:
+        return jobs.run(job_id)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (verification emails, etc.)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2, help="Jobs run at the same time (default 2).")
+        parser.add_argument('--poll', type=float, default=2.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Exit as soon as no jobs are due.")
+
+    def handle(self, *args, **options):
+        concurrency = max(options['concurrency'], 1)
+        done = failed = 0
+        running = set()
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='jobs') as pool:
+            try:
+                while True:
+                    # Top up to `concurrency` jobs as soon as any slot frees, rather than
+                    # waiting for a whole batch (and its slowest job) to finish
+                    free = concurrency - len(running)
+                    if free:
+                        jobs.requeue_stale()
+                        running.update(pool.submit(_run_in_thread, job_id) for job_id in jobs.claim(free))
+                    if not running:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll'])
+                        continue
+
+                    # Wake up for a finished job, or after `poll` to look for newly due ones
+                    finished, running = wait(running, timeout=options['poll'], return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        ok = future.result()
+                        done += ok
+                        failed += not ok
+            except KeyboardInterrupt:
+                pass
+
+        self.stdout.write(self.style.SUCCESS(f"Jobs finished: {done} succeeded, {failed} failed. 🐝"))
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+
+FTS_TABLE = "bookbeeapp_book_fts"
+
+
+def create_fts_index(apps, schema_editor):
+    # FTS5 is SQLite-only; other databases use BasicSearchBackend
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "title, author, description, genre, location, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE} (rowid, title, author, description, genre, location) "
+        "SELECT id, COALESCE(title, ''), COALESCE(author, ''), COALESCE(description, ''), "
+        "COALESCE(genre, ''), COALESCE(location, '') FROM bookbeeapp_book"
+    )
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bookbeeapp", "0009_alter_book_author_alter_book_price_and_more"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:13
+
+import csv
+from pathlib import Path
+
+from django.db import migrations, models
+
+from bookbeeapp.geo import encode
+
+PINCODES_CSV = Path(__file__).resolve().parent.parent / "data" / "pincodes.csv"
+
+
+def load_pincodes(apps, schema_editor):
+    Pincode = apps.get_model("bookbeeapp", "Pincode")
+    Book = apps.get_model("bookbeeapp", "Book")
+
+    with open(PINCODES_CSV, newline="") as f:
+        places = [
+            Pincode(
+                pincode=row["pincode"],
+                city=row["city"],
+                latitude=float(row["latitude"]),
+                longitude=float(row["longitude"]),
+            )
+            for row in csv.DictReader(f)
+        ]
+    Pincode.objects.bulk_create(places, ignore_conflicts=True)
+
+    # Geocode books that already exist
+    for place in places:
+        Book.objects.filter(pincode=place.pincode).update(
+            latitude=place.latitude,
+            longitude=place.longitude,
+            geohash=encode(place.latitude, place.longitude),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bookbeeapp", "0010_book_search_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Pincode",
+            fields=[
+                (
+                    "pincode",
+                    models.CharField(max_length=6, primary_key=True, serialize=False),
+                ),
+                ("city", models.CharField(blank=True, max_length=100)),
+                ("latitude", models.FloatField()),
+                ("longitude", models.FloatField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="geohash",
+            field=models.CharField(blank=True, db_index=True, max_length=12),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="latitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="longitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(load_pincodes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:19
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_trust_scores(apps, schema_editor):
+    UserProfile = apps.get_model("bookbeeapp", "UserProfile")
+    UserCredit = apps.get_model("bookbeeapp", "UserCredit")
+
+    totals = (
+        UserCredit.objects.filter(receiver=OuterRef("user"))
+        .values("receiver")
+        .annotate(total=Sum("score"))
+        .values("total")
+    )
+    UserProfile.objects.update(trust_score=Coalesce(Subquery(totals), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bookbeeapp", "0011_book_geo_pincode"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userprofile",
+            name="trust_score",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_trust_scores, migrations.RunPython.noop),
+    ]
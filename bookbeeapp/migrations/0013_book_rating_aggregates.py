@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:20
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_ratings(apps, schema_editor):
+    Book = apps.get_model("bookbeeapp", "Book")
+    Review = apps.get_model("bookbeeapp", "Review")
+
+    stats = Review.objects.values("book").annotate(
+        count=Count("id"), total=Sum("rating")
+    )
+    for row in stats:
+        Book.objects.filter(pk=row["book"]).update(
+            review_count=row["count"],
+            rating_sum=row["total"],
+            avg_rating=row["total"] / row["count"],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bookbeeapp", "0012_userprofile_trust_score"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="avg_rating",
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rating_sum",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="review_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
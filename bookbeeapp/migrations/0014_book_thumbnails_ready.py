@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bookbeeapp", "0013_book_rating_aggregates"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="thumbnails_ready",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bookbeeapp", "0015_job"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(fields=["-created_at", "-id"], name="book_feed_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["-avg_rating", "-review_count", "-id"],
+                name="book_rating_feed_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["genre", "-created_at", "-id"], name="book_genre_feed_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                condition=models.Q(("status", "AVAILABLE")),
+                fields=["-created_at", "-id"],
+                name="book_available_feed_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["owner", "-created_at"], name="book_owner_listing_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(fields=["pincode"], name="book_pincode_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["buyer", "seller"], name="order_buyer_seller_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["buyer", "book"], name="order_buyer_book_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="usercredit",
+            index=models.Index(fields=["giver", "receiver"], name="credit_pair_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="usercredit",
+            index=models.Index(
+                fields=["receiver", "-created_at"], name="credit_received_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:41
+
+from collections import Counter
+
+from django.db import migrations, models
+
+from bookbeeapp.facets import price_band
+
+
+def count_existing_books(apps, schema_editor):
+    Book = apps.get_model("bookbeeapp", "Book")
+    FacetCount = apps.get_model("bookbeeapp", "FacetCount")
+    totals = Counter()
+    grouped = (
+        Book.objects.values_list("genre", "status", "transaction_type", "price")
+        .annotate(n=models.Count("id"))
+        .order_by()
+    )
+    for genre, status, transaction_type, price, n in grouped:
+        totals[(genre, status, transaction_type, price_band(price))] += n
+    FacetCount.objects.bulk_create(
+        FacetCount(genre=g, status=s, transaction_type=t, price_band=b, count=n)
+        for (g, s, t, b), n in totals.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bookbeeapp", "0017_book_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FacetCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("genre", models.CharField(max_length=50)),
+                ("status", models.CharField(max_length=10)),
+                ("transaction_type", models.CharField(max_length=10)),
+                ("price_band", models.CharField(max_length=20)),
+                ("count", models.IntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("genre", "status", "transaction_type", "price_band"),
+                        name="facet_count_cell_unique",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(count_existing_books, migrations.RunPython.noop),
+    ]
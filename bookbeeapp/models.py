@@ -1,7 +1,13 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 import re  
 
+from .geo import encode
+
+# A 6-digit Indian pincode anywhere in a free-text location
+PINCODE_PATTERN = re.compile(r'\b\d{6}\b')
+
 class Book(models.Model):
     STATUS_CHOICES = [('AVAILABLE', 'Available'), ('LENDED', 'Lended'), ('SOLD', 'Sold')]
     TRANSACTION_CHOICES = [('rent', 'For Rent'), ('buy', 'For Sale')]
@@ -24,12 +30,17 @@ class Book(models.Model):
     title = models.CharField(max_length=200)
     author = models.CharField(max_length=200,blank=True,null=True)
     image = models.ImageField(upload_to='book_covers/')
+    # Set once bookbeeapp/images.py has written the resized covers
+    thumbnails_ready = models.BooleanField(default=False)
     price = models.DecimalField(max_digits=6, decimal_places=2, help_text="Rent per 2 weeks or Sale price")
     security_amount = models.DecimalField(max_digits=6, decimal_places=2, default=0.00, blank=True, null=True)
     
     # Location & Pincode
     location = models.CharField(max_length=150)
     pincode = models.CharField(max_length=6, blank=True)
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True)
     
     description = models.TextField(blank=True, null=True)
     
@@ -41,18 +52,66 @@ class Book(models.Model):
     
     # Availability Flag
     is_available = models.BooleanField(default=True)
+
+    # Review aggregates, kept up to date by bookbeeapp/signals.py
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    avg_rating = models.FloatField(default=0)
     
     created_at = models.DateTimeField(auto_now_add=True)
+    # Part of the cached feed card's key, so every write to a book must bump it,
+    # including bulk .update() calls (which skip auto_now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Home feed sort orders, walked in keyset pages (bookbeeapp/pagination.py)
+            models.Index(fields=['-created_at', '-id'], name='book_feed_idx'),
+            models.Index(fields=['-avg_rating', '-review_count', '-id'], name='book_rating_feed_idx'),
+            models.Index(fields=['genre', '-created_at', '-id'], name='book_genre_feed_idx'),
+            # "Available now" feed: only the rows that can still be borrowed or bought
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(status='AVAILABLE'),
+                name='book_available_feed_idx',
+            ),
+            # A user's own listings, newest first (profile pages)
+            models.Index(fields=['owner', '-created_at'], name='book_owner_listing_idx'),
+            # Re-geocoding after load_pincodes
+            models.Index(fields=['pincode'], name='book_pincode_idx'),
+        ]
+
+    # Fields that decide which bookbeeapp/facets.py cell a book counts in
+    FACET_FIELDS = ('genre', 'status', 'transaction_type', 'price')
 
     def __str__(self):
         return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        book = super().from_db(db, field_names, values)
+        # Remember the facet values as loaded so a later save can move the book's count out of the old cell
+        if not book.get_deferred_fields().intersection(cls.FACET_FIELDS):
+            book._loaded_facets = book.facet_values()
+        return book
+
+    def facet_values(self):
+        return tuple(getattr(self, field) for field in self.FACET_FIELDS)
+
+    @staticmethod
+    def pincode_in(location):
+        match = PINCODE_PATTERN.search(location or '')
+        return match.group() if match else None
     
     # Auto-Extract Pincode Logic
     def save(self, *args, **kwargs):
         # Look for a 6-digit number in the location string
-        match = re.search(r'\b\d{6}\b', self.location)
-        if match:
-            self.pincode = match.group()
+        pincode = self.pincode_in(self.location)
+        if pincode:
+            self.pincode = pincode
+
+        # Geocode the pincode so the book shows up in "near me" searches
+        self.latitude, self.longitude, self.geohash = Pincode.locate(self.pincode)
         
         # Auto-update status based on is_available
         if not self.is_available:
@@ -64,6 +123,33 @@ class Book(models.Model):
         super().save(*args, **kwargs)
 
 
+class Pincode(models.Model):
+    """Offline pincode -> coordinates table, loaded from bookbeeapp/data/pincodes.csv."""
+    pincode = models.CharField(max_length=6, primary_key=True)
+    city = models.CharField(max_length=100, blank=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+
+    def __str__(self):
+        return f"{self.pincode} ({self.city})"
+
+    @classmethod
+    def locate(cls, pincode):
+        """(latitude, longitude, geohash) for a pincode, or (None, None, '') if unknown."""
+        place = cls.objects.filter(pk=pincode).first() if pincode else None
+        if place is None:
+            return None, None, ''
+        return place.latitude, place.longitude, encode(place.latitude, place.longitude)
+
+    @classmethod
+    def locate_many(cls, pincodes):
+        """{pincode: (latitude, longitude, geohash)} for the known ones among `pincodes`, in one query."""
+        return {
+            place.pincode: (place.latitude, place.longitude, encode(place.latitude, place.longitude))
+            for place in cls.objects.filter(pk__in=set(pincodes))
+        }
+
+
 class Review(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
@@ -80,6 +166,8 @@ class Cart(models.Model):
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     avatar = models.CharField(max_length=100, blank=True, null=True)
+    # Sum of UserCredit.score received; kept up to date by bookbeeapp/signals.py
+    trust_score = models.IntegerField(default=0)
 
     def __str__(self):
         return self.user.username
@@ -91,6 +179,14 @@ class UserCredit(models.Model):
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # "Has this user already vouched for them?"
+            models.Index(fields=['giver', 'receiver'], name='credit_pair_idx'),
+            # Latest credits on a public profile
+            models.Index(fields=['receiver', '-created_at'], name='credit_received_idx'),
+        ]
+
     def __str__(self):
         return f"{self.giver.username} -> {self.receiver.username}"
     
@@ -100,5 +196,59 @@ class Order(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # "Have these two users traded?" (checked in both directions)
+            models.Index(fields=['buyer', 'seller'], name='order_buyer_seller_idx'),
+            # "Has this user bought/borrowed this book?" before reviewing
+            models.Index(fields=['buyer', 'book'], name='order_buyer_book_idx'),
+            # Date-range exports (bookbeeapp/exports.py): a seller's sales, and every order for staff
+            models.Index(fields=['seller', 'created_at'], name='order_seller_history_idx'),
+            models.Index(fields=['created_at', 'id'], name='order_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.buyer.username} bought {self.book.title} from {self.seller.username}"
+
+
+class Job(models.Model):
+    """Background work queued by the site and run by `manage.py run_jobs` (see bookbeeapp/jobs.py)."""
+    STATUS_CHOICES = [('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Workers poll for "queued and due", oldest first
+            models.Index(fields=['status', 'run_at'], name='job_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+class FacetCount(models.Model):
+    """Number of books per (genre, status, transaction type, price band), kept current by bookbeeapp/facets.py."""
+    genre = models.CharField(max_length=50)
+    status = models.CharField(max_length=10)
+    transaction_type = models.CharField(max_length=10)
+    price_band = models.CharField(max_length=20)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['genre', 'status', 'transaction_type', 'price_band'], name='facet_count_cell_unique',
+            ),
+        ]
+
     def __str__(self):
-        return f"{self.buyer.username} bought {self.book.title} from {self.seller.username}"
\ No newline at end of file
+        return f"{self.genre} / {self.status} / {self.transaction_type} / {self.price_band}: {self.count}"
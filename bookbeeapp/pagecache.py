@@ -0,0 +1,118 @@
+"""
+Whole-page cache for logged-out visitors.
+
+The feed and search pages look the same for every anonymous visitor, so
+@cache_anonymous_page stores the rendered response in the "pages" cache
+(settings.CACHES, backend picked by PAGE_CACHE_BACKEND) for
+PAGE_CACHE_TTL seconds.
+
+- Keys include a generation number. invalidate() bumps it whenever a book
+  changes, which retires every cached page at once without having to know
+  which pages showed that book.
+- On a miss only one request renders the page (a cache.add() lock); others
+  asking for the same page wait briefly for its result instead of all
+  hitting the database together.
+- Requests carrying a session or messages cookie always go to the view:
+  those visitors are logged in or have a flash message waiting.
+"""
+import hashlib
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+GENERATION_KEY = 'page:generation'
+LOCK_TIMEOUT = 10  # seconds a renderer may hold the lock
+LOCK_WAIT = 2.0  # seconds other requests wait for it before rendering themselves
+LOCK_POLL = 0.05
+
+
+def page_cache():
+    return caches[settings.PAGE_CACHE_ALIAS]
+
+
+def _fresh_generation():
+    # Never reuse a number, even if the cache lost the counter
+    return int(time.time() * 1000)
+
+
+def generation():
+    cache = page_cache()
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        cache.add(GENERATION_KEY, _fresh_generation(), None)
+        value = cache.get(GENERATION_KEY)
+    return value
+
+
+def _bump():
+    cache = page_cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, _fresh_generation(), None)
+
+
+def invalidate():
+    """Retire every cached page once the current transaction commits."""
+    transaction.on_commit(_bump)
+
+
+def page_key(request):
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    digest = hashlib.md5(f'{request.path}?{query}'.encode()).hexdigest()
+    return f'page:{generation()}:{digest}'
+
+
+def _cacheable_request(request):
+    return (
+        request.method == 'GET'
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and 'messages' not in request.COOKIES
+    )
+
+
+def _cacheable_response(response):
+    return response.status_code == 200 and not response.streaming and not response.cookies
+
+
+def _render_once(cache, key, render):
+    """(response, was_cached) with at most one concurrent render per key."""
+    lock = f'{key}:lock'
+    if cache.add(lock, 1, LOCK_TIMEOUT):
+        try:
+            response = render()
+            if _cacheable_response(response):
+                cache.set(key, response, settings.PAGE_CACHE_TTL)
+            return response, False
+        finally:
+            cache.delete(lock)
+
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL)
+        response = cache.get(key)
+        if response is not None:
+            return response, True
+    # The other render is slow or failed; don't keep this visitor waiting on it
+    return render(), False
+
+
+def cache_anonymous_page(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not _cacheable_request(request):
+            return view(request, *args, **kwargs)
+
+        cache = page_cache()
+        key = page_key(request)
+        response = cache.get(key)
+        was_cached = response is not None
+        if not was_cached:
+            response, was_cached = _render_once(cache, key, lambda: view(request, *args, **kwargs))
+        response['X-Page-Cache'] = 'hit' if was_cached else 'miss'
+        return response
+    return wrapper
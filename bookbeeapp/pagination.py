@@ -0,0 +1,117 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of OFFSET, each page remembers the sort key of its last row and the
+next page asks for rows strictly "after" it. The database walks the index
+from that point, so page 500 costs the same as page 1.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps([None if v is None else str(v) for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _load(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, TypeError):
+        raise InvalidCursor(token)
+    if not isinstance(values, list):
+        raise InvalidCursor(token)
+    return values
+
+
+def decode_cursor(token, model, ordering):
+    values = _load(token)
+    if len(values) != len(ordering):
+        raise InvalidCursor(token)
+
+    decoded = []
+    for name, value in zip(_field_names(ordering), values):
+        try:
+            decoded.append(model._meta.get_field(name).to_python(value))
+        except ValidationError:
+            raise InvalidCursor(token)
+    return decoded
+
+
+def decode_offset(token):
+    """Offset cursors are only used for ranked results (search), which have no stable sort key."""
+    values = _load(token)
+    try:
+        offset = int(values[0])
+    except (IndexError, TypeError, ValueError):
+        raise InvalidCursor(token)
+    if offset < 0:
+        raise InvalidCursor(token)
+    return offset
+
+
+def _field_names(ordering):
+    return [o.lstrip('-') for o in ordering]
+
+
+def _after(ordering, values):
+    """
+    Build "row comes after (values)" for a composite sort key, e.g. for
+    ('-created_at', '-id'):  created_at < v0  OR  (created_at = v0 AND id < v1)
+    """
+    condition = Q()
+    names = _field_names(ordering)
+    for i, order in enumerate(ordering):
+        lookup = 'lt' if order.startswith('-') else 'gt'
+        branch = Q(**{f'{names[i]}__{lookup}': values[i]})
+        for j in range(i):
+            branch &= Q(**{names[j]: values[j]})
+        condition |= branch
+    return condition
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_paginate(queryset, cursor=None, per_page=24, ordering=('-created_at', '-id')):
+    """
+    Return one KeysetPage of `queryset` sorted by `ordering`.
+
+    The last entry of `ordering` must be unique (normally the pk) so that
+    rows sharing the same timestamp are never skipped or repeated.
+    Raises InvalidCursor if `cursor` was tampered with.
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        values = decode_cursor(cursor, queryset.model, ordering)
+        queryset = queryset.filter(_after(ordering, values))
+
+    # Fetch one extra row to know whether another page exists
+    rows = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, name) for name in _field_names(ordering)])
+    return KeysetPage(rows, next_cursor)
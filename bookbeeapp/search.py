@@ -0,0 +1,169 @@
+"""
+Book search.
+
+Searching goes through a backend chosen by settings.BOOK_SEARCH_BACKEND so the
+SQLite full-text index can be swapped out (e.g. for PostgreSQL) without
+touching the views. Backends keep their index in sync from the Book
+save/delete signals in bookbeeapp/signals.py.
+"""
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Book
+from .pagination import KeysetPage, decode_offset, encode_cursor
+
+FTS_TABLE = 'bookbeeapp_book_fts'
+INDEXED_FIELDS = ['title', 'author', 'description', 'genre', 'location']
+
+# Relevance weight per column for bm25(): a hit in the title counts most
+FTS_WEIGHTS = (10.0, 5.0, 1.0, 3.0, 3.0)
+
+
+def tokenize(query):
+    return re.findall(r'\w+', query or '')
+
+
+class BaseSearchBackend:
+    """
+    Substring search straight on the Book table, with nothing to keep in
+    sync. Backends with an index override index()/remove()/rebuild() as
+    well as search().
+    """
+
+    def index(self, book, using=None):
+        pass
+
+    def index_many(self, books, using=None):
+        for book in books:
+            self.index(book, using=using)
+
+    def remove(self, book_id, using=None):
+        pass
+
+    def rebuild(self, using=None):
+        pass
+
+    def search(self, query, limit, offset=0, queryset=None):
+        """
+        Return the ids of matching books, best match first (here: newest
+        first), only counting books in `queryset` if one is given.
+        """
+        condition = Q()
+        for term in tokenize(query):
+            term_match = Q()
+            for field in INDEXED_FIELDS:
+                term_match |= Q(**{f'{field}__icontains': term})
+            condition &= term_match
+        if not condition:
+            return []
+        books = (queryset if queryset is not None else Book.objects.all()).filter(condition)
+        books = books.order_by('-created_at', '-id')
+        return list(books.values_list('id', flat=True)[offset:offset + limit])
+
+
+class BasicSearchBackend(BaseSearchBackend):
+    """The base substring search. Needs no index; fine for small or non-SQLite setups."""
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    SQLite FTS5 inverted index over title, author, description, genre and
+    location. Rows share the Book id as their rowid, results are ranked
+    with bm25() and every search term is treated as a prefix so
+    search-as-you-type works.
+    """
+
+    def _row(self, book):
+        return [book.pk] + [getattr(book, field) or '' for field in INDEXED_FIELDS]
+
+    def index(self, book, using=None):
+        using = using or router.db_for_write(Book)
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [book.pk])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(INDEXED_FIELDS)}) VALUES (%s, %s, %s, %s, %s, %s)',
+                self._row(book),
+            )
+
+    def index_many(self, books, using=None):
+        """index() for a whole batch in two statements (bulk imports)."""
+        if not books:
+            return
+        using = using or router.db_for_write(Book)
+        placeholders = ', '.join(['%s'] * len(books))
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', [book.pk for book in books])
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(INDEXED_FIELDS)}) VALUES (%s, %s, %s, %s, %s, %s)',
+                [self._row(book) for book in books],
+            )
+
+    def remove(self, book_id, using=None):
+        using = using or router.db_for_write(Book)
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [book_id])
+
+    def rebuild(self, using=None):
+        using = using or router.db_for_write(Book)
+        columns = ', '.join(INDEXED_FIELDS)
+        source = ', '.join(f"COALESCE({field}, '')" for field in INDEXED_FIELDS)
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, {columns}) '
+                f'SELECT id, {source} FROM {Book._meta.db_table}'
+            )
+
+    def match_expression(self, query):
+        # Quote every term so user input can never be parsed as FTS syntax
+        return ' '.join('"%s"*' % term for term in tokenize(query))
+
+    def search(self, query, limit, offset=0, queryset=None):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+        condition, params = f'{FTS_TABLE} MATCH %s', [expression]
+        if queryset is not None:
+            # Filter before LIMIT/OFFSET, so every page is a full page of books that qualify
+            candidates, candidate_params = queryset.order_by().values('id').query.sql_with_params()
+            condition += f' AND rowid IN ({candidates})'
+            params += candidate_params
+        using = queryset.db if queryset is not None else router.db_for_read(Book)
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {condition} '
+                f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s OFFSET %s',
+                params + [limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(settings.BOOK_SEARCH_BACKEND)()
+
+
+def search_books(query, limit=50, offset=0, queryset=None):
+    """Matching Book objects in relevance order, optionally restricted to `queryset`."""
+    ids = get_backend().search(query, limit, offset, queryset=queryset)
+    books = (queryset if queryset is not None else Book.objects.all()).in_bulk(ids)
+    return [books[pk] for pk in ids if pk in books]
+
+
+def search_page(query, cursor=None, per_page=24, queryset=None):
+    """One page of ranked results, shaped like a keyset page so the feed can use either."""
+    offset = decode_offset(cursor) if cursor else 0
+    ids = get_backend().search(query, per_page + 1, offset, queryset=queryset)
+    next_cursor = None
+    if len(ids) > per_page:
+        ids = ids[:per_page]
+        next_cursor = encode_cursor([offset + per_page])
+
+    books = (queryset if queryset is not None else Book.objects.all()).in_bulk(ids)
+    return KeysetPage([books[pk] for pk in ids if pk in books], next_cursor)
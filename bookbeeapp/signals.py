@@ -0,0 +1,125 @@
+from collections import Counter
+
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import Case, F, FloatField, When
+from django.db.models.functions import Cast
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import facets, pagecache
+from .models import Book, Review, UserCredit, UserProfile
+from .search import get_backend
+
+
+# --- SEARCH INDEX ---
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, using, **kwargs):
+    get_backend().index(instance, using=using)
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, using, **kwargs):
+    get_backend().remove(instance.pk, using=using)
+
+
+# --- FEED CARD CACHE ---
+# partials/book_cards.html caches each card under (pk, updated_at). Every
+# write moves updated_at, so a changed book always renders under a new key;
+# these receivers just drop the stale fragment instead of letting it expire.
+def book_card_key(book):
+    return make_template_fragment_key('book_card', [book.pk, book.updated_at])
+
+
+@receiver(pre_save, sender=Book)
+def uncache_old_book_card(sender, instance, **kwargs):
+    # auto_now hasn't run yet, so updated_at is still the value the old card was keyed on
+    if instance.pk and instance.updated_at:
+        cache.delete(book_card_key(instance))
+
+
+@receiver(post_delete, sender=Book)
+def uncache_book_card(sender, instance, **kwargs):
+    cache.delete(book_card_key(instance))
+
+
+# --- ANONYMOUS PAGE CACHE ---
+# Bulk updates that skip these signals call pagecache.invalidate() themselves
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_pages(sender, **kwargs):
+    pagecache.invalidate()
+
+
+# --- FACET COUNTS ---
+# checkout_cart() updates book statuses in bulk and applies its own deltas
+@receiver(pre_save, sender=Book)
+def remember_facet_cell(sender, instance, using, **kwargs):
+    instance._facet_cell_before = facets.loaded_cell(instance, using=using)
+
+
+@receiver(post_save, sender=Book)
+def count_book_facets(sender, instance, created, using, **kwargs):
+    facets.move(None if created else instance._facet_cell_before, facets.cell_for(instance), using=using)
+    instance._loaded_facets = instance.facet_values()
+
+
+@receiver(post_delete, sender=Book)
+def uncount_book_facets(sender, instance, using, **kwargs):
+    values = getattr(instance, '_loaded_facets', None) or instance.facet_values()
+    facets.apply(Counter({facets.cell(*values): -1}), using=using)
+
+
+# --- RATINGS ---
+def _add_rating(book_id, count, rating):
+    # Every right-hand side sees the row's old values, so the new average is
+    # (old sum + rating) / (old count + count)
+    new_count = F('review_count') + count
+    new_sum = F('rating_sum') + rating
+    Book.objects.filter(pk=book_id).update(
+        review_count=new_count,
+        rating_sum=new_sum,
+        avg_rating=Case(
+            When(review_count=-count, then=0.0),
+            default=Cast(new_sum, FloatField()) / new_count,
+            output_field=FloatField(),
+        ),
+        updated_at=timezone.now(),
+    )
+    pagecache.invalidate()
+
+
+@receiver(post_save, sender=Review)
+def add_review_rating(sender, instance, created, **kwargs):
+    if created:
+        _add_rating(instance.book_id, 1, int(instance.rating))
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_rating(sender, instance, **kwargs):
+    _add_rating(instance.book_id, -1, -int(instance.rating))
+
+
+# --- TRUST SCORE ---
+def _add_trust(user_id, delta):
+    if UserProfile.objects.filter(user_id=user_id).update(trust_score=F('trust_score') + delta):
+        return
+    # No profile yet: only a gain creates one. A loss would start it below zero,
+    # and when the user is being deleted the new row would outlive them.
+    if delta > 0:
+        _, created = UserProfile.objects.get_or_create(user_id=user_id, defaults={'trust_score': delta})
+        if not created:
+            # Someone else created the profile in between
+            UserProfile.objects.filter(user_id=user_id).update(trust_score=F('trust_score') + delta)
+
+
+@receiver(post_save, sender=UserCredit)
+def add_trust_score(sender, instance, created, **kwargs):
+    if created:
+        _add_trust(instance.receiver_id, instance.score)
+
+
+@receiver(post_delete, sender=UserCredit)
+def remove_trust_score(sender, instance, **kwargs):
+    _add_trust(instance.receiver_id, -instance.score)
@@ -0,0 +1,23 @@
+from django import template
+
+from bookbeeapp.images import THUMBNAIL_WIDTHS, thumbnail_name
+
+register = template.Library()
+
+
+@register.filter
+def cover_srcset(book, ext='jpg'):
+    """srcset value listing every thumbnail width of a book cover."""
+    storage = book.image.storage
+    return ', '.join(
+        f'{storage.url(thumbnail_name(book.image.name, width, ext))} {width}w'
+        for width in THUMBNAIL_WIDTHS
+    )
+
+
+@register.filter
+def cover_thumb(book, width=THUMBNAIL_WIDTHS[0]):
+    """URL of one JPEG thumbnail, falling back to the original while thumbnails are pending."""
+    if not book.thumbnails_ready:
+        return book.image.url
+    return book.image.storage.url(thumbnail_name(book.image.name, int(width), 'jpg'))
@@ -1,3 +1,1454 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+import zipfile
+from importlib import import_module
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import Count, Sum
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from bookbeeproject.db_router import PIN_COOKIE, PrimaryReplicaRouter, replica_reads
+from chat.models import ChatRoom, Message, UnreadCounter
+from . import exports, facets, instrumentation, jobs, pagecache
+from .checkout import CheckoutError, checkout_cart
+from .images import THUMBNAIL_WIDTHS, generate_thumbnails, thumbnail_name
+from .models import Book, Cart, FacetCount, Job, Order, Pincode, Review, UserCredit, UserProfile
+from .pagination import encode_cursor
+from .search import FTS_TABLE, BaseSearchBackend, BasicSearchBackend, SQLiteFTSBackend, search_books
+from .signals import book_card_key
+from .views import FEED_PAGE_SIZE
+from .templatetags.book_images import cover_srcset
+
+# A plan step that reads the whole table instead of going through an index
+FULL_SCAN = re.compile(r'^SCAN (\S+)$')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Reads SQLite EXPLAIN QUERY PLAN output')
+class HotQueryIndexTests(TestCase):
+    """Every query behind the busiest pages must be answered from an index, not a table scan."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader')
+        cls.seller = User.objects.create_user('seller')
+        UserProfile.objects.create(user=cls.reader)
+        UserProfile.objects.create(user=cls.seller)
+
+        cls.books = [
+            Book.objects.create(
+                owner=cls.seller, title=f'Book {i}', price=100, location='Mumbai 400001',
+                genre='Fiction' if i % 2 else 'Mystery',
+            )
+            for i in range(4)
+        ]
+        Order.objects.create(buyer=cls.reader, seller=cls.seller, book=cls.books[0])
+        UserCredit.objects.create(giver=cls.reader, receiver=cls.seller, message='Smooth trade')
+        Cart.objects.create(user=cls.reader).items.add(cls.books[1])
+
+        cls.room = ChatRoom.objects.room_for(cls.reader.id, cls.seller.id)
+        Message.objects.create(room=cls.room, sender=cls.seller, text='Still available!')
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def query_plans(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertLess(response.status_code, 400, url)
+
+        plans = []
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plans.append((sql, [row[3] for row in cursor.fetchall()]))
+        return plans
+
+    def assertNoFullScans(self, url):
+        for sql, plan in self.query_plans(url):
+            scans = [step for step in plan if FULL_SCAN.match(step)]
+            self.assertFalse(scans, f'{url} scans a whole table:\n{sql}\n{plan}')
+
+    def assertUsesIndex(self, url, index_name):
+        steps = [step for _, plan in self.query_plans(url) for step in plan]
+        self.assertTrue(
+            any(f'INDEX {index_name}' in step for step in steps),
+            f'{url} does not use {index_name}:\n' + '\n'.join(steps),
+        )
+
+    def test_hot_pages_use_indexes(self):
+        urls = [
+            reverse('home'),
+            reverse('home') + '?sort=rating',
+            reverse('home') + '?genre=Fiction',
+            reverse('home') + '?available=1',
+            reverse('home_feed') + '?near=400001&km=10',
+            reverse('book_list') + '?q=book',
+            reverse('book_detail', args=[self.books[0].pk]),
+            reverse('cart_view'),
+            reverse('profile'),
+            reverse('public_profile', args=['seller']),
+            reverse('chat_list'),
+            reverse('chat_room', args=[self.room.id]),
+            reverse('room_messages', args=[self.room.id]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertNoFullScans(url)
+
+    def test_feeds_walk_their_sort_index(self):
+        self.assertUsesIndex(reverse('home'), 'book_feed_idx')
+        self.assertUsesIndex(reverse('home') + '?sort=rating', 'book_rating_feed_idx')
+        self.assertUsesIndex(reverse('home') + '?genre=Fiction', 'book_genre_feed_idx')
+        self.assertUsesIndex(reverse('home') + '?available=1', 'book_available_feed_idx')
+
+    def test_lookups_use_composite_indexes(self):
+        self.assertUsesIndex(reverse('book_detail', args=[self.books[0].pk]), 'order_buyer_book_idx')
+        self.assertUsesIndex(reverse('public_profile', args=['seller']), 'order_buyer_seller_idx')
+        self.assertUsesIndex(reverse('public_profile', args=['seller']), 'credit_received_idx')
+        self.assertUsesIndex(reverse('profile'), 'book_owner_listing_idx')
+        self.assertUsesIndex(reverse('chat_room', args=[self.room.id]), 'chat_msg_unread_idx')
+
+
+class NearbyFeedTests(TestCase):
+    def setUp(self):
+        pagecache.page_cache().clear()
+        owner = User.objects.create_user('owner')
+        # Fort (400001) and Bandra (400050) are ~13 km apart; Pune is ~120 km away
+        for title, location in (
+            ('Fort Poems', 'Fort, Mumbai 400001'),
+            ('Bandra Poems', 'Bandra West, Mumbai 400050'),
+            ('Pune Poems', 'Camp, Pune 411001'),
+        ):
+            Book.objects.create(owner=owner, title=title, price=100, location=location)
+
+    def titles(self, **params):
+        response = self.client.get(reverse('home_feed'), {'near': '400001', **params})
+        self.assertEqual(response.status_code, 200)
+        return {book['title'] for book in response.json()['books']}
+
+    def test_radius_limits_the_feed(self):
+        self.assertEqual(self.titles(km=5), {'Fort Poems'})
+        self.assertEqual(self.titles(km=25), {'Fort Poems', 'Bandra Poems'})
+        self.assertEqual(self.titles(km=500), {'Fort Poems', 'Bandra Poems'})  # capped at 100 km
+        self.assertEqual(self.titles(near='999999'), {'Fort Poems', 'Bandra Poems', 'Pune Poems'})
+
+    def test_unusable_radius_falls_back_to_10_km(self):
+        for km in ('nan', 'inf', '-inf', 'far'):
+            self.assertEqual(self.titles(km=km), {'Fort Poems'})
+        self.assertEqual(self.client.get(reverse('home'), {'near': '400001', 'km': 'nan'}).status_code, 200)
+
+    def test_search_within_a_radius(self):
+        self.assertEqual(self.titles(km=25, q='poems'), {'Fort Poems', 'Bandra Poems'})
+        self.assertEqual(self.titles(km=5, q='bandra'), set())
+
+    def test_filters_apply_before_search_results_are_paged(self):
+        owner = User.objects.get(username='owner')
+        # Far more (and better ranked) matches elsewhere than fit on one page
+        Book.objects.bulk_create([
+            Book(owner=owner, title='Poems', price=100, location='Delhi', latitude=28.6328, longitude=77.2197)
+            for _ in range(FEED_PAGE_SIZE * 2)
+        ])
+        call_command('rebuild_search_index', stdout=StringIO())
+
+        response = self.client.get(reverse('home_feed'), {'near': '411001', 'q': 'poems'})
+        self.assertEqual([book['title'] for book in response.json()['books']], ['Pune Poems'])
+        self.assertIsNone(response.json()['next_cursor'])
+
+        # Within 100 km of Mumbai: both Mumbai books, on one page
+        response = self.client.get(reverse('home_feed'), {'near': '400001', 'km': 100, 'q': 'poems'}).json()
+        self.assertEqual({book['title'] for book in response['books']}, {'Fort Poems', 'Bandra Poems'})
+        self.assertIsNone(response['next_cursor'])
+
+
+class FeedPaginationTests(TestCase):
+    def setUp(self):
+        pagecache.page_cache().clear()
+        owner = User.objects.create_user('owner')
+        Book.objects.bulk_create([
+            Book(owner=owner, title=f'Book {i}', price=100, location='Mumbai') for i in range(FEED_PAGE_SIZE * 2 + 5)
+        ])
+        # Every book shares one timestamp, so only the id keeps the order stable
+        Book.objects.update(created_at=timezone.now())
+
+    def walk(self, **params):
+        ids, cursor, pages = [], None, 0
+        while True:
+            response = self.client.get(reverse('home_feed'), {**params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            ids += [book['id'] for book in body['books']]
+            pages += 1
+            cursor = body['next_cursor']
+            if cursor is None:
+                return ids, pages
+
+    def test_tied_timestamps_are_neither_skipped_nor_repeated(self):
+        ids, pages = self.walk()
+        self.assertEqual(ids, list(Book.objects.order_by('-id').values_list('id', flat=True)))
+        self.assertEqual(pages, 3)
+
+    def test_last_page_has_no_cursor(self):
+        Book.objects.filter(pk__in=Book.objects.order_by('id').values('pk')[:5]).delete()
+        first = self.client.get(reverse('home_feed')).json()
+        self.assertEqual(len(first['books']), FEED_PAGE_SIZE)
+        second = self.client.get(reverse('home_feed'), {'cursor': first['next_cursor']}).json()
+        self.assertEqual(len(second['books']), FEED_PAGE_SIZE)
+        # Exactly two full pages: the second one must not promise a third
+        self.assertIsNone(second['next_cursor'])
+
+    def test_invalid_cursor_is_rejected(self):
+        good = self.client.get(reverse('home_feed')).json()['next_cursor']
+        for cursor in (
+            'not-a-cursor',
+            encode_cursor(['x']),                                 # wrong number of values
+            encode_cursor(['yesterday', '1']),                    # not a datetime
+            good[:-4],                                            # truncated
+            base64.urlsafe_b64encode(b'{"a": 1}').decode(),       # not a list
+        ):
+            response = self.client.get(reverse('home_feed'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+        # The page itself just starts over
+        self.assertEqual(self.client.get(reverse('home'), {'cursor': 'not-a-cursor'}).status_code, 200)
+
+    def test_html_fragment_carries_the_cursor_in_a_header(self):
+        data = self.client.get(reverse('home_feed')).json()
+        response = self.client.get(reverse('home_feed'), {'format': 'html'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+        self.assertEqual(response['X-Next-Cursor'], data['next_cursor'])
+        for book in data['books']:
+            self.assertContains(response, reverse('book_detail', args=[book['id']]))
+
+        # The last page sends an empty header, which ends the infinite scroll
+        cursor = data['next_cursor']
+        while cursor:
+            response = self.client.get(reverse('home_feed'), {'format': 'html', 'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            cursor = response['X-Next-Cursor']
+        self.assertEqual(response['X-Next-Cursor'], '')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'The FTS5 index only exists on SQLite')
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+
+    def add_book(self, title, **fields):
+        fields = {'price': 100, 'location': 'Pune', **fields}
+        return Book.objects.create(owner=self.owner, title=title, **fields)
+
+    def titles(self, query):
+        return [book.title for book in search_books(query)]
+
+    def indexed_rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {FTS_TABLE}')
+            return cursor.fetchone()[0]
+
+    def test_index_follows_saves_and_deletes(self):
+        book = self.add_book('Godaan', author='Premchand')
+        self.assertEqual(self.titles('godaan'), ['Godaan'])
+        self.assertEqual(self.titles('prem'), ['Godaan'])  # prefix match, for search-as-you-type
+
+        book.title = 'Nirmala'
+        book.save()
+        self.assertEqual(self.titles('godaan'), [])
+        self.assertEqual(self.titles('nirmala premchand'), ['Nirmala'])
+
+        book.delete()
+        self.assertEqual(self.titles('nirmala'), [])
+        self.assertEqual(self.indexed_rows(), 0)
+
+    def test_title_hits_rank_above_description_hits(self):
+        self.add_book('A Village Story', description='Set in the monsoon.')
+        self.add_book('Monsoon', description='A village story.')
+        self.add_book('Untitled', description='Monsoon, monsoon and more monsoon.')
+        self.assertEqual(self.titles('monsoon')[0], 'Monsoon')
+        self.assertEqual(self.titles('village story'), ['A Village Story', 'Monsoon'])
+        # User input is never parsed as FTS syntax
+        self.assertEqual(self.titles('monsoon" OR NEAR(*'), [])
+
+    def test_existing_rows_are_backfilled(self):
+        Book.objects.bulk_create([Book(owner=self.owner, title='Gaban', price=10, location='Pune')])
+        self.assertEqual(self.titles('gaban'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.titles('gaban'), ['Gaban'])
+
+        # The migration that creates the index fills it from the Book table too
+        migration = import_module('bookbeeapp.migrations.0010_book_search_index')
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {FTS_TABLE}')
+            migration.create_fts_index(None, SimpleNamespace(connection=connection, execute=cursor.execute))
+        self.assertEqual(self.titles('gaban'), ['Gaban'])
+
+    def test_base_backend_searches_without_an_index(self):
+        older = self.add_book('Gaban', author='Premchand')
+        newer = self.add_book('Karmabhoomi', author='Premchand')
+        for backend in (BaseSearchBackend(), BasicSearchBackend()):
+            self.assertEqual(backend.search('premchand', 10), [newer.pk, older.pk])
+            self.assertEqual(backend.search('premchand gaban', 10), [older.pk])
+            self.assertEqual(backend.search('   ', 10), [])
+        # Equal scores, so only the paging is certain
+        pages = [SQLiteFTSBackend().search('premchand', 1, offset=offset) for offset in (0, 1)]
+        self.assertEqual(sorted(pages), sorted([[older.pk], [newer.pk]]))
+
+
+@override_settings(INSTRUMENTATION_SAMPLE_RATE=1)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        pagecache.page_cache().clear()
+        instrumentation.reset()
+        self.addCleanup(instrumentation.reset)
+
+    def test_records_each_view_by_url_name(self):
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home_feed'))
+
+        stats = instrumentation.snapshot()
+        self.assertEqual(stats['home']['requests'], 2)
+        self.assertEqual(stats['home_feed']['requests'], 1)
+        self.assertGreaterEqual(stats['home']['queries']['max'], 1)
+        self.assertIsNotNone(stats['home']['wall_ms']['p95'])
+
+    async def test_requests_through_the_async_handler_are_measured_too(self):
+        await self.async_client.get(reverse('home'))
+
+        stats = instrumentation.snapshot()
+        self.assertEqual(stats['home']['requests'], 1)
+        self.assertGreaterEqual(stats['home']['queries']['max'], 1)
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_recorded(self):
+        self.client.get(reverse('home'))
+        self.assertEqual(instrumentation.snapshot(), {})
+
+    def test_repeated_queries_are_reported_as_duplicates(self):
+        owner = User.objects.create_user('owner')
+        ids = [Book.objects.create(owner=owner, title=f'Book {i}', price=1, location='Pune').pk for i in range(3)]
+
+        recorder = instrumentation.QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for pk in ids:
+                Book.objects.filter(pk=pk).first()
+            list(Book.objects.filter(pk__in=ids))
+
+        self.assertEqual(recorder.count, 4)
+        self.assertEqual(list(recorder.duplicates().values()), [3])
+
+    def test_fingerprint_strips_parameters(self):
+        self.assertEqual(
+            instrumentation.fingerprint('SELECT * FROM "book" WHERE "id" IN (%s, %s, %s) AND "price" > 10 LIMIT 21'),
+            'SELECT * FROM "book" WHERE "id" IN (...) AND "price" > ? LIMIT ?',
+        )
+
+    def test_stats_endpoint_is_staff_only(self):
+        self.client.force_login(User.objects.create_user('reader'))
+        self.assertEqual(self.client.get(reverse('view_stats')).status_code, 302)
+
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        self.client.get(reverse('home'))
+        response = self.client.get(reverse('view_stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['views']['home']['requests'], 1)
+
+
+class SyntheticDataTests(TestCase):
+    def test_generated_data_is_consistent_and_benchmarkable(self):
+        call_command(
+            'generate_synthetic_data', users=10, books=60, orders=20, reviews=10, credits=5,
+            rooms=8, messages=200, stdout=StringIO(),
+        )
+        self.assertEqual(Book.objects.count(), 60)
+        self.assertEqual(Message.objects.count(), 200)
+
+        # Denormalized counters match the rows they summarise
+        for book in Book.objects.annotate(reviews=Count('review'), total=Sum('review__rating')):
+            self.assertEqual((book.review_count, book.rating_sum), (book.reviews, book.total or 0))
+        unread = Message.objects.filter(is_read=False).count()
+        self.assertEqual(UnreadCounter.objects.aggregate(total=Sum('count'))['total'] or 0, unread)
+        self.assertEqual(Order.objects.count(), Book.objects.exclude(status='AVAILABLE').count())
+        self.assertEqual(FacetCount.objects.aggregate(total=Sum('count'))['total'], 60)
+
+        out = StringIO()
+        call_command('benchmark', iterations=2, warmup=0, stdout=out)
+        for scenario in ('home', 'search', 'book_detail', 'cart_view', 'payment_success', 'chat_list', 'chat_room'):
+            self.assertIn(scenario, out.getvalue())
+        # The benchmark rolls back everything it did
+        self.assertEqual(Order.objects.count(), Book.objects.exclude(status='AVAILABLE').count())
+
+
+class TrustScoreTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller')
+        self.buyers = [User.objects.create_user(f'buyer{i}') for i in range(4)]
+
+    def stored(self, user):
+        return UserProfile.objects.filter(user=user).values_list('trust_score', flat=True).first()
+
+    def actual(self, user):
+        return UserCredit.objects.filter(receiver=user).aggregate(total=Sum('score'))['total'] or 0
+
+    def test_score_follows_credits_given_and_removed(self):
+        UserProfile.objects.create(user=self.seller)
+        book = Book.objects.create(owner=self.seller, title='Godaan', price=100, location='Pune')
+        Order.objects.create(buyer=self.buyers[0], seller=self.seller, book=book)
+        self.client.force_login(self.buyers[0])
+        self.client.post(reverse('public_profile', args=['seller']), {'give_credit': '1'})
+        self.client.post(reverse('public_profile', args=['seller']), {'give_credit': '1'})  # only counts once
+        self.assertEqual(self.stored(self.seller), 1)
+
+        for buyer in self.buyers[1:]:
+            UserCredit.objects.create(giver=buyer, receiver=self.seller, score=2)
+        UserCredit.objects.filter(giver=self.buyers[1]).delete()
+        self.buyers[2].delete()  # their credits go with them
+        self.assertEqual(self.stored(self.seller), self.actual(self.seller))
+        self.assertEqual(self.stored(self.seller), 3)
+
+    def test_removing_credit_never_creates_a_negative_profile(self):
+        credit = UserCredit.objects.create(giver=self.buyers[0], receiver=self.seller)
+        UserProfile.objects.filter(user=self.seller).delete()
+        credit.delete()
+        self.assertIsNone(self.stored(self.seller))
+
+        # Deleting a user whose profile goes before their credits leaves nothing behind
+        UserCredit.objects.create(giver=self.buyers[0], receiver=self.seller)
+        self.seller.delete()
+        self.assertFalse(UserProfile.objects.filter(user_id=self.seller.pk).exists())
+
+    def test_profile_page_cost_does_not_grow_with_credits(self):
+        UserProfile.objects.create(user=self.seller)
+
+        def page_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('public_profile', args=['seller']))
+            self.assertEqual(response.context['total_score'], self.actual(self.seller))
+            return len(queries)
+
+        self.client.force_login(self.buyers[0])
+        UserCredit.objects.create(giver=self.buyers[1], receiver=self.seller)
+        one_credit = page_queries()
+        for buyer in self.buyers[2:]:
+            UserCredit.objects.create(giver=buyer, receiver=self.seller, score=5)
+        self.assertEqual(page_queries(), one_credit)
+
+    def test_recompute_fixes_drifted_scores(self):
+        for buyer in self.buyers:
+            UserCredit.objects.create(giver=buyer, receiver=self.seller)
+        UserProfile.objects.filter(user=self.seller).update(trust_score=99)
+        UserProfile.objects.create(user=self.buyers[0], trust_score=-2)
+
+        out = StringIO()
+        call_command('recompute_trust_scores', dry_run=True, stdout=out)
+        self.assertIn('2 trust scores would be fixed', out.getvalue())
+        self.assertEqual(self.stored(self.seller), 99)
+
+        call_command('recompute_trust_scores', stdout=StringIO())
+        self.assertEqual((self.stored(self.seller), self.stored(self.buyers[0])), (4, 0))
+
+
+class RatingTests(TestCase):
+    def setUp(self):
+        pagecache.page_cache().clear()
+        self.owner = User.objects.create_user('owner')
+        self.readers = [User.objects.create_user(f'reader{i}') for i in range(3)]
+        self.book = Book.objects.create(owner=self.owner, title='Dune', price=100, location='Mumbai')
+
+    def review(self, book, reader, rating):
+        return Review.objects.create(author=reader, book=book, rating=rating, comment='Good read')
+
+    def assertRating(self, count, total, average):
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.review_count, self.book.rating_sum), (count, total))
+        self.assertAlmostEqual(self.book.avg_rating, average)
+
+    def test_reviews_keep_the_totals_up_to_date(self):
+        first = self.review(self.book, self.readers[0], 5)
+        self.assertRating(1, 5, 5.0)
+        second = self.review(self.book, self.readers[1], 2)
+        self.assertRating(2, 7, 3.5)
+        self.review(self.book, self.readers[2], 4)
+        self.assertRating(3, 11, 11 / 3)
+
+        # Saving an existing review isn't a new rating
+        second.comment = 'On second thought...'
+        second.save()
+        self.assertRating(3, 11, 11 / 3)
+
+        first.delete()
+        self.assertRating(2, 6, 3.0)
+
+    def test_deleting_the_last_review_resets_the_average(self):
+        review = self.review(self.book, self.readers[0], 4)
+        review.delete()
+        self.assertRating(0, 0, 0.0)
+
+        # And the next review starts from scratch
+        self.review(self.book, self.readers[1], 3)
+        self.assertRating(1, 3, 3.0)
+
+    def test_feed_sorted_by_rating(self):
+        middling = Book.objects.create(owner=self.owner, title='Middling', price=100, location='Mumbai')
+        popular = Book.objects.create(owner=self.owner, title='Popular', price=100, location='Mumbai')
+        Book.objects.create(owner=self.owner, title='Unrated', price=100, location='Mumbai')
+        self.review(self.book, self.readers[0], 5)
+        self.review(middling, self.readers[0], 3)
+        # Same average as Dune, but more reviews
+        for reader in self.readers:
+            self.review(popular, reader, 5)
+
+        response = self.client.get(reverse('home_feed'), {'sort': 'rating'})
+        self.assertEqual(
+            [book['title'] for book in response.json()['books']],
+            ['Popular', 'Dune', 'Middling', 'Unrated'],
+        )
+
+
+class BookCardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner')
+        self.reader = User.objects.create_user('reader')
+        self.book = Book.objects.create(
+            owner=self.owner, title='Malgudi Days', price=120, location='Chennai 600001', transaction_type='buy',
+        )
+
+    def home(self, user=None):
+        # Logged in, so the page itself is never served from the anonymous page cache
+        self.client.force_login(user or self.reader)
+        return self.client.get(reverse('home')).content.decode()
+
+    def test_card_is_cached_but_buttons_stay_per_user(self):
+        self.assertIn('Add to Cart', self.home(self.reader))
+        self.assertIsNotNone(cache.get(book_card_key(self.book)))
+
+        html = self.home(self.owner)
+        self.assertIn('Your Listing', html)
+        self.assertNotIn('Add to Cart', html)
+
+    def test_save_renders_a_fresh_card(self):
+        self.home()
+        old_key = book_card_key(self.book)
+        self.book.title = 'Swami and Friends'
+        self.book.save()
+
+        self.assertIsNone(cache.get(old_key))
+        html = self.home()
+        self.assertIn('Swami and Friends', html)
+        self.assertNotIn('Malgudi Days', html)
+
+    def test_bulk_updates_bump_the_card(self):
+        self.assertIn('FOR SALE', self.home())
+
+        Review.objects.create(author=self.reader, book=self.book, rating=4, comment='Lovely')
+        self.assertIn('4.0', self.home())
+
+        Cart.objects.create(user=self.reader).items.add(self.book)
+        checkout_cart(self.reader)
+        html = self.home()
+        self.assertIn('SOLD', html)
+        self.assertNotIn('FOR SALE', html)
+
+    def test_delete_drops_the_card(self):
+        self.home()
+        key = book_card_key(self.book)
+        self.book.delete()
+        self.assertIsNone(cache.get(key))
+
+
+@override_settings(THUMBNAIL_ASYNC=False)
+class CoverImageTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media)
+        media.enable()
+        self.addCleanup(media.disable)
+        pagecache.page_cache().clear()
+        self.seller = User.objects.create_user('seller')
+
+    def photo(self, name='cover.jpg', exif=True, pil_format='JPEG'):
+        """A 600x400 landscape 'phone photo', tagged to be shown rotated upright and with a GPS position."""
+        metadata = Image.Exif()
+        if exif:
+            metadata[0x0112] = 6  # Orientation: rotate 90° clockwise
+            metadata[0x010F] = 'PhoneMaker'
+            metadata[0x8825] = {2: (18.0, 31.0, 13.0)}  # GPS latitude
+        buffer = BytesIO()
+        # An MPO only opens as one with a second frame, as phones with two cameras write them
+        extra = {'save_all': True, 'append_images': [Image.new('RGB', (600, 400))]} if pil_format == 'MPO' else {}
+        Image.new('RGB', (600, 400), 'teal').save(buffer, pil_format, exif=metadata.tobytes(), **extra)
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def add_book(self, cover):
+        self.client.force_login(self.seller)
+        with self.captureOnCommitCallbacks():
+            self.client.post(reverse('add_book'), {
+                'title': 'Godaan', 'author': 'Premchand', 'image': cover, 'price': 150, 'location': 'Pune',
+                'description': '', 'transaction_type': 'rent', 'genre': 'Fiction',
+            })
+        book = Book.objects.get(title='Godaan')
+        self.assertFalse(book.thumbnails_ready)
+        # What the thumbnail worker does after commit (it closes its connection, so not run here)
+        generate_thumbnails(book)
+        book.refresh_from_db()
+        return book
+
+    def test_upload_is_stored_upright_without_exif_and_thumbnailed(self):
+        book = self.add_book(self.photo())
+        with Image.open(book.image.path) as original:
+            self.assertEqual(dict(original.getexif()), {})
+            self.assertEqual(original.size, (400, 600))
+
+        self.assertTrue(book.thumbnails_ready)
+        for width in THUMBNAIL_WIDTHS:
+            for ext in ('webp', 'jpg'):
+                with Image.open(os.path.join(self.media, thumbnail_name(book.image.name, width, ext))) as thumb:
+                    self.assertEqual(thumb.size, (width, round(width * 4 / 3)))
+                    self.assertEqual(dict(thumb.getexif()), {})
+
+    def test_multi_frame_jpegs_stay_jpeg(self):
+        book = self.add_book(self.photo(pil_format='MPO'))
+        self.assertTrue(book.image.name.endswith('.jpg'))
+        with Image.open(book.image.path) as original:
+            self.assertEqual((original.format, dict(original.getexif()), original.size), ('JPEG', {}, (400, 600)))
+        self.assertTrue(book.thumbnails_ready)
+
+    def test_clean_uploads_are_stored_as_they_are(self):
+        cover = self.photo(exif=False)
+        book = self.add_book(cover)
+        with open(book.image.path, 'rb') as f:
+            self.assertEqual(f.read(), cover.open().read())
+
+    def test_feed_serves_thumbnails_through_srcset(self):
+        book = self.add_book(self.photo())
+        srcset = cover_srcset(book, 'webp')
+        self.assertEqual([entry.split()[1] for entry in srcset.split(', ')], [f'{w}w' for w in THUMBNAIL_WIDTHS])
+
+        self.client.logout()
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, f'srcset="{srcset}"')
+        self.assertContains(response, f'src="{book.image.storage.url(thumbnail_name(book.image.name, 480, "jpg"))}"')
+
+        # Until they exist, the (already stripped) original is shown instead
+        Book.objects.filter(pk=book.pk).update(thumbnails_ready=False, updated_at=timezone.now())
+        pagecache.page_cache().clear()
+        self.assertContains(self.client.get(reverse('home')), f'src="{book.image.url}"')
+
+    def test_thumbnailing_strips_covers_stored_before_stripping_on_upload(self):
+        book = Book.objects.create(owner=self.seller, title='Old', price=10, location='Pune')
+        book.image.save('old.jpg', self.photo(), save=True)
+        generate_thumbnails(book)
+
+        book.refresh_from_db()
+        with Image.open(book.image.path) as original:
+            self.assertEqual((dict(original.getexif()), original.size), ({}, (400, 600)))
+        self.assertTrue(book.thumbnails_ready)
+
+
+class AnonymousPageCacheTests(TestCase):
+    def setUp(self):
+        pagecache.page_cache().clear()
+        self.owner = User.objects.create_user('owner')
+
+    def add_book(self, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Book.objects.create(owner=self.owner, title=title, price=50, location='Delhi 110001')
+
+    def test_repeat_anonymous_requests_skip_the_view(self):
+        self.add_book('Godan')
+        first = self.client.get(reverse('home'), {'q': 'godan'})
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('home'), {'q': 'godan'})
+        self.assertEqual(second['X-Page-Cache'], 'hit')
+        self.assertEqual(second.content, first.content)
+
+    def test_book_changes_retire_cached_pages(self):
+        self.add_book('Godan')
+        self.client.get(reverse('home'))
+        self.add_book('Nirmala')
+
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Nirmala')
+
+    def test_logged_in_and_flash_message_requests_are_not_cached(self):
+        self.client.cookies['messages'] = 'pending'
+        self.assertNotIn('X-Page-Cache', self.client.get(reverse('home')))
+
+        self.client.force_login(self.owner)
+        self.assertNotIn('X-Page-Cache', self.client.get(reverse('home')))
+
+    def test_concurrent_misses_wait_for_the_first_render(self):
+        rendered = []
+
+        @pagecache.cache_anonymous_page
+        def view(request):
+            rendered.append(request)
+            return HttpResponse('fresh')
+
+        request = RequestFactory().get('/slow/')
+        key = pagecache.page_key(request)
+        cache = pagecache.page_cache()
+        # Another request is already rendering this page...
+        cache.add(f'{key}:lock', 1)
+        # ...and finishes shortly after this one arrives
+        threading.Timer(0.1, cache.set, [key, HttpResponse('from the first render')]).start()
+
+        response = view(request)
+        self.assertEqual(response.content, b'from the first render')
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertEqual(rendered, [])
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.reader = User.objects.create_user('reader')
+        self.cart = Cart.objects.create(user=self.reader)
+
+    def add_book(self, title, owner=None, **fields):
+        fields = {'price': 150, 'location': 'Delhi', 'genre': 'Fiction', **fields}
+        return Book.objects.create(owner=owner or self.owner, title=title, **fields)
+
+    def facet_counts(self):
+        return {
+            (row.genre, row.status, row.transaction_type, row.price_band): row.count
+            for row in FacetCount.objects.exclude(count=0)
+        }
+
+    def test_empty_cart(self):
+        with self.assertRaisesMessage(CheckoutError, 'Your cart is empty!'):
+            checkout_cart(self.reader)
+        # A reader who never had a cart gets the same answer
+        with self.assertRaisesMessage(CheckoutError, 'Your cart is empty!'):
+            checkout_cart(User.objects.create_user('newcomer'))
+        self.assertFalse(Order.objects.exists())
+
+    def test_unavailable_and_own_books_stop_the_whole_checkout(self):
+        fine = self.add_book('Dune')
+        lent = self.add_book('Emma', is_available=False)
+        own = self.add_book('Ulysses', owner=self.reader)
+        self.cart.items.set([fine, lent, own])
+
+        with self.assertRaises(CheckoutError) as caught:
+            checkout_cart(self.reader)
+        self.assertEqual({book.title for book in caught.exception.books}, {'Emma', 'Ulysses'})
+
+        # Nothing happened: no orders, the cart and the available book untouched
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(set(self.cart.items.values_list('title', flat=True)), {'Dune', 'Emma', 'Ulysses'})
+        fine.refresh_from_db()
+        self.assertEqual((fine.status, fine.is_available, fine.owner), ('AVAILABLE', True, self.owner))
+
+    def test_rented_and_bought_books(self):
+        rented = self.add_book('Dune', transaction_type='rent')
+        bought = self.add_book('Emma', transaction_type='buy', price=400)
+        self.cart.items.set([rented, bought])
+
+        orders = checkout_cart(self.reader)
+
+        self.assertEqual(
+            {(order.book.title, order.buyer, order.seller) for order in orders},
+            {('Dune', self.reader, self.owner), ('Emma', self.reader, self.owner)},
+        )
+        self.assertEqual(Order.objects.count(), 2)
+        rented.refresh_from_db()
+        bought.refresh_from_db()
+        # A rented book goes back to its owner later; a bought one now belongs to the reader
+        self.assertEqual((rented.status, rented.is_available, rented.owner), ('LENDED', False, self.owner))
+        self.assertEqual((bought.status, bought.is_available, bought.owner), ('SOLD', False, self.reader))
+        self.assertFalse(self.cart.items.exists())
+
+    def test_facet_counts_move_with_the_books(self):
+        rented = self.add_book('Dune', transaction_type='rent')
+        bought = self.add_book('Emma', transaction_type='buy', price=400)
+        self.add_book('Maus', transaction_type='rent')
+        self.cart.items.set([rented, bought])
+        self.assertEqual(self.facet_counts(), {
+            ('Fiction', 'AVAILABLE', 'rent', '100-250'): 2,
+            ('Fiction', 'AVAILABLE', 'buy', '250-500'): 1,
+        })
+
+        checkout_cart(self.reader)
+
+        self.assertEqual(self.facet_counts(), {
+            ('Fiction', 'AVAILABLE', 'rent', '100-250'): 1,
+            ('Fiction', 'LENDED', 'rent', '100-250'): 1,
+            ('Fiction', 'SOLD', 'buy', '250-500'): 1,
+        })
+        self.assertEqual(self.facet_counts(), dict(facets.rebuild()))
+
+
+class FacetCountTests(TestCase):
+    def setUp(self):
+        pagecache.page_cache().clear()
+        self.owner = User.objects.create_user('owner')
+        self.reader = User.objects.create_user('reader')
+
+    def add_book(self, title, **fields):
+        fields = {'price': 50, 'location': 'Delhi', **fields}
+        return Book.objects.create(owner=self.owner, title=title, **fields)
+
+    def stored_counts(self):
+        return {
+            (row.genre, row.status, row.transaction_type, row.price_band): row.count
+            for row in FacetCount.objects.exclude(count=0)
+        }
+
+    def assertCountsMatchBooks(self):
+        self.assertEqual(self.stored_counts(), dict(facets.rebuild()))
+
+    def test_counts_follow_every_kind_of_book_change(self):
+        novel = self.add_book('Gitanjali', genre='Fantasy')
+        self.add_book('Cosmos', genre='Academic', transaction_type='buy', price=300)
+        self.add_book('Maus', genre='Mystery', price=80)
+        self.assertCountsMatchBooks()
+
+        novel.genre, novel.price = 'Fiction', 120
+        novel.save()
+        self.assertEqual(self.stored_counts()[('Fiction', 'AVAILABLE', 'rent', '100-250')], 1)
+        self.assertCountsMatchBooks()
+
+        # Checkout's bulk UPDATEs move books to LENDED/SOLD without any save signals
+        cart = Cart.objects.create(user=self.reader)
+        cart.items.set(Book.objects.exclude(title='Maus'))
+        checkout_cart(self.reader)
+        self.assertCountsMatchBooks()
+
+        Book.objects.get(title='Maus').delete()
+        self.assertCountsMatchBooks()
+        self.owner.delete()
+        self.assertCountsMatchBooks()
+
+    def test_prices_given_as_strings_are_banded(self):
+        book = self.add_book('Gitanjali', price='150.00')
+        self.assertEqual(self.stored_counts(), {('Fiction', 'AVAILABLE', 'rent', '100-250'): 1})
+        book.price = '99.5'
+        book.save()
+        self.assertEqual(self.stored_counts(), {('Fiction', 'AVAILABLE', 'rent', 'under-100'): 1})
+        self.assertCountsMatchBooks()
+
+    def test_browse_filters_books_and_counts_each_facet(self):
+        self.add_book('Gitanjali', genre='Fantasy')
+        self.add_book('Leaves of Grass', genre='Fantasy', transaction_type='buy', price=600)
+        self.add_book('Cosmos', genre='Academic')
+        self.add_book('Sold Tales', genre='Fantasy', is_available=False, transaction_type='buy')
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('browse'), {'genre': 'Fantasy', 'status': 'AVAILABLE'})
+        data = response.json()
+
+        self.assertEqual({book['title'] for book in data['books']}, {'Gitanjali', 'Leaves of Grass'})
+        self.assertEqual(data['total'], 2)
+        counts = {facet: {v['value']: v['count'] for v in values} for facet, values in data['facets'].items()}
+        # Each facet ignores its own filter: other genres still show what picking them would give
+        self.assertEqual(counts['genre']['Fantasy'], 2)
+        self.assertEqual(counts['genre']['Academic'], 1)
+        self.assertEqual(counts['status'], {'AVAILABLE': 2, 'LENDED': 0, 'SOLD': 1})
+        self.assertEqual(counts['transaction_type'], {'rent': 1, 'buy': 1})
+        self.assertEqual(counts['price_band'], {'under-100': 1, '100-250': 0, '250-500': 0, '500-plus': 1})
+
+        response = self.client.get(reverse('browse'), {'genre': 'Fantasy', 'price_band': '500-plus'})
+        self.assertEqual([book['title'] for book in response.json()['books']], ['Leaves of Grass'])
+        self.assertEqual(self.client.get(reverse('browse'), {'genre': 'Cooking'}).status_code, 400)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.reader = User.objects.create_user('reader')
+        self.books = [
+            Book.objects.create(owner=self.owner, title=f'Book {i}', price=100 + i, location='Pune')
+            for i in range(5)
+        ]
+
+    def get(self, name, *args, **headers):
+        params = headers.pop('params', {})
+        return self.client.get(reverse(name, args=args), params, headers=headers)
+
+    def test_books_support_field_selection_and_cursors(self):
+        first = self.get('api_books', params={'fields': 'id,title', 'limit': 3}).json()
+        self.assertEqual([book['title'] for book in first['results']], ['Book 4', 'Book 3', 'Book 2'])
+        self.assertEqual(set(first['results'][0]), {'id', 'title'})
+
+        rest = self.get('api_books', params={'fields': 'title', 'limit': 3, 'cursor': first['next_cursor']}).json()
+        self.assertEqual([book['title'] for book in rest['results']], ['Book 1', 'Book 0'])
+        self.assertIsNone(rest['next_cursor'])
+
+        self.assertEqual(self.get('api_books', params={'fields': 'title,password'}).status_code, 400)
+        self.assertEqual(self.get('api_books', params={'cursor': 'nonsense'}).status_code, 400)
+        self.assertEqual(self.get('api_book_detail', 999).status_code, 404)
+
+    def test_unchanged_resources_cost_a_bodyless_304(self):
+        book = self.books[0]
+        response = self.get('api_book_detail', book.pk)
+        self.assertEqual(response.json()['title'], 'Book 0')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        response = self.get('api_book_detail', book.pk, if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.get('api_book_detail', book.pk, if_modified_since=last_modified).status_code, 304)
+        # A different ?fields= selection is a different representation
+        self.assertEqual(self.get('api_book_detail', book.pk, if_none_match=etag, params={'fields': 'id'}).status_code, 200)
+
+        book.price = 80
+        book.save()
+        response = self.get('api_book_detail', book.pk, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Lists are versioned by the rows on the page
+        etag = self.get('api_books').headers['ETag']
+        self.assertEqual(self.get('api_books', if_none_match=etag).status_code, 304)
+        Book.objects.create(owner=self.owner, title='Brand New', price=10, location='Pune')
+        self.assertEqual(self.get('api_books', if_none_match=etag).status_code, 200)
+
+    def test_cart_orders_and_chat_belong_to_the_user(self):
+        for name in ('api_cart', 'api_orders', 'api_chat_rooms'):
+            self.assertEqual(self.get(name).status_code, 401)
+
+        self.client.force_login(self.reader)
+        Cart.objects.create(user=self.reader).items.set(self.books[:2])
+        cart = self.get('api_cart', params={'fields': 'title,price'}).json()
+        self.assertEqual(cart, {
+            'items': [{'title': 'Book 0', 'price': '100.00'}, {'title': 'Book 1', 'price': '101.00'}],
+            'total_price': '201.00',
+        })
+
+        checkout_cart(self.reader)
+        orders = self.get('api_orders').json()['results']
+        self.assertEqual([order['book']['title'] for order in orders], ['Book 1', 'Book 0'])
+        self.assertEqual(orders[0]['seller'], 'owner')
+        self.assertEqual(self.get('api_cart').json()['items'], [])
+
+        room = ChatRoom.objects.room_for(self.reader.id, self.owner.id)
+        Message.objects.create(room=room, sender=self.owner, text='Enjoy the books!')
+        rooms = self.get('api_chat_rooms').json()['results']
+        self.assertEqual((rooms[0]['other_user'], rooms[0]['unread_count']), ('owner', 1))
+
+        response = self.get('api_chat_messages', room.id)
+        self.assertEqual(response.json()['results'][0]['text'], 'Enjoy the books!')
+        # Reading the room in the browser marks the message read, which changes the ETag
+        self.client.get(reverse('chat_room', args=[room.id]))
+        self.assertEqual(self.get('api_chat_messages', room.id, if_none_match=response['ETag']).status_code, 200)
+
+        self.client.force_login(User.objects.create_user('stranger'))
+        self.assertEqual(self.get('api_chat_messages', room.id).status_code, 403)
+
+    def test_profiles(self):
+        UserProfile.objects.create(user=self.owner, avatar='av2.png', trust_score=3)
+        self.assertEqual(self.get('api_profile_detail', 'owner').status_code, 401)
+
+        self.client.force_login(self.reader)
+        profile = self.get('api_profile_detail', 'owner').json()
+        self.assertEqual((profile['avatar'], profile['trust_score'], profile['listings']), ('av2.png', 3, 5))
+        self.assertEqual(self.get('api_profile_detail', 'reader').json()['trust_score'], 0)
+
+
+class JobQueueTests(TestCase):
+    """The queue with Django's test (locmem) email backend: sent mail lands in mail.outbox."""
+
+    def setUp(self):
+        self.calls = 0
+
+        @jobs.job('flaky_email')
+        def flaky_email(to, failures):
+            self.calls += 1
+            if self.calls <= failures:
+                raise ConnectionError('SMTP server unavailable')
+            mail.send_mail('Hello', 'Welcome to BookBee', None, to)
+
+    def run_due(self, failing=False):
+        if failing:
+            with self.assertLogs('bookbeeapp.jobs', 'WARNING'):
+                return self.run_due()
+        # One pass of run_jobs, in this thread so it sees the test transaction
+        jobs.requeue_stale()
+        for job_id in jobs.claim(5):
+            jobs.run(job_id)
+
+    def make_due(self, job):
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+
+    def test_signup_email_is_sent_by_the_worker(self):
+        self.client.post(reverse('signup_view'), {
+            'username': 'newbee', 'email': 'newbee@example.com', 'password': 'pollen', 'confirm_password': 'pollen',
+        })
+        self.assertEqual(mail.outbox, [])
+        job = Job.objects.get(name='send_email')
+        self.assertEqual(job.payload['to'], ['newbee@example.com'])
+
+        self.run_due()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('done', 1))
+        self.assertEqual(mail.outbox[0].to, ['newbee@example.com'])
+        self.assertIn('/activate/', mail.outbox[0].body)
+
+    def test_failures_back_off_then_succeed(self):
+        job = jobs.enqueue('flaky_email', to=['reader@example.com'], failures=2)
+        before = timezone.now()
+        self.run_due(failing=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertIn('SMTP server unavailable', job.last_error)
+        self.assertGreaterEqual(job.run_at, before + jobs.BACKOFF_BASE)
+        # Not due yet, so a worker leaves it alone
+        self.assertEqual(jobs.claim(5), [])
+
+        self.make_due(job)
+        self.run_due(failing=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 2))
+        self.assertGreaterEqual(job.run_at, timezone.now() + jobs.BACKOFF_BASE)
+        self.assertEqual(mail.outbox, [])
+
+        self.make_due(job)
+        self.run_due()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.last_error), ('done', 3, ''))
+        self.assertEqual(len(mail.outbox), 1)
+
+        self.assertEqual(jobs.backoff(1), jobs.BACKOFF_BASE)
+        self.assertEqual(jobs.backoff(3), jobs.BACKOFF_BASE * 4)
+        self.assertEqual(jobs.backoff(30), jobs.BACKOFF_MAX)
+
+    def test_jobs_fail_for_good_after_max_attempts(self):
+        job = jobs.enqueue('flaky_email', max_attempts=2, to=['reader@example.com'], failures=5)
+        self.run_due(failing=True)
+        self.make_due(job)
+        self.run_due(failing=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, self.calls), ('failed', 2, 2))
+        self.assertIsNone(job.locked_at)
+
+        self.make_due(job)
+        self.run_due()
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(mail.outbox, [])
+
+    def test_claim_takes_each_job_once(self):
+        first = jobs.enqueue('send_email', subject='1', body='', to=['a@example.com'])
+        second = jobs.enqueue('send_email', subject='2', body='', to=['b@example.com'])
+        later = jobs.enqueue('send_email', run_at=timezone.now() + timedelta(hours=1), subject='3', body='', to=[])
+        self.assertEqual(jobs.claim(1), [first.pk])
+        self.assertEqual(jobs.claim(5), [second.pk])
+        self.assertEqual(jobs.claim(5), [])
+        self.assertEqual(Job.objects.get(pk=later.pk).status, 'queued')
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_run_skips_a_job_a_worker_already_claimed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            job = jobs.enqueue('flaky_email', to=['reader@example.com'], failures=0)
+            # A worker polling at the same moment wins the race
+            self.assertTrue(jobs.run(jobs.claim(1)[0]))
+        self.assertEqual((self.calls, len(mail.outbox)), (1, 1))
+        self.assertEqual(Job.objects.get(pk=job.pk).attempts, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.enqueue('flaky_email', to=['reader@example.com'], failures=0)
+        self.assertEqual((self.calls, len(mail.outbox)), (2, 2))
+
+
+class RunJobsCommandTests(TransactionTestCase):
+    """The worker command itself, whose threads each use their own connection."""
+
+    def test_a_slow_job_doesnt_hold_up_the_others(self):
+        quick_done = threading.Event()
+        finished = []
+
+        @jobs.job('slow_job')
+        def slow_job():
+            # Only returns early if the quick jobs get the other slot meanwhile
+            finished.append(('slow', quick_done.wait(timeout=5)))
+
+        @jobs.job('quick_job')
+        def quick_job(n):
+            finished.append(('quick', n))
+            if len(finished) == 3:
+                quick_done.set()
+
+        earlier = timezone.now() - timedelta(minutes=1)
+        jobs.enqueue('slow_job', run_at=earlier)
+        for n in range(3):
+            jobs.enqueue('quick_job', n=n)
+
+        out = StringIO()
+        call_command('run_jobs', concurrency=2, once=True, poll=0.05, stdout=out)
+
+        self.assertEqual(finished[-1], ('slow', True))
+        self.assertEqual(sorted(finished[:3]), [('quick', 0), ('quick', 1), ('quick', 2)])
+        self.assertIn('4 succeeded, 0 failed', out.getvalue())
+        self.assertEqual(set(Job.objects.values_list('status', flat=True)), {'done'})
+
+
+class BookImportTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.library = User.objects.create_user('citylibrary', email='books@citylibrary.in')
+        self.pune = Pincode.objects.get(pincode='411001')
+
+    def listing(self, title, **fields):
+        return {
+            'title': title, 'author': 'Anon', 'image': f'{title}.jpg', 'price': '120', 'location': 'Camp, Pune 411001',
+            'description': '', 'transaction_type': 'rent', 'security_amount': '', 'genre': 'Fiction', **fields,
+        }
+
+    def covers_zip(self, *titles):
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for title in titles:
+                image = BytesIO()
+                Image.new('RGB', (4, 6), 'gold').save(image, 'JPEG')
+                archive.writestr(f'covers/{title}.jpg', image.getvalue())
+        return buffer.getvalue()
+
+    def write(self, name, content):
+        path = os.path.join(self.media, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def import_file(self, name, content, *titles, **options):
+        out, err = StringIO(), StringIO()
+        call_command(
+            'import_books', self.write(name, content), owner='citylibrary',
+            covers=self.write('covers.zip', self.covers_zip(*titles)), stdout=out, stderr=err, **options,
+        )
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_import_lists_books_in_batches_and_skips_bad_rows(self):
+        rows = [
+            self.listing('Malgudi Days'),
+            self.listing('Godaan', genre='Academic', transaction_type='buy', price='300'),
+            self.listing('No Cover', image='missing.jpg'),
+            self.listing('Train to Pakistan', price='cheap'),
+            self.listing('Tamas', location='Ambala'),
+        ]
+        stream = StringIO()
+        writer = csv.DictWriter(stream, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+        with self.captureOnCommitCallbacks():
+            out, err = self.import_file(
+                'books.csv', stream.getvalue().encode(), 'Malgudi Days', 'Godaan', 'Train to Pakistan', 'Tamas',
+                batch_size=2,
+            )
+        self.assertIn('3 books listed, 2 rows skipped', out)
+        self.assertIn("Line 4: Cover 'missing.jpg' is not in the zip.", err)
+        self.assertIn('Line 5: price:', err)
+
+        malgudi = Book.objects.get(title='Malgudi Days')
+        self.assertEqual((malgudi.owner, malgudi.pincode, malgudi.latitude), (self.library, '411001', self.pune.latitude))
+        self.assertTrue(malgudi.geohash)
+        self.assertTrue(os.path.exists(malgudi.image.path))
+        self.assertEqual(Book.objects.get(title='Tamas').pincode, '')
+        # The work the per-book save signals would have done
+        self.assertEqual([book.title for book in search_books('Godaan')], ['Godaan'])
+        self.assertEqual(
+            {(row.genre, row.status, row.transaction_type, row.price_band): row.count for row in FacetCount.objects.all()},
+            dict(facets.rebuild()),
+        )
+
+    def test_jsonl_dry_run_only_validates(self):
+        lines = [json.dumps(self.listing('Malgudi Days')), '', 'not json', json.dumps(['a', 'list'])]
+        out, err = self.import_file(
+            'books.jsonl', '\n'.join(lines).encode(), 'Malgudi Days', dry_run=True,
+        )
+        self.assertIn('1 books would be listed, 2 rows skipped', out)
+        self.assertIn('Line 3: Not valid JSON', err)
+        self.assertIn('Line 4: Each line must be a JSON object', err)
+        self.assertFalse(Book.objects.exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media, 'book_covers')))
+
+    @override_settings(JOBS_EAGER=True)
+    def test_upload_runs_as_a_job_and_emails_a_summary(self):
+        self.client.force_login(self.library)
+        listings = SimpleUploadedFile('books.jsonl', json.dumps(self.listing('Godaan')).encode())
+        covers = SimpleUploadedFile('covers.zip', self.covers_zip('Godaan'))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('import_books'), {'listings': listings, 'covers': covers})
+        self.assertRedirects(response, reverse('profile'), fetch_redirect_response=False)
+
+        self.assertTrue(Book.objects.filter(title='Godaan', owner=self.library).exists())
+        self.assertEqual(Job.objects.get(name='import_books').status, 'done')
+        self.assertIn('1 books listed, 0 rows skipped', mail.outbox[0].body)
+        # The uploads are removed once imported
+        self.assertEqual([files for _, _, files in os.walk(os.path.join(self.media, 'imports')) if files], [])
+
+        not_a_zip = SimpleUploadedFile('covers.zip', b'plain text')
+        response = self.client.post(reverse('import_books'), {'listings': listings, 'covers': not_a_zip})
+        self.assertContains(response, 'This is not a zip archive.')
+
+    def test_a_stale_import_is_failed_not_run_twice(self):
+        started = timezone.now() - jobs.STALE_LOCK - timedelta(minutes=1)
+        slow_import = Job.objects.create(
+            name='import_books', payload={}, run_at=started, status='running', locked_at=started,
+            attempts=1, max_attempts=1,
+        )
+        slow_email = Job.objects.create(
+            name='send_email', payload={}, run_at=started, status='running', locked_at=started, attempts=1,
+        )
+
+        self.assertEqual(jobs.requeue_stale(), 1)
+        slow_import.refresh_from_db()
+        slow_email.refresh_from_db()
+        self.assertEqual(slow_import.status, 'failed')
+        self.assertIn('not retried', slow_import.last_error)
+        self.assertEqual(slow_email.status, 'queued')
+        self.assertEqual(jobs.claim(5), [slow_email.pk])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller')
+        self.buyer = User.objects.create_user('buyer')
+        self.books = [
+            Book.objects.create(owner=self.seller, title=f'Book {i}', author='Anon, Jr.', price=100 + i, location='Pune')
+            for i in range(3)
+        ]
+        self.orders = [Order.objects.create(buyer=self.buyer, seller=self.seller, book=book) for book in self.books]
+        # One order per day: Jan 1st, 2nd and 3rd
+        for day, order in enumerate(self.orders, start=1):
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.make_aware(datetime(2026, 1, day, 23, 30)))
+
+    def download(self, name, fmt, **params):
+        response = self.client.get(reverse(name, args=[fmt]), params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_orders_stream_as_csv_in_one_query(self):
+        self.client.force_login(self.seller)
+        with self.assertNumQueries(3):  # session, user, then every order in a single SELECT
+            response, body = self.download('export_orders', 'csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="bookbee-orders.csv"')
+
+        rows = list(csv.DictReader(StringIO(body)))
+        self.assertEqual([row['title'] for row in rows], ['Book 0', 'Book 1', 'Book 2'])
+        self.assertEqual((rows[0]['author'], rows[0]['price'], rows[0]['buyer']), ('Anon, Jr.', '100.00', 'buyer'))
+
+        # The buyer sees the same orders as purchases, and nothing as a seller
+        self.client.force_login(self.buyer)
+        self.assertEqual(len(self.download('export_orders', 'csv', role='buyer')[1].splitlines()), 4)
+        self.assertEqual(self.download('export_orders', 'csv')[1].splitlines(), [','.join(exports.ORDER_COLUMNS)])
+
+    def test_date_range_includes_both_end_days(self):
+        self.client.force_login(self.seller)
+        _, body = self.download('export_orders', 'jsonl', **{'from': '2026-01-02', 'to': '2026-01-03'})
+        self.assertEqual([json.loads(line)['title'] for line in body.splitlines()], ['Book 1', 'Book 2'])
+
+        _, body = self.download('export_listings', 'jsonl', to='2025-12-31')
+        self.assertEqual(body, '')
+        self.assertEqual(self.client.get(reverse('export_orders', args=['csv']), {'from': 'last week'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_orders', args=['xlsx'])).status_code, 404)
+
+    def test_only_staff_can_export_everything(self):
+        self.client.force_login(self.buyer)
+        self.assertEqual(self.client.get(reverse('export_listings', args=['csv']), {'all': 1}).status_code, 403)
+
+        self.client.force_login(User.objects.create_user('finance', is_staff=True))
+        _, body = self.download('export_listings', 'jsonl', all=1)
+        listings = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual((len(listings), listings[0]['title'], listings[0]['owner']), (3, 'Book 0', 'seller'))
+        self.assertEqual(len(self.download('export_orders', 'csv', all=1)[1].splitlines()), 4)
+
+    def test_rows_are_read_in_chunks_and_sent_in_blocks(self):
+        lines = list(exports.csv_lines(exports.orders().iterator(chunk_size=2), exports.ORDER_COLUMNS))
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('order_id,'))
+        self.assertEqual(list(exports.blocks(['ab', 'cd', 'e'], size=3)), [b'abcd', b'e'])
+
+
+class ConcurrentWritesTests(TransactionTestCase):
+    """Checkouts and chat posts racing each other on separate connections, as under a threaded server."""
+
+    THREADS = 8
+
+    def client_for(self, user):
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def run_in_parallel(self, jobs):
+        barrier = threading.Barrier(len(jobs))
+        errors = []
+
+        def run(job):
+            try:
+                barrier.wait()
+                job()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run, args=[job]) for job in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # e.g. OperationalError: database is locked
+        self.assertEqual(errors, [])
+
+    def test_parallel_checkouts_sell_a_contested_book_once(self):
+        seller = User.objects.create_user('seller')
+        contested = Book.objects.create(
+            owner=seller, title='Gitanjali', price=99, location='Kolkata 700001', transaction_type='buy',
+        )
+        clients = []
+        for i in range(self.THREADS):
+            buyer = User.objects.create_user(f'buyer{i}')
+            own = Book.objects.create(owner=seller, title=f'Book {i}', price=10, location='Kolkata 700001')
+            Cart.objects.create(user=buyer).items.add(contested, own)
+            clients.append(self.client_for(buyer))
+
+        responses = []
+        self.run_in_parallel([
+            lambda client=client: responses.append(client.get(reverse('payment_success')))
+            for client in clients
+        ])
+
+        self.assertEqual([r.url for r in responses].count(reverse('home')), 1)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(Book.objects.get(pk=contested.pk).status, 'SOLD')
+        # The losers' whole checkout rolled back, their other book included
+        self.assertEqual(Book.objects.filter(status='AVAILABLE').count(), self.THREADS - 1)
+
+    def test_parallel_chat_posts_are_all_stored_and_counted(self):
+        alice, bob = User.objects.create_user('alice'), User.objects.create_user('bob')
+        room = ChatRoom.objects.room_for(alice.id, bob.id)
+        posts_per_thread = 5
+
+        def chat(client):
+            for i in range(posts_per_thread):
+                response = client.post(reverse('chat_room', args=[room.id]), {'message': f'Message {i}'})
+                self.assertEqual(response.status_code, 200)
+
+        self.run_in_parallel([
+            lambda client=self.client_for(alice if i % 2 else bob): chat(client)
+            for i in range(self.THREADS)
+        ])
+
+        self.assertEqual(Message.objects.filter(room=room).count(), self.THREADS * posts_per_thread)
+        for user in (alice, bob):
+            unread = Message.objects.filter(room=room, is_read=False).exclude(sender=user).count()
+            self.assertEqual(UnreadCounter.for_user(user.id), unread)
+
+
+REPLICA = 'replica_test'
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Replicates by copying SQLite files')
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    The test database plays the primary and a second SQLite file the
+    replica. Nothing reaches the replica until sync_replica() copies the
+    primary over it, like replication catching up.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Registered after the runner's database setup: the replica needs no test database of its own
+        cls.replica_dir = tempfile.mkdtemp()
+        connections.settings[REPLICA] = {
+            **connections.settings['default'],
+            'NAME': os.path.join(cls.replica_dir, 'replica.sqlite3'),
+        }
+        cls.databases = {'default', REPLICA}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        shutil.rmtree(cls.replica_dir)
+        cls.databases = {'default'}
+        super().tearDownClass()
+
+    def sync_replica(self):
+        primary, replica = connections['default'], connections[REPLICA]
+        primary.ensure_connection()
+        replica.ensure_connection()
+        primary.connection.backup(replica.connection)
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.client.force_login(self.alice)
+
+    def test_marked_views_read_from_the_replica(self):
+        Book.objects.create(owner=self.bob, title='Replicated Book', price=10, location='Pune')
+        self.sync_replica()
+        Book.objects.create(owner=self.bob, title='Not Yet Replicated', price=10, location='Pune')
+
+        html = self.client.get(reverse('home')).content.decode()
+        self.assertIn('Replicated Book', html)
+        self.assertNotIn('Not Yet Replicated', html)
+
+        self.sync_replica()
+        self.assertContains(self.client.get(reverse('home')), 'Not Yet Replicated')
+
+    def test_a_write_pins_that_browser_to_the_primary(self):
+        room = ChatRoom.objects.room_for(self.alice.id, self.bob.id)
+        self.sync_replica()
+
+        response = self.client.post(reverse('chat_room', args=[room.id]), {'message': 'Still free on Sunday?'})
+        self.assertIn(PIN_COOKIE, response.cookies)
+        # The replica hasn't caught up, but Alice sees her own message
+        self.assertContains(self.client.get(reverse('chat_list')), 'Still free on Sunday?')
+
+        del self.client.cookies[PIN_COOKIE]
+        self.assertNotContains(self.client.get(reverse('chat_list')), 'Still free on Sunday?')
+
+    def test_writes_and_unsafe_requests_use_the_primary(self):
+        router = PrimaryReplicaRouter()
+
+        @replica_reads
+        def view(request):
+            return router.db_for_read(Book), router.db_for_write(Book)
+
+        request = RequestFactory().get('/')
+        request.pinned_to_primary = False
+        self.assertEqual(view(request), (REPLICA, 'default'))
+
+        request = RequestFactory().post('/')
+        request.pinned_to_primary = False
+        self.assertEqual(view(request), ('default', 'default'))
+
+        # Outside marked views (jobs, commands, checkout) reads stay on the primary
+        self.assertEqual(router.db_for_read(Book), 'default')
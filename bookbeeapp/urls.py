@@ -8,11 +8,14 @@ from django.conf.urls.static import static
 
 urlpatterns = [
     path("", views.home, name="home"),
+    path("feed/", views.home_feed, name="home_feed"),
+    path("browse/", views.browse, name="browse"),
     path("login_view/", views.login_view, name="login_view"),
     path("signup_view/", views.signup_view, name="signup_view"),
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
     path('books/', views.book_list, name='book_list'),
     path('add-book/', views.add_book, name='add_book'),
+    path('import-books/', views.import_books, name='import_books'),
     path('profile/', views.profile, name = 'profile'),
     path('book/<int:pk>/', views.book_detail, name='book_detail'),
     path('add-to-cart/<int:pk>/', views.add_to_cart, name='add_to_cart'),
@@ -25,6 +28,9 @@ urlpatterns = [
     path('user/<str:username>/', views.public_profile, name='public_profile'),
     path('delete-book/<int:pk>/', views.delete_book, name='delete_book'),
     path('activate/<uidb64>/<token>/', views.activate, name='activate'),
+    path('exports/orders.<str:fmt>', views.export_orders, name='export_orders'),
+    path('exports/listings.<str:fmt>', views.export_listings, name='export_listings'),
+    path('stats/views/', views.view_stats, name='view_stats'),
 
 
 ]+ static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,34 +1,192 @@
+import math
+import uuid
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.models import User
 from django.contrib.auth import login
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
 from django.contrib.auth.forms import AuthenticationForm 
-from .forms import BookForm, EditProfileForm 
-from .models import Book, Review, Cart, UserProfile, UserCredit, Order
+from .forms import BookForm, BookImportForm, EditProfileForm
+from .models import Book, Review, Cart, UserProfile, UserCredit, Order, Pincode
 from django.db.models import Q  
 from chat.models import ChatRoom
 from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import EmailMessage
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.core.exceptions import PermissionDenied
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from .pagination import keyset_paginate, InvalidCursor
+from .search import search_books, search_page
+from .geo import within_radius
+from .checkout import checkout_cart, CheckoutError
+from .images import schedule_thumbnails
+from .jobs import enqueue
+from . import exports, facets, instrumentation
+from .pagecache import cache_anonymous_page
+from bookbeeproject.db_router import replica_reads
 
 # --- HOME VIEW ---
-def home(request):
-    books = Book.objects.all().order_by('-created_at')
+FEED_PAGE_SIZE = 24
 
-    query = request.GET.get('q')
+
+NEARBY_RADIUS_CHOICES = [2, 5, 10, 25, 50]
+
+# ?sort= options for the feed; the last key is unique so keyset pages never overlap
+FEED_ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'rating': ('-avg_rating', '-review_count', '-id'),
+}
+
+
+def _nearby(params):
+    """(latitude, longitude, radius_km) for ?near=<pincode>&km=<radius>, or None."""
+    pincode = (params.get('near') or '').strip()
+    if not pincode:
+        return None
+    latitude, longitude, _ = Pincode.locate(pincode)
+    if latitude is None:
+        return None
+    try:
+        radius_km = float(params.get('km') or 10)
+    except ValueError:
+        radius_km = 10
+    if not math.isfinite(radius_km):
+        # nan would slip through the clamp below
+        radius_km = 10
+    return latitude, longitude, min(max(radius_km, 1), 100)
+
+
+def _feed_page(params, cursor):
+    query = params.get('q')
+    books = Book.objects.all()
+
+    genre = params.get('genre')
+    if genre in dict(Book.GENRE_CHOICES):
+        books = books.filter(genre=genre)
+    if params.get('available'):
+        books = books.filter(status='AVAILABLE')
+
+    nearby = _nearby(params)
+    if nearby:
+        books = within_radius(books, *nearby)
 
     if query:
-        # Filter by Title OR Genre OR Location (Case insensitive)
-        books = books.filter(
-            Q(title__icontains=query) | 
-            Q(genre__icontains=query) | 
-            Q(location__icontains=query)
-        )
+        # Ranked full-text search over title, author, description, genre and location
+        return search_page(query, cursor, FEED_PAGE_SIZE, queryset=books)
+
+    ordering = FEED_ORDERINGS.get(params.get('sort'), FEED_ORDERINGS['newest'])
+    return keyset_paginate(books, cursor, FEED_PAGE_SIZE, ordering)
+
+
+@cache_anonymous_page
+@replica_reads
+def home(request):
+    try:
+        page = _feed_page(request.GET, request.GET.get('cursor'))
+    except InvalidCursor:
+        page = _feed_page(request.GET, None)
+
+    if request.GET.get('near') and not _nearby(request.GET):
+        messages.warning(request, f"We don't know where pincode {request.GET['near']} is yet, showing all books.")
+
+    # Filters to carry over to the "load more" requests
+    feed_params = request.GET.copy()
+    feed_params.pop('cursor', None)
+
+    return render(request, 'home.html', {
+        'books': page,
+        'next_cursor': page.next_cursor,
+        'feed_params': feed_params.urlencode(),
+        'radius_choices': NEARBY_RADIUS_CHOICES,
+        'genre_choices': Book.GENRE_CHOICES,
+    })
+
+
+@cache_anonymous_page
+@replica_reads
+def home_feed(request):
+    """Next page of the home feed for infinite scroll (JSON, or card HTML with ?format=html)."""
+    try:
+        page = _feed_page(request.GET, request.GET.get('cursor'))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+
+    if request.GET.get('format') == 'html':
+        response = render(request, 'partials/book_cards.html', {'books': page})
+        response['X-Next-Cursor'] = page.next_cursor or ''
+        return response
+
+    return JsonResponse({
+        'books': [_book_json(book) for book in page],
+        'next_cursor': page.next_cursor,
+    })
+
+
+def _book_json(book):
+    return {
+        'id': book.pk,
+        'title': book.title,
+        'location': book.location,
+        'price': str(book.price),
+        'genre': book.genre,
+        'transaction_type': book.transaction_type,
+        'status': book.status,
+        'avg_rating': round(book.avg_rating, 1),
+        'review_count': book.review_count,
+        'image': book.image.url if book.image else None,
+        'url': reverse('book_detail', args=[book.pk]),
+    }
+
 
-    return render(request, 'home.html', {'books': books})
+# --- BROWSE API ---
+@cache_anonymous_page
+@replica_reads
+def browse(request):
+    """
+    Books narrowed by ?genre=, ?status=, ?transaction_type= and ?price_band=,
+    with the number of books behind every facet value (JSON). The counts
+    come from the FacetCount table (bookbeeapp/facets.py), not from the books.
+    """
+    selected = {}
+    for facet in facets.FACETS:
+        value = request.GET.get(facet)
+        if not value:
+            continue
+        if value not in dict(facets.CHOICES[facet]):
+            return JsonResponse({'error': f'Unknown {facet}: {value}'}, status=400)
+        selected[facet] = value
+
+    books = Book.objects.filter(**{facet: value for facet, value in selected.items() if facet != 'price_band'})
+    if 'price_band' in selected:
+        books = books.filter(**facets.price_filter(selected['price_band']))
+
+    ordering = FEED_ORDERINGS.get(request.GET.get('sort'), FEED_ORDERINGS['newest'])
+    try:
+        page = keyset_paginate(books, request.GET.get('cursor'), FEED_PAGE_SIZE, ordering)
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+
+    total, counts = facets.counts(selected)
+    return JsonResponse({
+        'books': [_book_json(book) for book in page],
+        'next_cursor': page.next_cursor,
+        'total': total,
+        'facets': {
+            facet: [{
+                'value': value,
+                'label': label,
+                'count': counts[facet][value],
+                'selected': selected.get(facet) == value,
+            } for value, label in facets.CHOICES[facet]]
+            for facet in facets.FACETS
+        },
+    })
 
 # --- AUTH VIEWS ---
 def signup_view(request):
@@ -74,12 +232,9 @@ def signup_view(request):
             'token': default_token_generator.make_token(user),
         })
         
-        try:
-            email_msg = EmailMessage(mail_subject, message, to=[email])
-            email_msg.send()
-            messages.success(request, "Please check your email to verify your account! 📧")
-        except Exception as e:
-            messages.error(request, f"Error sending email: {e}")
+        # Sent by the background worker (manage.py run_jobs), so a slow SMTP server can't stall signup
+        enqueue('send_email', subject=mail_subject, body=message, to=[email])
+        messages.success(request, "Please check your email to verify your account! 📧")
 
         return redirect("login_view")
         
@@ -108,20 +263,43 @@ def add_book(request):
             book = form.save(commit=False) 
             book.owner = request.user       
             book.save()                    
+            schedule_thumbnails(book)
             return redirect('home')   
     else:
         form = BookForm()
     return render(request, 'add_book.html', {'form': form})
 
+@login_required(login_url='login_view')
+def import_books(request):
+    """Upload a listings file and a zip of covers; the import runs as a background job."""
+    if request.method == 'POST':
+        form = BookImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            folder = f'imports/{uuid.uuid4().hex}'
+            listings, covers = (
+                default_storage.save(f'{folder}/{upload.name}', upload)
+                for upload in (form.cleaned_data['listings'], form.cleaned_data['covers'])
+            )
+            # Not retried: a second run would list the books twice
+            enqueue('import_books', max_attempts=1, owner_id=request.user.id, listings=listings, covers=covers)
+            messages.success(request, "Your books are being imported! We'll email you a summary when they're listed. 📚")
+            return redirect('profile')
+    else:
+        form = BookImportForm()
+    return render(request, 'import_books.html', {'form': form})
+
+@cache_anonymous_page
+@replica_reads
 def book_list(request):
     query = request.GET.get('q')
     if query:
-        books = Book.objects.filter(title__icontains=query)
+        books = search_books(query, limit=100)
     else:
         books = Book.objects.all()
     return render(request, 'book_list.html', {'books': books}) 
 
 @login_required(login_url='login_view')
+@replica_reads
 def book_detail(request, pk):
     book = get_object_or_404(Book, pk=pk)
     has_bought = Order.objects.filter(buyer=request.user, book=book).exists()
@@ -131,10 +309,11 @@ def book_detail(request, pk):
             messages.error(request, "You must borrow or buy this book to review it! 🚫")
             return redirect('book_detail', pk=pk)
 
-        rating = request.POST.get('rating')
+        rating = request.POST.get('rating', '')
+        rating = int(rating) if rating.isdigit() else None
         comment = request.POST.get('comment')
         
-        if rating and comment:
+        if rating and 1 <= rating <= 5 and comment:
             Review.objects.create(
                 author=request.user,
                 book=book,
@@ -144,10 +323,8 @@ def book_detail(request, pk):
             messages.success(request, "Review added successfully! ⭐")
             return redirect('book_detail', pk=pk)
 
-    reviews = Review.objects.filter(book=book).order_by('-id')
-    avg_rating = 0
-    if reviews.exists():
-        avg_rating = sum(r.rating for r in reviews) / reviews.count()
+    reviews = Review.objects.filter(book=book).select_related('author').order_by('-id')
+    avg_rating = book.avg_rating
 
     return render(request, 'book_detail.html', {
         'book': book,
@@ -171,7 +348,7 @@ def add_to_cart(request, pk):
     cart.items.add(book)
 
     # 3. Create Chat Room
-    ChatRoom.objects.get_or_create(user1=request.user, user2=book.owner)
+    ChatRoom.objects.room_for(request.user.id, book.owner_id)
     
     messages.success(request, f"Added {book.title} to your cart!")
     return redirect('cart_view')
@@ -179,11 +356,12 @@ def add_to_cart(request, pk):
 @login_required(login_url='login_view')
 def cart_view(request):
     cart, created = Cart.objects.get_or_create(user=request.user)
-    items = []
-    for book in cart.items.all():
-        room, created = ChatRoom.objects.get_or_create(user1=request.user, user2=book.owner)
-        book.room = room
-        items.append(book)
+    items = list(cart.items.all())
+
+    # All chat rooms with the sellers in one lookup (plus one bulk insert for new ones)
+    rooms = ChatRoom.objects.rooms_with(request.user.id, {book.owner_id for book in items})
+    for book in items:
+        book.room = rooms.get(book.owner_id)
 
     total_price = sum(book.price for book in items)
     return render(request, 'cart.html', {'items': items, 'total_price': total_price})
@@ -219,21 +397,16 @@ def checkout(request):
 
 @login_required(login_url='login_view')
 def payment_success(request):
-    cart = Cart.objects.get(user=request.user)
-    
-    for book in cart.items.all():
-        Order.objects.create(buyer=request.user, seller=book.owner, book=book)
-        
-        if book.transaction_type == 'rent':
-            book.status = 'LENDED'
-            book.is_available = False  
+    try:
+        checkout_cart(request.user)
+    except CheckoutError as e:
+        if e.books:
+            titles = ", ".join(book.title for book in e.books)
+            messages.error(request, f"{e} Please remove: {titles}")
         else:
-            book.owner = request.user 
-            book.status = 'SOLD'       
-            book.is_available = False  
-        book.save()
+            messages.error(request, str(e))
+        return redirect('cart_view')
 
-    cart.items.clear()
     messages.success(request, "Payment Successful! Order Placed. 🐝")
     return redirect('home')
 
@@ -276,8 +449,7 @@ def profile(request):
         return redirect('profile')
 
     # --- PAGE DATA ---
-    user_credits = UserCredit.objects.filter(receiver=request.user).order_by('-created_at')
-    total_score = sum(c.score for c in user_credits)
+    total_score = user_profile.trust_score
     my_listings = Book.objects.filter(owner=request.user).exclude(status='SOLD').order_by('-created_at')
     borrowed_books = Order.objects.filter(buyer=request.user, book__transaction_type='rent').order_by('-created_at')
     purchased_books = Order.objects.filter(buyer=request.user, book__transaction_type='buy').order_by('-created_at')
@@ -305,7 +477,11 @@ def edit_profile(request):
     form = EditProfileForm(instance=request.user)
     return render(request, 'edit_profile.html', {'form': form})
 
+RECENT_CREDITS = 20
+
+
 @login_required(login_url='login_view')
+@replica_reads
 def public_profile(request, username):
     profile_user = get_object_or_404(User, username=username)
 
@@ -339,9 +515,9 @@ def public_profile(request, username):
             messages.error(request, "You must transact with this user first.")
         return redirect('public_profile', username=username)
 
-    # 📊 Trust Score
-    user_credits = UserCredit.objects.filter(receiver=profile_user).order_by('-created_at')
-    total_score = sum(c.score for c in user_credits)
+    # 📊 Trust Score (stored total, plus only the latest few credits for display)
+    total_score = user_profile.trust_score
+    user_credits = UserCredit.objects.filter(receiver=profile_user).select_related('giver').order_by('-created_at')[:RECENT_CREDITS]
 
     # 📚 Active Listings
     lent_books = Book.objects.filter(owner=profile_user).exclude(status='SOLD')
@@ -386,4 +562,59 @@ def activate(request, uidb64, token):
         return redirect('login_view')
     else:
         messages.error(request, 'Activation link is invalid or expired!')
-        return redirect('signup_view')
\ No newline at end of file
+        return redirect('signup_view')
+
+
+# --- EXPORTS ---
+def _export_owner(request, field):
+    """Only your own rows, unless staff ask for ?all=1."""
+    if request.GET.get('all'):
+        if not request.user.is_staff:
+            raise PermissionDenied
+        return {}
+    return {field: request.user}
+
+def _stream_export(request, fmt, name, queryset, columns):
+    if fmt not in exports.FORMATS:
+        raise Http404
+    # Rows are read while the response streams, after replica_reads has returned, so pick the database now
+    queryset = queryset.using(queryset.db)
+    response = StreamingHttpResponse(exports.stream(queryset, columns, fmt), content_type=exports.FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="bookbee-{name}.{fmt}"'
+    response['Cache-Control'] = 'private, no-store'
+    return response
+
+@login_required(login_url='login_view')
+@replica_reads
+def export_orders(request, fmt):
+    """Stream orders as CSV/JSONL: ?role=seller (default) or buyer, ?from=/?to= dates, ?all=1 for staff."""
+    role = request.GET.get('role', 'seller')
+    if role not in ('buyer', 'seller'):
+        return HttpResponseBadRequest("role must be buyer or seller")
+    try:
+        created = exports.date_range(request.GET.get('from'), request.GET.get('to'))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    queryset = exports.orders(**_export_owner(request, role), **created)
+    return _stream_export(request, fmt, 'orders', queryset, exports.ORDER_COLUMNS)
+
+@login_required(login_url='login_view')
+@replica_reads
+def export_listings(request, fmt):
+    """Stream listings as CSV/JSONL, filtered on when they were listed with ?from=/?to=."""
+    try:
+        created = exports.date_range(request.GET.get('from'), request.GET.get('to'))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    queryset = exports.listings(**_export_owner(request, 'owner'), **created)
+    return _stream_export(request, fmt, 'listings', queryset, exports.LISTING_COLUMNS)
+
+
+# --- INSTRUMENTATION ---
+@staff_member_required
+def view_stats(request):
+    """Latency, SQL time, query count and duplicate queries per URL name, for this worker process."""
+    return JsonResponse({
+        'sample_rate': settings.INSTRUMENTATION_SAMPLE_RATE,
+        'views': instrumentation.snapshot(),
+    }, json_dumps_params={'indent': 2})
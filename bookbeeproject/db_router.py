@@ -0,0 +1,114 @@
+"""
+Primary/replica database routing.
+
+Writes always go to 'default' (the primary). Reads go to a replica from
+settings.DATABASE_REPLICAS only inside views decorated with
+@replica_reads, and only for GET/HEAD. Everything else (background jobs,
+management commands, checkout) reads from the primary, so nothing ever
+makes a decision on stale data by accident.
+
+Read-your-writes: ReadYourWritesMiddleware notices any write made while
+handling a request and sets a short-lived cookie. While it's present that
+browser's requests skip the replicas, so a user always sees their own
+new listing, order or message even if replication is a few seconds behind.
+"""
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'primary_pin'
+SAFE_METHODS = ('GET', 'HEAD')
+
+_use_replica = ContextVar('use_replica', default=False)
+_writes = ContextVar('writes', default=None)
+
+
+class _Writes:
+    happened = False
+
+
+def replica_reads(view):
+    """Serve this view's reads from a replica unless the visitor wrote something recently."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS or getattr(request, 'pinned_to_primary', True):
+            return view(request, *args, **kwargs)
+        token = _use_replica.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+    return wrapper
+
+
+class ReadYourWritesMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        writes, token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _writes.reset(token)
+        return self._finish(writes, response)
+
+    async def __acall__(self, request):
+        # Sync views run in a copy of this context, so they record into the same _Writes
+        writes, token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _writes.reset(token)
+        return self._finish(writes, response)
+
+    def _start(self, request):
+        request.pinned_to_primary = PIN_COOKIE in request.COOKIES
+        writes = _Writes()
+        return writes, _writes.set(writes)
+
+    def _finish(self, writes, response):
+        if writes.happened:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.READ_YOUR_WRITES_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        writes = _writes.get()
+        if (
+            not _use_replica.get()
+            or not settings.DATABASE_REPLICAS
+            # Once this request has written, or inside a transaction, stay consistent with the primary
+            or (writes is not None and writes.happened)
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        writes = _writes.get()
+        if writes is not None:
+            writes.happened = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema by replicating the primary
+        return db not in settings.DATABASE_REPLICAS
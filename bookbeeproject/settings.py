@@ -2,6 +2,7 @@
 Django settings for bookbeeproject project.
 """
 
+from copy import deepcopy
 from pathlib import Path
 import os  # Added from friend's code
 
@@ -36,6 +37,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "bookbeeapp.instrumentation.InstrumentationMiddleware",
+    # Before SessionMiddleware, so session saves count as writes too
+    "bookbeeproject.db_router.ReadYourWritesMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -68,12 +72,70 @@ WSGI_APPLICATION = "bookbeeproject.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# DB_ENGINE=postgres for production; SQLite (the default) is for development.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get('DB_NAME', 'bookbee'),
+            "USER": os.environ.get('DB_USER', 'bookbee'),
+            "PASSWORD": os.environ.get('DB_PASSWORD', ''),
+            "HOST": os.environ.get('DB_HOST', 'localhost'),
+            "PORT": os.environ.get('DB_PORT', '5432'),
+            # Keep connections open between requests, and check them before reuse
+            "CONN_MAX_AGE": int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {},
+        }
     }
-}
+    if os.environ.get('DB_POOL_MAX_SIZE'):
+        # psycopg's connection pool (pip install "psycopg[pool]") replaces persistent connections
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            "max_size": int(os.environ['DB_POOL_MAX_SIZE']),
+            "timeout": 10,
+        }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get('SQLITE_PATH', BASE_DIR / "db.sqlite3"),
+            "OPTIONS": {
+                # WAL lets readers carry on while one connection writes; NORMAL
+                # syncs at checkpoints instead of on every commit (safe under WAL)
+                "init_command": (
+                    "PRAGMA journal_mode=WAL;"
+                    "PRAGMA synchronous=NORMAL;"
+                    "PRAGMA busy_timeout=5000;"
+                ),
+                # Take the write lock when a transaction starts. A DEFERRED
+                # transaction that reads and then writes fails at once with
+                # "database is locked" if another connection wrote meanwhile.
+                "transaction_mode": "IMMEDIATE",
+            },
+            # Threads in the concurrency tests need a real file; the default
+            # shared in-memory test database locks whole tables instead
+            "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
+        }
+    }
+
+# Read replicas: DB_REPLICAS is a comma-separated list of replica hosts
+# (PostgreSQL) or database files (SQLite). Only views marked with
+# @replica_reads read from them; see bookbeeproject/db_router.py.
+for number, location in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    replica = deepcopy(DATABASES["default"])
+    replica["HOST" if DB_ENGINE == 'postgres' else "NAME"] = location.strip()
+    replica["TEST"] = {"MIRROR": "default"}
+    DATABASES[f"replica{number}"] = replica
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["bookbeeproject.db_router.PrimaryReplicaRouter"]
+
+# After a write, that browser reads from the primary for this long (> replication lag)
+READ_YOUR_WRITES_SECONDS = 10
 
 
 # Password validation
@@ -130,4 +192,63 @@ LOGOUT_REDIRECT_URL = 'login_view'
 
 # --- EMAIL SETTINGS (Crucial for Verification) ---
 # Kept this from your code so the email feature works
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
\ No newline at end of file
+# Override with e.g. EMAIL_BACKEND=django.core.mail.backends.filebased.EmailBackend
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', BASE_DIR / 'sent_emails')
+
+# --- BACKGROUND JOBS ---
+# Jobs (e.g. verification emails) are run by `python manage.py run_jobs`.
+# Set JOBS_EAGER=1 to run them in-process right after the request instead.
+JOBS_EAGER = os.environ.get('JOBS_EAGER', '') == '1'
+
+# --- CACHE ---
+# 'default' holds the rendered feed cards (templates/partials/book_cards.html).
+# 'pages' holds whole pages for logged-out visitors (bookbeeapp/pagecache.py);
+# PAGE_CACHE_BACKEND picks where: locmem (per process), file (shared by the
+# processes on one machine) or redis (shared by all servers; needs `pip install redis`).
+PAGE_CACHE_ALIAS = 'pages'
+PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', 30))
+PAGE_CACHE_BACKENDS = {
+    'locmem': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pages'},
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('PAGE_CACHE_DIR', BASE_DIR / 'page_cache'),
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    PAGE_CACHE_ALIAS: {
+        **PAGE_CACHE_BACKENDS[os.environ.get('PAGE_CACHE_BACKEND', 'locmem')],
+        'TIMEOUT': PAGE_CACHE_TTL,
+    },
+}
+
+# --- SEARCH ---
+# SQLiteFTSBackend needs the FTS5 table from migration 0010, which only exists on SQLite
+BOOK_SEARCH_BACKEND = os.environ.get(
+    'BOOK_SEARCH_BACKEND',
+    'bookbeeapp.search.SQLiteFTSBackend' if DB_ENGINE == 'sqlite' else 'bookbeeapp.search.BasicSearchBackend',
+)
+
+# --- REAL-TIME CHAT ---
+# Pub/sub used to push new messages to open websockets (see chat/pubsub.py).
+# The in-process broker only reaches sockets served by the same process.
+CHAT_BROKER = 'chat.pubsub.InProcessBroker'
+
+# --- COVER THUMBNAILS ---
+# Resizing runs on this many background threads after an upload commits
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_ASYNC = True
+
+# --- INSTRUMENTATION ---
+# Fraction of requests whose latency and SQL are recorded per view (see
+# bookbeeapp/instrumentation.py); staff can read the stats at /stats/views/.
+INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('INSTRUMENTATION_SAMPLE_RATE', '1' if DEBUG else '0.05'))
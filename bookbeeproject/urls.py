@@ -20,6 +20,7 @@ from django.urls import path, include
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("api/v1/", include("bookbeeapp.api_urls")),
     path("", include("bookbeeapp.urls")),
     
 ]
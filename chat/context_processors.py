@@ -1,12 +1,13 @@
-from .models import Message
-from django.db.models import Q
+from django.utils.functional import SimpleLazyObject
+
+from .models import UnreadCounter
 
 def unread_messages_count(request):
     if request.user.is_authenticated:
-    
-        count = Message.objects.filter(is_read=False).exclude(sender=request.user).filter(
-            Q(room__user1=request.user) | Q(room__user2=request.user)
-        ).count()
-        
+        # Single primary-key read of the denormalized counter, and only
+        # when a template actually shows the badge
+        user_id = request.user.id
+        count = SimpleLazyObject(lambda: UnreadCounter.for_user(user_id))
+
         return {'total_unread_messages': count}
-    return {'total_unread_messages': 0}
\ No newline at end of file
+    return {'total_unread_messages': 0}
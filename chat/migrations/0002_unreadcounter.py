@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:15
+
+import django.db.models.deletion
+from django.conf import settings
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_counters(apps, schema_editor):
+    Message = apps.get_model("chat", "Message")
+    UnreadCounter = apps.get_model("chat", "UnreadCounter")
+
+    totals = Counter()
+    unread = (
+        Message.objects.filter(is_read=False)
+        .values("room__user1_id", "room__user2_id", "sender_id")
+        .annotate(total=Count("id"))
+    )
+    for row in unread:
+        if row["sender_id"] == row["room__user1_id"]:
+            totals[row["room__user2_id"]] += row["total"]
+        else:
+            totals[row["room__user1_id"]] += row["total"]
+
+    UnreadCounter.objects.bulk_create(
+        UnreadCounter(user_id=user_id, count=count) for user_id, count in totals.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("chat", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UnreadCounter",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="unread_counter",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("count", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:02
+
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+def merge_duplicate_rooms(apps, schema_editor):
+    """Fold every extra room of a pair (in either user order) into the pair's oldest room."""
+    ChatRoom = apps.get_model("chat", "ChatRoom")
+    Message = apps.get_model("chat", "Message")
+    db = schema_editor.connection.alias
+
+    keep = {}
+    duplicates = {}
+    rooms = (
+        ChatRoom.objects.using(db)
+        .order_by("id")
+        .values_list("id", "user1_id", "user2_id")
+    )
+    for room_id, user1_id, user2_id in rooms.iterator():
+        pair = (min(user1_id, user2_id), max(user1_id, user2_id))
+        if pair in keep:
+            duplicates[room_id] = keep[pair]
+        else:
+            keep[pair] = room_id
+
+    # Unread totals are per user, so moving messages between their rooms leaves them right
+    for room_id, kept_id in duplicates.items():
+        Message.objects.using(db).filter(room_id=room_id).update(room_id=kept_id)
+    ChatRoom.objects.using(db).filter(id__in=list(duplicates)).delete()
+
+
+class Migration(migrations.Migration):
+    # The merge commits in its own transaction before the unique index is built:
+    # PostgreSQL can't CREATE INDEX while the merge's deferred FK checks are pending
+    atomic = False
+
+    dependencies = [
+        ("chat", "0004_message_unread_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_rooms, migrations.RunPython.noop, atomic=True
+        ),
+        migrations.AddConstraint(
+            model_name="chatroom",
+            constraint=models.UniqueConstraint(
+                django.db.models.functions.comparison.Least("user1", "user2"),
+                django.db.models.functions.comparison.Greatest("user1", "user2"),
+                name="chat_room_pair_unique",
+            ),
+        ),
+    ]
@@ -1,17 +1,131 @@
 from django.db import models
 
 # Create your models here.
-from django.db import models
+from django.db import models, IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Greatest, Least
 from django.contrib.auth.models import User
 
+from .pubsub import get_broker, user_channel
+
+class ChatRoomManager(models.Manager):
+    def between(self, user_id, other_ids):
+        """Existing rooms between a user and any of `other_ids`, in either user1/user2 order."""
+        return self.filter(
+            Q(user1_id=user_id, user2_id__in=other_ids) | Q(user2_id=user_id, user1_id__in=other_ids)
+        )
+
+    def rooms_with(self, user_id, other_ids):
+        """
+        {other_id: room} for a user and each of `other_ids`, creating the
+        missing rooms with one bulk insert. New rooms use the canonical
+        (lower id, higher id) ordering, and the chat_room_pair_unique
+        constraint makes the same pair always share one room.
+        """
+        other_ids = set(other_ids) - {user_id}
+        rooms = {}
+        for room in self.between(user_id, other_ids).order_by('id'):
+            rooms.setdefault(room.other_user_id(user_id), room)
+
+        missing = [other_id for other_id in other_ids if other_id not in rooms]
+        if missing:
+            self.bulk_create([
+                self.model(user1_id=min(user_id, other_id), user2_id=max(user_id, other_id))
+                for other_id in missing
+            ], ignore_conflicts=True)
+            # Read them back: a concurrent request may have created some of them first
+            for room in self.between(user_id, missing):
+                rooms[room.other_user_id(user_id)] = room
+        return rooms
+
+    def room_for(self, user_id, other_id):
+        return self.rooms_with(user_id, [other_id])[other_id]
+
+    def inbox(self, user):
+        """A user's rooms with unread count and latest message, most recently active first."""
+        latest = Message.objects.filter(room=OuterRef('pk')).order_by('-created_at', '-id')
+        return self.filter(
+            Q(user1=user) | Q(user2=user)
+        ).select_related(
+            # Both participants and their avatars come in the same query
+            'user1__userprofile', 'user2__userprofile'
+        ).annotate(
+            unread_count=Count(
+                'message',
+                filter=Q(message__is_read=False) & ~Q(message__sender=user)
+            ),
+            last_message=Subquery(latest.values('text')[:1]),
+            last_message_at=Subquery(latest.values('created_at')[:1]),
+        ).order_by(F('last_message_at').desc(nulls_last=True), '-created_at')
+
+
 class ChatRoom(models.Model):
     user1 = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_user1')
     user2 = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_user2')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ChatRoomManager()
+
+    class Meta:
+        constraints = [
+            # One room per pair of users, whichever of them is user1
+            models.UniqueConstraint(Least('user1', 'user2'), Greatest('user1', 'user2'), name='chat_room_pair_unique'),
+        ]
+
+    def other_user_id(self, user_id):
+        return self.user2_id if user_id == self.user1_id else self.user1_id
+
 class Message(models.Model):
     room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE)
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
\ No newline at end of file
+    is_read = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # Room history is read newest-first in (created_at, id) pages
+            models.Index(fields=['room', 'created_at'], name='chat_msg_room_created_idx'),
+            # Unread messages per room; read messages (almost all of them) stay out of it
+            models.Index(
+                fields=['room', 'sender'],
+                condition=Q(is_read=False),
+                name='chat_msg_unread_idx',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        # The recipient's unread count (chat/signals.py) must commit with the message.
+        # Otherwise the recipient can mark it read, and decrement, before it was counted.
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
+class UnreadCounter(models.Model):
+    """Number of unread messages addressed to a user, kept in sync by chat/signals.py."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='unread_counter')
+    count = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def add(cls, user_id, delta):
+        if delta > 0:
+            if not cls.objects.filter(user_id=user_id).update(count=F('count') + delta):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(user_id=user_id, count=delta)
+                except IntegrityError:
+                    # Someone else created the row first
+                    cls.objects.filter(user_id=user_id).update(count=F('count') + delta)
+        elif delta < 0:
+            cls.objects.filter(user_id=user_id).update(count=Greatest(F('count') + delta, 0))
+        if delta:
+            # Update the badge in the user's open tabs (chat.views.unread_stream)
+            transaction.on_commit(lambda: cls.publish(user_id))
+
+    @classmethod
+    def publish(cls, user_id):
+        get_broker().publish(user_channel(user_id), {'type': 'unread', 'count': cls.for_user(user_id)})
+
+    @classmethod
+    def for_user(cls, user_id):
+        return cls.objects.filter(user_id=user_id).values_list('count', flat=True).first() or 0
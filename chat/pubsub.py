@@ -0,0 +1,87 @@
+"""
+Publish/subscribe layer for real-time chat.
+
+Views and signals publish plain dicts to a channel name (one per chat room,
+plus one per user for their unread total); every open websocket or event
+stream subscribed to that channel gets a copy. The broker
+class comes from settings.CHAT_BROKER, so the in-process broker below can be
+swapped for one backed by a local message broker (Redis pub/sub, etc.) when
+running more than one server process. A replacement only needs the same
+subscribe()/publish() methods.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+def room_channel(room_id):
+    return f'chat.room.{room_id}'
+
+
+def user_channel(user_id):
+    return f'chat.user.{user_id}'
+
+
+class Subscription:
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker._unsubscribe(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.get()
+
+
+class InProcessBroker:
+    """
+    Fan-out between sockets served by this process only. publish() is safe
+    to call from sync code running in any thread (views, signal handlers).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, channel):
+        """Must be called from inside the event loop that will read the subscription."""
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscriptions.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[subscription.channel]
+
+    def publish(self, channel, payload):
+        with self._lock:
+            subscribers = list(self._subscriptions.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.queue.put_nowait, payload)
+            except RuntimeError:
+                # The subscriber's event loop has shut down
+                self._unsubscribe(subscription)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.CHAT_BROKER)()
@@ -0,0 +1,143 @@
+"""
+Real-time chat over websockets, served straight from bookbeeproject/asgi.py.
+
+    ws://<host>/ws/chat/<room_id>/
+
+Client -> server:  {"type": "message", "text": "..."}
+Server -> client:  {"type": "message", "id": .., "sender": "username", "text": .., "time": ..}
+
+New messages are published to the room's channel by the Message post_save
+signal (chat/signals.py), so messages sent with the old form POST are pushed
+too. Each message costs one INSERT and one push per open socket instead of
+a full re-render of the room.
+"""
+import asyncio
+import json
+import re
+from http.cookies import SimpleCookie
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import close_old_connections
+from django.http import HttpRequest
+from django.utils.dateformat import time_format
+from django.utils.timezone import localtime
+
+from .models import ChatRoom, Message, UnreadCounter
+from .pubsub import get_broker, room_channel
+
+ROOM_PATH = re.compile(r'^/ws/chat/(?P<room_id>\d+)/$')
+
+# Longest message accepted over the socket
+MAX_MESSAGE_LENGTH = 5000
+
+
+def serialize_message(message):
+    return {
+        'type': 'message',
+        'id': message.id,
+        'sender_id': message.sender_id,
+        'sender': message.sender.username,
+        'text': message.text,
+        'created_at': message.created_at.isoformat(),
+        'time': time_format(localtime(message.created_at), 'h:i A'),
+    }
+
+
+def _headers(scope):
+    return {name.decode('latin1').lower(): value.decode('latin1') for name, value in scope.get('headers', [])}
+
+
+def _same_origin(headers):
+    # Browsers always send Origin on websocket handshakes; refuse other sites' pages
+    origin = headers.get('origin')
+    return origin is None or urlsplit(origin).netloc == headers.get('host')
+
+
+def _user_and_room(headers, room_id):
+    """Resolve the session cookie to a user, and the room if they are in it."""
+    close_old_connections()
+    cookies = SimpleCookie(headers.get('cookie', ''))
+    morsel = cookies.get(settings.SESSION_COOKIE_NAME)
+
+    request = HttpRequest()
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore(morsel.value if morsel else None)
+    user = get_user(request)
+    if not user.is_authenticated:
+        return None, None
+
+    room = ChatRoom.objects.filter(id=room_id).first()
+    if room is None or user.id not in (room.user1_id, room.user2_id):
+        return user, None
+    return user, room
+
+
+def _create_message(room, user, text):
+    close_old_connections()
+    # The post_save signal publishes it to everyone in the room
+    Message.objects.create(room=room, sender=user, text=text)
+
+
+def _mark_read(message_id, user):
+    close_old_connections()
+    if Message.objects.filter(id=message_id, is_read=False).exclude(sender=user).update(is_read=True):
+        UnreadCounter.add(user.id, -1)
+
+
+async def chat_socket(scope, receive, send):
+    match = ROOM_PATH.match(scope['path'])
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+
+    headers = _headers(scope)
+    if match is None or not _same_origin(headers):
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+
+    user, room = await sync_to_async(_user_and_room)(headers, int(match['room_id']))
+    if room is None:
+        await send({'type': 'websocket.close', 'code': 4403})
+        return
+
+    await send({'type': 'websocket.accept'})
+    subscription = get_broker().subscribe(room_channel(room.id))
+
+    async def push():
+        async for payload in subscription:
+            await send({'type': 'websocket.send', 'text': json.dumps(payload)})
+            if payload.get('type') == 'message' and payload['sender_id'] != user.id:
+                # The recipient is looking at the room, so it's read already
+                await sync_to_async(_mark_read)(payload['id'], user)
+
+    pusher = asyncio.ensure_future(push())
+    try:
+        while True:
+            event = await receive()
+            if event['type'] == 'websocket.disconnect':
+                break
+            if event['type'] != 'websocket.receive':
+                continue
+            try:
+                data = json.loads(event.get('text') or '')
+            except ValueError:
+                continue
+            if not isinstance(data, dict) or data.get('type') != 'message':
+                continue
+            text = str(data.get('text', '')).strip()
+            if text:
+                await sync_to_async(_create_message)(room, user, text[:MAX_MESSAGE_LENGTH])
+    finally:
+        subscription.close()
+        pusher.cancel()
+
+
+async def websocket_application(scope, receive, send):
+    if ROOM_PATH.match(scope['path']):
+        await chat_socket(scope, receive, send)
+    else:
+        await receive()
+        await send({'type': 'websocket.close', 'code': 4404})
@@ -0,0 +1,33 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import ChatRoom, Message, UnreadCounter
+from .pubsub import get_broker, room_channel
+
+
+# --- UNREAD COUNTERS ---
+@receiver(post_save, sender=Message)
+def count_new_message(sender, instance, created, **kwargs):
+    if created and not instance.is_read:
+        UnreadCounter.add(instance.room.other_user_id(instance.sender_id), 1)
+
+
+@receiver(post_delete, sender=Message)
+def forget_unread_message(sender, instance, using, **kwargs):
+    if instance.is_read:
+        return
+    # Also runs for every message of a deleted room or user: they are deleted
+    # (and signalled) before their room, so the room is still there to ask
+    users = ChatRoom.objects.using(using).filter(pk=instance.room_id).values_list('user1_id', 'user2_id').first()
+    if users:
+        UnreadCounter.add(users[1] if instance.sender_id == users[0] else users[0], -1)
+
+
+# --- REAL-TIME PUSH ---
+@receiver(post_save, sender=Message)
+def push_new_message(sender, instance, created, **kwargs):
+    if created:
+        from .realtime import serialize_message
+        payload = serialize_message(instance)
+        transaction.on_commit(lambda: get_broker().publish(room_channel(instance.room_id), payload))
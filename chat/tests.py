@@ -1,3 +1,346 @@
-from django.test import TestCase
+import asyncio
+import json
+from datetime import timedelta
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Q
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from bookbeeapp.models import Book, Cart, UserProfile
+from .models import ChatRoom, Message, UnreadCounter
+from .pubsub import get_broker, room_channel, user_channel
+from .realtime import websocket_application
+from .views import HISTORY_PAGE_SIZE
+
+
+class ChatListQueryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader')
+        UserProfile.objects.create(user=self.user, avatar='av1.png')
+        self.client.force_login(self.user)
+
+    def make_rooms(self, count):
+        start = ChatRoom.objects.count()
+        for i in range(start, start + count):
+            other = User.objects.create_user(f'seller{i}')
+            if i % 2:
+                UserProfile.objects.create(user=other, avatar='av2.png')
+            # Alternate sides so both user1/user2 branches are exercised
+            pair = (self.user, other) if i % 2 else (other, self.user)
+            room = ChatRoom.objects.create(user1=pair[0], user2=pair[1])
+            Message.objects.create(room=room, sender=other, text=f'Is book {i} still available?')
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('chat_list'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_does_not_grow_with_rooms(self):
+        self.make_rooms(2)
+        few, _ = self.count_queries()
+
+        self.make_rooms(30)
+        many, response = self.count_queries()
+
+        self.assertEqual(few, many)
+        self.assertEqual(len(response.context['rooms']), 32)
+
+    def test_shows_other_participant_preview_and_unread(self):
+        self.make_rooms(2)
+        _, response = self.count_queries()
+
+        for room in response.context['rooms']:
+            self.assertNotEqual(room.other, self.user)
+            self.assertEqual(room.unread_count, 1)
+        self.assertContains(response, 'Is book 1 still available?')
+
+
+class UnreadStreamTests(TransactionTestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('reader')
+        self.seller = User.objects.create_user('seller')
+        self.room = ChatRoom.objects.room_for(self.reader.id, self.seller.id)
+
+    async def next_count(self, events):
+        chunk = await asyncio.wait_for(anext(events), timeout=5)
+        data = chunk.decode()
+        self.assertTrue(data.startswith('data: '), data)
+        return json.loads(data[len('data: '):])['count']
+
+    async def test_pushes_the_new_total_when_a_message_arrives(self):
+        await self.async_client.aforce_login(self.reader)
+        response = await self.async_client.get(reverse('unread_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        events = aiter(response.streaming_content)
+        self.assertEqual(await self.next_count(events), 0)
+
+        send = sync_to_async(Message.objects.create)
+        await send(room=self.room, sender=self.seller, text='Still want the book?')
+        self.assertEqual(await self.next_count(events), 1)
+        # The reader's own messages don't count against them
+        await send(room=self.room, sender=self.reader, text='Yes please!')
+        await send(room=self.room, sender=self.seller, text='Great, see you at 5.')
+        self.assertEqual(await self.next_count(events), 2)
+
+        # A client disconnect cancels the pending read, which must drop the subscription
+        pending = asyncio.ensure_future(anext(events))
+        await asyncio.sleep(0.05)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertNotIn(user_channel(self.reader.id), get_broker()._subscriptions)
+
+    def test_wsgi_and_anonymous_clients_are_told_not_to_reconnect(self):
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.get(reverse('unread_stream')).status_code, 204)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('unread_stream')).status_code, 204)
+
+
+class ChatSocketTests(TransactionTestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('reader')
+        self.seller = User.objects.create_user('seller')
+        self.room = ChatRoom.objects.room_for(self.reader.id, self.seller.id)
+
+    def session_cookie(self, user):
+        self.client.force_login(user)
+        return self.client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    async def connect(self, user=None, room_id=None, origin='http://testserver'):
+        headers = [(b'host', b'testserver'), (b'origin', origin.encode())]
+        if user is not None:
+            cookie = await sync_to_async(self.session_cookie)(user)
+            headers.append((b'cookie', f'{settings.SESSION_COOKIE_NAME}={cookie}'.encode()))
+        socket = ApplicationCommunicator(websocket_application, {
+            'type': 'websocket', 'path': f'/ws/chat/{room_id or self.room.id}/', 'headers': headers,
+        })
+        await socket.send_input({'type': 'websocket.connect'})
+        return socket, await socket.receive_output(5)
+
+    async def say(self, socket, text):
+        await socket.send_input({'type': 'websocket.receive', 'text': json.dumps({'type': 'message', 'text': text})})
+
+    async def heard(self, socket):
+        event = await socket.receive_output(5)
+        self.assertEqual(event['type'], 'websocket.send')
+        return json.loads(event['text'])
+
+    async def test_messages_reach_the_other_participant(self):
+        reader, accepted = await self.connect(self.reader)
+        self.assertEqual(accepted, {'type': 'websocket.accept'})
+        seller, _ = await self.connect(self.seller)
+
+        await self.say(seller, 'Still want the book?')
+        for socket in (reader, seller):
+            message = await self.heard(socket)
+            self.assertEqual((message['sender'], message['text']), ('seller', 'Still want the book?'))
+
+        # The reader had the room open, so the message is read straight away
+        for _ in range(50):
+            if await Message.objects.filter(pk=message['id'], is_read=True).aexists():
+                break
+            await asyncio.sleep(0.02)
+        else:
+            self.fail("The open room didn't mark the message read")
+
+        # Messages posted with the old form are pushed too, and junk frames are ignored
+        await reader.send_input({'type': 'websocket.receive', 'text': 'not json'})
+        await sync_to_async(Message.objects.create)(room=self.room, sender=self.reader, text='Yes please!')
+        self.assertEqual((await self.heard(seller))['text'], 'Yes please!')
+        self.assertEqual(await Message.objects.filter(room=self.room).acount(), 2)
+
+        for socket in (reader, seller):
+            await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await socket.wait(5)
+        self.assertNotIn(room_channel(self.room.id), get_broker()._subscriptions)
+
+    async def test_only_participants_from_this_site_can_connect(self):
+        stranger = await sync_to_async(User.objects.create_user)('stranger')
+        for user, origin, code in (
+            (stranger, 'http://testserver', 4403),
+            (None, 'http://testserver', 4403),
+            (self.reader, 'http://evil.example', 4404),
+        ):
+            socket, event = await self.connect(user, origin=origin)
+            self.assertEqual(event, {'type': 'websocket.close', 'code': code})
+            await socket.wait(5)
+        _, event = await self.connect(self.reader, room_id=self.room.id + 100)
+        self.assertEqual(event['code'], 4403)
+        self.assertNotIn(room_channel(self.room.id), get_broker()._subscriptions)
+
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        self.reader, self.seller, self.other = (User.objects.create_user(name) for name in ('reader', 'seller', 'other'))
+        self.room = ChatRoom.objects.room_for(self.reader.id, self.seller.id)
+        self.other_room = ChatRoom.objects.room_for(self.reader.id, self.other.id)
+
+    def assertCountersMatchMessages(self):
+        for user in User.objects.all():
+            actual = Message.objects.filter(
+                Q(room__user1=user) | Q(room__user2=user), is_read=False,
+            ).exclude(sender=user).count()
+            self.assertEqual(UnreadCounter.for_user(user.id), actual, user.username)
+
+    def say(self, room, sender, count=1):
+        return [Message.objects.create(room=room, sender=sender, text=f'Message {i}') for i in range(count)]
+
+    def test_deleting_messages_keeps_counters_exact(self):
+        unread = self.say(self.room, self.seller, 3)
+        self.say(self.room, self.reader, 2)
+        self.say(self.other_room, self.other, 2)
+        Message.objects.filter(pk=unread[0].pk).update(is_read=True)
+        UnreadCounter.add(self.reader.id, -1)
+        unread[0].refresh_from_db()
+        self.assertCountersMatchMessages()
+
+        unread[1].delete()
+        unread[0].delete()  # already read, so nothing to take back
+        self.assertEqual(UnreadCounter.for_user(self.reader.id), 3)
+        self.assertCountersMatchMessages()
+
+        Message.objects.filter(sender=self.reader).delete()
+        self.assertCountersMatchMessages()
+
+        self.room.delete()
+        self.assertEqual(UnreadCounter.for_user(self.reader.id), 2)
+        self.assertCountersMatchMessages()
+
+        self.say(self.other_room, self.reader, 2)
+        self.other.delete()
+        self.assertEqual(UnreadCounter.for_user(self.reader.id), 0)
+        self.assertCountersMatchMessages()
+
+
+class ChatHistoryTests(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('reader')
+        self.seller = User.objects.create_user('seller')
+        self.room = ChatRoom.objects.create(user1=self.reader, user2=self.seller)
+        Message.objects.bulk_create([
+            Message(room=self.room, sender=self.reader, text=f'Message {i}') for i in range(HISTORY_PAGE_SIZE * 2 + 10)
+        ])
+        # Half the history shares one timestamp, so paging has to fall back on the id
+        ids = list(self.room.message_set.order_by('id').values_list('id', flat=True))
+        Message.objects.filter(id__in=ids[:HISTORY_PAGE_SIZE]).update(created_at=timezone.now() - timedelta(hours=1))
+        Message.objects.filter(id__in=ids[HISTORY_PAGE_SIZE:]).update(created_at=timezone.now())
+        self.ids = ids
+        self.client.force_login(self.reader)
+
+    def test_room_opens_with_the_latest_page(self):
+        response = self.client.get(reverse('chat_room', args=[self.room.id]))
+        self.assertEqual(response.status_code, 200)
+        # Oldest first on screen, ending with the newest message
+        self.assertEqual([m.id for m in response.context['messages']], self.ids[-HISTORY_PAGE_SIZE:])
+        self.assertIsNotNone(response.context['older_cursor'])
+
+    def test_paging_back_through_history(self):
+        cursor = self.client.get(reverse('chat_room', args=[self.room.id])).context['older_cursor']
+        seen = []
+        while cursor:
+            response = self.client.get(reverse('room_messages', args=[self.room.id]), {'before': cursor})
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            self.assertLessEqual(len(body['messages']), HISTORY_PAGE_SIZE)
+            seen += [message['id'] for message in body['messages']]
+            cursor = body['next_cursor']
+
+        # Newest first, starting right below the opening page, down to the very first message
+        self.assertEqual(seen, self.ids[:-HISTORY_PAGE_SIZE][::-1])
+
+    def test_short_room_has_no_older_cursor(self):
+        room = ChatRoom.objects.create(user1=self.reader, user2=User.objects.create_user('buyer'))
+        Message.objects.create(room=room, sender=self.reader, text='Hi')
+        self.assertIsNone(self.client.get(reverse('chat_room', args=[room.id])).context['older_cursor'])
+        body = self.client.get(reverse('room_messages', args=[room.id])).json()
+        self.assertEqual([message['text'] for message in body['messages']], ['Hi'])
+        self.assertIsNone(body['next_cursor'])
+
+    def test_bad_cursor_and_outsiders_are_rejected(self):
+        url = reverse('room_messages', args=[self.room.id])
+        self.assertEqual(self.client.get(url, {'before': 'garbage'}).status_code, 400)
+
+        self.client.force_login(User.objects.create_user('stranger'))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn('messages', response.json())
+
+
+class ChatRoomPairTests(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('reader')
+        self.sellers = [User.objects.create_user(f'seller{i}') for i in range(3)]
+        self.cart = Cart.objects.create(user=self.reader)
+        self.client.force_login(self.reader)
+
+    def fill_cart(self, sellers):
+        for seller in sellers:
+            self.cart.items.add(Book.objects.create(owner=seller, title=f'By {seller}', price=50, location='Pune'))
+
+    def cart_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(reverse('cart_view')).status_code, 200)
+        return len(queries)
+
+    def test_cart_reuses_rooms_with_a_fixed_number_of_queries(self):
+        # A room from before canonical ordering, with the seller as user1
+        old_room = ChatRoom.objects.create(user1=self.sellers[0], user2=self.reader)
+        self.fill_cart(self.sellers[:1])
+        one_seller = self.cart_queries()
+
+        self.fill_cart(self.sellers[1:])
+        self.cart_queries()  # creates the two new rooms
+        self.assertEqual(self.cart_queries(), one_seller)
+        self.assertEqual(ChatRoom.objects.count(), 3)
+        self.assertEqual(ChatRoom.objects.room_for(self.reader.id, self.sellers[0].id), old_room)
+
+    def test_a_pair_can_only_have_one_room(self):
+        room = ChatRoom.objects.room_for(self.reader.id, self.sellers[0].id)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ChatRoom.objects.create(user1=self.sellers[0], user2=self.reader)
+
+        # What a request that lost the race sees: its insert is skipped and the winner's room returned
+        ChatRoom.objects.bulk_create([ChatRoom(user1=self.reader, user2=self.sellers[0])], ignore_conflicts=True)
+        self.assertEqual(ChatRoom.objects.rooms_with(self.sellers[0].id, [self.reader.id]), {self.reader.id: room})
+        self.assertEqual(ChatRoom.objects.count(), 1)
+
+
+class MergeDuplicateRoomsMigrationTests(TransactionTestCase):
+    before = [('chat', '0004_message_unread_index')]
+    after = [('chat', '0005_chat_room_pair_unique')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_duplicates_are_merged_into_the_oldest_room(self):
+        apps = self.migrate(self.before)
+        User = apps.get_model('auth', 'User')
+        OldRoom, OldMessage = apps.get_model('chat', 'ChatRoom'), apps.get_model('chat', 'Message')
+        reader, seller = User.objects.create(username='reader'), User.objects.create(username='seller')
+        oldest = OldRoom.objects.create(user1=reader, user2=seller)
+        OldMessage.objects.create(room=oldest, sender=reader, text='Hi')
+        for user1, user2 in ((seller, reader), (reader, seller)):
+            OldMessage.objects.create(room=OldRoom.objects.create(user1=user1, user2=user2), sender=seller, text='Hello')
+        other = OldRoom.objects.create(user1=seller, user2=User.objects.create(username='other'))
+
+        self.migrate(self.after)
+        self.assertEqual(sorted(ChatRoom.objects.values_list('id', flat=True)), [oldest.id, other.id])
+        self.assertEqual(Message.objects.filter(room_id=oldest.id).count(), 3)
@@ -4,6 +4,8 @@ from . import views
 urlpatterns = [
     path('', views.chat_list, name='chat_list'),
     path('room/<int:room_id>/', views.chat_room, name='chat_room'),
+    path('room/<int:room_id>/messages/', views.room_messages, name='room_messages'),
+    path('unread/stream/', views.unread_stream, name='unread_stream'),
     path('start/<str:username>/', views.start_chat, name='start_chat'),
     path('delete/<int:room_id>/', views.delete_chat, name='delete_chat'),
     path('start/<str:username>/', views.start_chat, name='start_chat'),
@@ -1,25 +1,35 @@
+import asyncio
+import json
+
 from django.shortcuts import render
 
 # Create your views here.
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from .models import ChatRoom, Message
-from django.db.models import Count, Q
-
-
-from django.db.models import Count, Q
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from .models import ChatRoom, Message, UnreadCounter
+from .pubsub import get_broker, user_channel
+from .realtime import serialize_message
+from bookbeeapp.pagination import keyset_paginate, InvalidCursor
+from bookbeeproject.db_router import replica_reads
+
+# Messages shown when a room opens, and per "load earlier" request
+HISTORY_PAGE_SIZE = 50
+MESSAGE_ORDERING = ('-created_at', '-id')
+
+# Seconds between keep-alive comments on a quiet unread stream, so proxies don't drop it
+UNREAD_KEEPALIVE = 25
 
 @login_required
+@replica_reads
 def chat_list(request):
-    rooms = ChatRoom.objects.filter(
-        Q(user1=request.user) | Q(user2=request.user)
-    ).annotate(
-        unread_count=Count(
-            'message',
-            filter=Q(message__is_read=False) & ~Q(message__sender=request.user)
-        )
-    )
+    rooms = list(ChatRoom.objects.inbox(request.user))
+    for room in rooms:
+        room.other = room.user2 if room.user1_id == request.user.id else room.user1
 
     return render(request, 'chat/chat_list.html', {'rooms': rooms})
 
@@ -36,18 +46,46 @@ def chat_room(request, room_id):
             text=request.POST.get('message')
         )
 
-    messages = room.message_set.order_by('created_at')
+    # Only the latest messages; older ones are fetched on demand from room_messages
+    page = keyset_paginate(room.message_set.all(), None, HISTORY_PAGE_SIZE, MESSAGE_ORDERING)
+    messages = list(reversed(page.items))
+
     # Mark messages sent to this user as read
-    messages.filter(is_read=False).exclude(sender=request.user).update(is_read=True)
+    marked = room.message_set.filter(is_read=False).exclude(sender=request.user).update(is_read=True)
+    UnreadCounter.add(request.user.id, -marked)
     other_user = room.user2 if room.user1 == request.user else room.user1
 
     return render(request, 'chat/chat_room.html', {
         'room': room,
         'messages': messages,
+        'older_cursor': page.next_cursor,
         'other_user': other_user
     })
 
 
+@login_required
+def room_messages(request, room_id):
+    """Older messages of a room, newest first, for the "load earlier messages" button."""
+    room = get_object_or_404(ChatRoom, id=room_id)
+    if request.user.id not in (room.user1_id, room.user2_id):
+        return JsonResponse({'error': 'Not a participant'}, status=403)
+
+    try:
+        page = keyset_paginate(
+            room.message_set.select_related('sender'),
+            request.GET.get('before'),
+            HISTORY_PAGE_SIZE,
+            MESSAGE_ORDERING,
+        )
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+
+    return JsonResponse({
+        'messages': [serialize_message(message) for message in page],
+        'next_cursor': page.next_cursor,
+    })
+
+
 @login_required
 def delete_chat(request, room_id):
     room = get_object_or_404(ChatRoom, id=room_id)
@@ -67,9 +105,52 @@ def start_chat(request, username):
     if other_user == request.user:
         return redirect('chat_list')
 
-    # Ensure consistent ordering so same room is reused
-    user1, user2 = sorted([request.user, other_user], key=lambda u: u.id)
-
-    room, created = ChatRoom.objects.get_or_create(user1=user1, user2=user2)
-
-    return redirect('chat_room', room_id=room.id)
\ No newline at end of file
+    # Reuses the existing room for this pair, whichever way round it was created
+    room = ChatRoom.objects.room_for(request.user.id, other_user.id)
+
+    return redirect('chat_room', room_id=room.id)
+
+
+def _unread_total(user_id):
+    close_old_connections()
+    return UnreadCounter.for_user(user_id)
+
+
+async def unread_stream(request):
+    """
+    Server-Sent Events feed of the user's unread total for the navbar badge
+    (base.html). Sends the total straight away, then again whenever
+    UnreadCounter.add() publishes a change, so open pages never poll.
+    """
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI every open stream would hold a worker thread for good.
+        # 204 tells EventSource to stop reconnecting; the badge just updates on page loads.
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=204)
+
+    async def events():
+        # Subscribe before reading the total so no change falls in between
+        subscription = get_broker().subscribe(user_channel(user.id))
+        try:
+            count = await sync_to_async(_unread_total)(user.id)
+            yield f'data: {json.dumps({"count": count})}\n\n'
+            while True:
+                try:
+                    payload = await asyncio.wait_for(subscription.get(), UNREAD_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                if payload['count'] != count:
+                    count = payload['count']
+                    yield f'data: {json.dumps({"count": count})}\n\n'
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response